@@ -3,15 +3,18 @@ Flask UI for collecting a user profile and running the personalized book pipelin
 """
 from __future__ import annotations
 
+import asyncio
 import os
 import json
 from pathlib import Path
-from uuid import uuid4
+from typing import AsyncIterator, Mapping
 
 from dotenv import load_dotenv
 from flask import (
     Flask,
     Response,
+    abort,
+    jsonify,
     redirect,
     render_template,
     request,
@@ -21,14 +24,11 @@ from flask import (
 )
 
 from questionnaire import UserProfile
-from pipeline import (
-    run_planning,
-    run_drafting,
-    run_editing,
-    refine_with_critique,
-)
-from html_pdf import html_text_to_pdf
-from artifact_utils import guess_book_title, make_pdf_path
+from jobs import enqueue_job, ensure_worker_pool, follow_events, get_job, requeue_job
+from checkpoints import SessionCheckpoint, new_session_id
+from pipeline import RESULT_STAGES, aiter_book_generation
+from tracing import SessionTrace
+from artifact_utils import save_artifacts
 
 load_dotenv()
 
@@ -52,38 +52,12 @@ DEFAULT_FORM_VALUES = {
 PROGRESS_STAGES = ["plan", "draft", "final_text", "critique", "artifacts"]
 
 
-def _write_text(path: Path, content: str) -> None:
-    path.write_text(content, encoding="utf-8")
-
-
-def save_artifacts(results: dict[str, str], prefix: str) -> dict[str, Path]:
-    """
-    Persist plan/draft/final/critique text files and a PDF of the final text.
-    Returns the mapping of artifact names to paths for download.
-    """
-    files = {
-        "plan": OUTPUT_DIR / f"{prefix}_plan.txt",
-        "draft": OUTPUT_DIR / f"{prefix}_draft_raw.txt",
-        "final_text": OUTPUT_DIR / f"{prefix}_book_final.txt",
-        "critique": OUTPUT_DIR / f"{prefix}_critique.txt",
-    }
-    for key, path in files.items():
-        _write_text(path, results[key])
-
-    title = guess_book_title(results.get("plan", ""), results.get("final_text", ""))
-    pdf_path = make_pdf_path(OUTPUT_DIR, title)
-    html_text_to_pdf(results["final_text"], str(pdf_path))
-
-    files["pdf"] = pdf_path
-    return files
-
-
 def _json_event(event_type: str, **payload: object) -> str:
     data = {"type": event_type, **payload}
     return json.dumps(data, ensure_ascii=False) + "\n"
 
 
-def _progress_percent(completed: int) -> int:
+def _progress_percent(completed: float) -> int:
     total = len(PROGRESS_STAGES)
     if total == 0:
         return 100
@@ -95,10 +69,8 @@ def index():
     return render_template("index.html", form_values=DEFAULT_FORM_VALUES)
 
 
-@app.post("/generate")
-def generate():
-    form = request.form
-    profile = UserProfile(
+def profile_from_form(form: Mapping[str, str]) -> UserProfile:
+    return UserProfile(
         age=int(form["age"]),
         preferred_theme=form["preferred_theme"],
         purpose_of_reading=form["purpose_of_reading"],
@@ -109,56 +81,104 @@ def generate():
         special_request=form.get("special_request", "").strip(),
     )
 
-    def event_stream():
-        completed = 0
-        try:
-            yield _json_event("progress", percent=0)
-            yield _json_event("status", message="Planning outline...")
-            plan = run_planning(profile)
-            yield _json_event("plan", content=plan)
-            completed += 1
-            yield _json_event("progress", percent=_progress_percent(completed))
-
-            yield _json_event("status", message="Drafting manuscript...")
-            draft = run_drafting(profile, plan)
-            yield _json_event("draft", content=draft)
-            completed += 1
-            yield _json_event("progress", percent=_progress_percent(completed))
-
-            yield _json_event("status", message="Editing for polish...")
-            edited_text = run_editing(profile, draft)
-
-            yield _json_event("status", message="Iterating with critique loop...")
-            final_text, critique = refine_with_critique(profile, edited_text)
-            yield _json_event("final_text", content=final_text)
-            completed += 1
-            yield _json_event("progress", percent=_progress_percent(completed))
-
-            yield _json_event("status", message="Summarizing critique insights...")
-            yield _json_event("critique", content=critique)
-            completed += 1
-            yield _json_event("progress", percent=_progress_percent(completed))
-
-            results = {
-                "plan": plan,
-                "draft": draft,
-                "final_text": final_text,
-                "critique": critique,
-            }
-
-            yield _json_event("status", message="Saving files...")
-            prefix = f"session_{uuid4().hex[:8]}"
-            artifact_paths = save_artifacts(results, prefix)
-            artifacts = {name: path.name for name, path in artifact_paths.items()}
-            yield _json_event("artifacts", files=artifacts)
-            completed += 1
-            yield _json_event("progress", percent=_progress_percent(completed))
-
-            yield _json_event("complete", profile=vars(profile))
-        except Exception as exc:
-            yield _json_event("error", message=str(exc))
-
-    return Response(stream_with_context(event_stream()), mimetype="text/plain")
+
+async def generate_events(
+    profile: UserProfile,
+    checkpoint: SessionCheckpoint | None = None,
+) -> AsyncIterator[str]:
+    """
+    Runs the full pipeline for one profile and yields NDJSON progress events.
+    Every stage is checkpointed under the session, so a rerun with the same
+    checkpoint resumes from the first unfinished stage.
+    Run by the job workers in jobs.py, which persist each event for /jobs/<id>/events.
+    Per-stage timings and token usage are appended to the trace file and sent
+    with the final "complete" event.
+    """
+    checkpoint = checkpoint or SessionCheckpoint(new_session_id(), profile)
+    trace = SessionTrace(checkpoint.session_id)
+    completed = 0
+    results: dict[str, str] = {}
+    try:
+        yield _json_event("progress", percent=0)
+        async for event in aiter_book_generation(profile, checkpoint, trace):
+            event_type = event.pop("type")
+            yield _json_event(event_type, **event)
+            if event_type in RESULT_STAGES:
+                results[event_type] = event["content"]
+                if event_type in PROGRESS_STAGES:
+                    completed += 1
+                    yield _json_event("progress", percent=_progress_percent(completed))
+            elif event_type == "chapter":
+                yield _json_event(
+                    "progress",
+                    percent=_progress_percent(completed + event["completed"] / event["total"]),
+                )
+
+        yield _json_event("status", message="Saving files...")
+        with trace.stage("pdf"):
+            artifact_paths = await asyncio.to_thread(save_artifacts, results, checkpoint.prefix, OUTPUT_DIR)
+        artifacts = {name: path.name for name, path in artifact_paths.items()}
+        yield _json_event("artifacts", files=artifacts)
+        completed += 1
+        yield _json_event("progress", percent=_progress_percent(completed))
+
+        yield _json_event(
+            "complete",
+            profile=vars(profile),
+            session_id=checkpoint.session_id,
+            trace={"stages": trace.to_list(), "totals": trace.totals()},
+        )
+    except Exception as exc:
+        yield _json_event("error", message=str(exc), session_id=checkpoint.session_id)
+    finally:
+        trace.write()
+
+
+@app.post("/generate")
+def generate():
+    """
+    Queues the book and streams its events. The job keeps running if the client
+    disconnects; reattach through /jobs/<job_id>/events.
+
+    Fallback for the plain Flask server: each open stream pins a request thread in
+    follow_events' poll loop. Under `uvicorn asgi_app:app` this route and
+    /jobs/<job_id>/events are served by asgi_app as coroutines instead.
+    """
+    profile = profile_from_form(request.form)
+    job_id = enqueue_job(profile)
+    ensure_worker_pool()
+    return Response(stream_with_context(follow_events(job_id)), mimetype="text/plain")
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+
+@app.post("/jobs/<job_id>/resume")
+def resume_job(job_id: str):
+    """
+    Puts a failed job back on the queue; it continues from its last checkpoint.
+    """
+    if not requeue_job(job_id):
+        abort(409)
+    ensure_worker_pool()
+    return jsonify(get_job(job_id))
+
+
+@app.get("/jobs/<job_id>/events")
+def job_events(job_id: str):
+    """
+    Replays events after ?after=<seq>, then follows live ones until the job ends.
+    Thread-per-stream fallback like /generate; asgi_app serves it without a thread.
+    """
+    if get_job(job_id) is None:
+        abort(404)
+    after = request.args.get("after", 0, type=int)
+    return Response(stream_with_context(follow_events(job_id, after)), mimetype="text/plain")
 
 
 @app.route("/download/<path:filename>")
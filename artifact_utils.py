@@ -6,6 +6,8 @@ import re
 from pathlib import Path
 from uuid import uuid4
 
+from html_pdf import html_text_to_pdf
+
 
 def _sanitize_filename(name: str, fallback: str = "book") -> str:
     cleaned = re.sub(r"[^A-Za-z0-9\-_]+", "_", name).strip("._ ")
@@ -60,3 +62,26 @@ def make_pdf_path(output_dir: Path, title: str) -> Path:
     if candidate.exists():
         candidate = output_dir / f"{base}_{uuid4().hex[:4]}.pdf"
     return candidate
+
+
+def save_artifacts(results: dict[str, str], prefix: str, output_dir: Path) -> dict[str, Path]:
+    """
+    Persist plan/draft/final/critique text files and a PDF of the final text.
+    Returns the mapping of artifact names to paths for download.
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    files = {
+        "plan": output_dir / f"{prefix}_plan.txt",
+        "draft": output_dir / f"{prefix}_draft_raw.txt",
+        "final_text": output_dir / f"{prefix}_book_final.txt",
+        "critique": output_dir / f"{prefix}_critique.txt",
+    }
+    for key, path in files.items():
+        path.write_text(results[key], encoding="utf-8")
+
+    title = guess_book_title(results.get("plan", ""), results.get("final_text", ""))
+    pdf_path = make_pdf_path(output_dir, title)
+    html_text_to_pdf(results["final_text"], str(pdf_path))
+
+    files["pdf"] = pdf_path
+    return files
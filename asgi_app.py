@@ -0,0 +1,47 @@
+"""
+ASGI entry point for holding many open event streams per process.
+
+Generation itself runs in the job workers (jobs.py). Here `/generate` and
+`/jobs/{job_id}/events` only follow a job's stored events, which is a cheap
+coroutine per client instead of a pinned thread; every other route is the
+regular Flask app mounted underneath.
+
+Run with: uvicorn asgi_app:app --port 5000
+"""
+from __future__ import annotations
+
+import asyncio
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import app as flask_app, profile_from_form
+from jobs import afollow_events, enqueue_job, ensure_worker_pool, get_job
+
+
+async def generate(request: Request) -> StreamingResponse:
+    form = await request.form()
+    profile = profile_from_form(form)
+    job_id = await asyncio.to_thread(enqueue_job, profile)
+    ensure_worker_pool()
+    return StreamingResponse(afollow_events(job_id), media_type="text/plain")
+
+
+async def job_events(request: Request):
+    job_id = request.path_params["job_id"]
+    if await asyncio.to_thread(get_job, job_id) is None:
+        return PlainTextResponse("Unknown job", status_code=404)
+    after = int(request.query_params.get("after", 0))
+    return StreamingResponse(afollow_events(job_id, after), media_type="text/plain")
+
+
+app = Starlette(
+    routes=[
+        Route("/generate", generate, methods=["POST"]),
+        Route("/jobs/{job_id}/events", job_events, methods=["GET"]),
+        Mount("/", app=WSGIMiddleware(flask_app)),
+    ]
+)
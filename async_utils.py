@@ -0,0 +1,68 @@
+"""Bridges between the asyncio pipeline and synchronous callers (Flask, CLI scripts)."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import AsyncIterator, Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# One event loop, running on a daemon thread for the life of the process, serves
+# every synchronous caller. Per-loop resources (the pooled async HTTP client in
+# llm_config.py) therefore stay warm across calls instead of being rebuilt, and
+# their kept-alive connections reused, on each asyncio.run().
+_bridge_loop: Optional[asyncio.AbstractEventLoop] = None
+_bridge_lock = threading.Lock()
+
+
+def _get_bridge_loop() -> asyncio.AbstractEventLoop:
+    global _bridge_loop
+    with _bridge_lock:
+        if _bridge_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-bridge", daemon=True).start()
+            _bridge_loop = loop
+        return _bridge_loop
+
+
+def run_sync(awaitable: Awaitable[T]) -> T:
+    """
+    Runs `awaitable` on the shared bridge loop and blocks until it finishes; the
+    synchronous stand-in for asyncio.run(). Context variables (e.g. the active
+    trace) are copied from the caller. Like asyncio.run(), it cannot be called
+    from a running event loop, and the coroutine must not block the loop, which
+    other callers share.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError("run_sync() cannot be called from a running event loop")
+
+    async def wrapper() -> T:
+        return await awaitable
+
+    future = asyncio.run_coroutine_threadsafe(wrapper(), _get_bridge_loop())
+    try:
+        return future.result()
+    except BaseException:
+        future.cancel()  # e.g. KeyboardInterrupt in the caller
+        raise
+
+
+def iterate_sync(agen: AsyncIterator[T]) -> Iterator[T]:
+    """
+    Drives an async generator from synchronous code on the shared bridge loop.
+    Closing the returned generator early also closes the async one.
+    """
+    try:
+        while True:
+            try:
+                yield run_sync(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        if hasattr(agen, "aclose"):
+            run_sync(agen.aclose())
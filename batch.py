@@ -0,0 +1,177 @@
+"""
+Batch book generation from a JSONL file of profiles.
+
+Each line is a JSON object with the UserProfile fields and an optional "id".
+Every item gets its own directory under the batch directory holding its
+checkpoints and artifacts, and `manifest.json` records per-item status and
+timings. Rerunning the same command resumes the batch: finished items are
+skipped and interrupted ones continue from their last checkpointed stage.
+
+Usage: python batch.py profiles.jsonl --out batches/cohort_a --concurrency 4
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from dataclasses import fields
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from questionnaire import UserProfile
+from checkpoints import SessionCheckpoint, _atomic_write
+from pipeline import generate_book_for_user_async
+from artifact_utils import _sanitize_filename, save_artifacts
+from tracing import SessionTrace
+from rag_store import warm_vectorstore
+from rag_cache import rag_cache_stats
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+_PROFILE_FIELDS = {f.name for f in fields(UserProfile)}
+
+
+def load_profiles(path: Path) -> List[Tuple[str, UserProfile]]:
+    """
+    Reads (item_id, profile) pairs; items without an "id" are numbered by line.
+    """
+    items: List[Tuple[str, UserProfile]] = []
+    seen = set()
+    with path.open(encoding="utf-8") as handle:
+        for line_no, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            item_id = _sanitize_filename(str(data.get("id") or f"item_{line_no:04d}"), f"item_{line_no:04d}")
+            if item_id in seen:
+                raise ValueError(f"{path}:{line_no}: duplicate item id '{item_id}'")
+            seen.add(item_id)
+            profile = UserProfile(**{key: value for key, value in data.items() if key in _PROFILE_FIELDS})
+            items.append((item_id, profile))
+    return items
+
+
+class BatchManifest:
+    """
+    Per-item status and timings, rewritten atomically after every change.
+    """
+
+    def __init__(self, path: Path, source: Path) -> None:
+        self.path = path
+        self.data: Dict[str, Any] = {"source": str(source), "items": {}}
+        if path.exists():
+            self.data = json.loads(path.read_text(encoding="utf-8"))
+        self._lock = asyncio.Lock()
+
+    def status(self, item_id: str) -> str:
+        return self.data["items"].get(item_id, {}).get("status", "pending")
+
+    def _write(self) -> None:
+        self.data["updated_at"] = time.time()
+        _atomic_write(self.path, json.dumps(self.data, ensure_ascii=False, indent=2))
+
+    async def update(self, item_id: str, **values: Any) -> None:
+        async with self._lock:
+            self.data["items"].setdefault(item_id, {}).update(values)
+            self._write()
+
+    async def record_run(self, items_run: int, duration_s: float) -> None:
+        async with self._lock:
+            self.data["last_run"] = {
+                "items_run": items_run,
+                "duration_s": round(duration_s, 2),
+                "counts": self.counts(),
+                "rag_cache": rag_cache_stats(),
+            }
+            self._write()
+
+    def counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for item in self.data["items"].values():
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return counts
+
+
+async def run_item(item_id: str, profile: UserProfile, out_dir: Path, manifest: BatchManifest) -> None:
+    item_dir = out_dir / item_id
+    checkpoint = SessionCheckpoint(item_id, profile, directory=item_dir)
+    trace = SessionTrace(f"{out_dir.name}/{item_id}")
+    attempts = manifest.data["items"].get(item_id, {}).get("attempts", 0) + 1
+    started = time.time()
+    await manifest.update(item_id, status="running", attempts=attempts, started_at=started, error=None)
+    try:
+        results = await generate_book_for_user_async(profile, checkpoint, trace)
+        with trace.stage("pdf"):
+            files = await asyncio.to_thread(save_artifacts, results, checkpoint.prefix, item_dir)
+    except Exception as exc:
+        await manifest.update(
+            item_id, status="failed", error=str(exc),
+            finished_at=time.time(), duration_s=round(time.time() - started, 2),
+        )
+        print(f"❌ {item_id}: {exc}")
+        return
+    finally:
+        trace.write()
+
+    await manifest.update(
+        item_id,
+        status="done",
+        finished_at=time.time(),
+        duration_s=round(time.time() - started, 2),
+        stages=trace.durations(),
+        totals=trace.totals(),
+        files={name: str(path.relative_to(out_dir)) for name, path in files.items()},
+    )
+    print(f"✅ {item_id} done in {time.time() - started:.1f}s")
+
+
+async def run_batch(source: Path, out_dir: Path, concurrency: int = BATCH_CONCURRENCY, retry_failed: bool = True) -> BatchManifest:
+    """
+    Runs every not-yet-finished item with at most `concurrency` books in flight.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = BatchManifest(out_dir / "manifest.json", source)
+    items = load_profiles(source)
+
+    pending = []
+    for item_id, profile in items:
+        status = manifest.status(item_id)
+        if status == "done" or (status == "failed" and not retry_failed):
+            continue
+        if status == "pending":
+            await manifest.update(item_id, status="queued", attempts=0)
+        pending.append((item_id, profile))
+
+    print(f"📚 {len(items)} items, {len(items) - len(pending)} already finished, running {len(pending)} (concurrency={concurrency})")
+    limit = asyncio.Semaphore(max(1, concurrency))
+    batch_started = time.time()
+
+    async def bounded(item_id: str, profile: UserProfile) -> None:
+        async with limit:
+            await run_item(item_id, profile, out_dir, manifest)
+
+    await asyncio.gather(*(bounded(item_id, profile) for item_id, profile in pending))
+
+    await manifest.record_run(len(pending), time.time() - batch_started)
+    return manifest
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Generate books for every profile in a JSONL file.")
+    cli.add_argument("profiles", type=Path, help="JSONL file, one profile object per line")
+    cli.add_argument("--out", type=Path, help="batch directory (default: batches/<file stem>)")
+    cli.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    cli.add_argument("--skip-failed", action="store_true", help="do not retry items that failed in a previous run")
+    args = cli.parse_args()
+
+    out = args.out or Path("batches") / args.profiles.stem
+    warm_vectorstore()
+    result = asyncio.run(run_batch(args.profiles, out, args.concurrency, retry_failed=not args.skip_failed))
+    last_run = result.data["last_run"]
+    print(f"Batch finished in {last_run['duration_s']}s: {last_run['counts']} (manifest: {result.path})")
@@ -0,0 +1,226 @@
+"""
+Pipeline microbenchmarks on the offline fake backends (fake_llm.py).
+
+For each book length it runs generate_book_for_user a few times and records the
+wall time of every stage (from the stage trace) and of the whole book, then
+times RAG retrieval against a local vector store built from fake books. It also
+counts how many new connections the pooled async client opens over repeated sync
+calls (against a local keep-alive server, since the fake backends make none).
+Results are saved to benchmarks/results/<timestamp>_<commit>.json; pass
+--compare <older result> to print the change per measurement.
+
+Usage: python benchmark.py --pages 2,10,30 --runs 3 [--compare benchmarks/results/x.json]
+Point MAIN_MODEL / EMBEDDING_MODEL at real models to benchmark against the API instead.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List
+
+# Offline, uncached, untraced defaults; must be set before the pipeline modules load.
+os.environ.setdefault("MAIN_MODEL", "fake:latency=0.05,tps=2000")
+os.environ.setdefault("EMBEDDING_MODEL", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("PLAN_CACHE_ENABLED", "0")
+os.environ.setdefault("RAG_CACHE_ENABLED", "0")
+os.environ.setdefault("TRACING_ENABLED", "0")
+os.environ.setdefault("VECTOR_DB_DIR", "benchmarks/vector_db")
+
+from questionnaire import UserProfile
+from async_utils import run_sync
+from fake_llm import fake_book_text
+from llm_config import EMBEDDING_MODEL, MAIN_MODEL, VECTOR_DB_DIR, get_async_http_client, http_pool_stats
+from pipeline import generate_book_for_user, get_rag_context
+from rag_cache import RAG_CACHE_ENABLED, query_embeddings, rag_cache_stats, retrieval_results
+from tracing import SessionTrace, _stage_key
+
+RESULTS_DIR = Path("benchmarks/results")
+RAG_BOOKS = 6
+RAG_BOOK_CHARS = 60_000
+RAG_QUERIES = 20
+POOL_CALLS = 20
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "mean_s": round(statistics.fmean(ordered), 4),
+        "p50_s": round(statistics.median(ordered), 4),
+        "max_s": round(ordered[-1], 4),
+    }
+
+
+def _profile(pages: int) -> UserProfile:
+    return UserProfile(
+        age=25,
+        education_level="Master's in Computer Science",
+        preferred_theme="novel",
+        purpose_of_reading="self motivation and personal growth",
+        mood_today="curious and reflective",
+        favorite_author="Ernest Hemingway",
+        length_in_pages=pages,
+        special_request="I prefer a modern voice with vivid imagery.",
+    )
+
+
+def bench_generation(pages: int, runs: int) -> Dict[str, Any]:
+    stages: Dict[str, List[float]] = {}
+    totals: List[float] = []
+    for run in range(runs):
+        profile = _profile(pages)
+        # A different request per run keeps the fake outputs (and any cache) from repeating.
+        profile.special_request += f" (run {run})"
+        trace = SessionTrace(f"bench-{pages}-{run}")
+        started = time.perf_counter()
+        generate_book_for_user(profile, None, trace)
+        totals.append(time.perf_counter() - started)
+        for record in trace.records:
+            stages.setdefault(_stage_key(vars(record)), []).append(record.duration_s)
+    return {
+        "generate_book_for_user": _summary(totals),
+        "stages": {name: _summary(samples) for name, samples in stages.items()},
+    }
+
+
+def ensure_rag_store() -> None:
+    if Path(VECTOR_DB_DIR).exists():
+        return
+    from rag_store import build_vectorstore_from_texts
+
+    books = {f"Benchmark Book {n}": fake_book_text(f"Benchmark Book {n}", RAG_BOOK_CHARS) for n in range(RAG_BOOKS)}
+    build_vectorstore_from_texts(books)
+
+
+def bench_rag(pages: int) -> Dict[str, Dict[str, float]]:
+    """
+    Cold retrieval latency, plus (when RAG_CACHE_ENABLED=1) a second pass over the
+    same queries reported separately as "rag_retrieval_cached".
+    """
+    # Every page count sends the same queries; start cold so earlier runs cannot turn them into hits.
+    query_embeddings.clear()
+    retrieval_results.clear()
+    profile = _profile(pages)
+    passes = {"rag_retrieval": []}
+    if RAG_CACHE_ENABLED:
+        passes["rag_retrieval_cached"] = []
+    for samples in passes.values():
+        for query in range(RAG_QUERIES):
+            started = time.perf_counter()
+            get_rag_context(profile, extra_query=f"chapter {query} style inspiration", k=5)
+            samples.append(time.perf_counter() - started)
+    return {name: _summary(samples) for name, samples in passes.items()}
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def bench_connection_reuse(calls: int = POOL_CALLS) -> Dict[str, Any]:
+    """
+    New connections opened by `calls` sync calls that each send one request: on
+    the shared bridge loop (run_sync, as the pipeline's sync wrappers do) and with
+    a fresh loop per call (asyncio.run), which starts with an empty pool every time.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    async def call() -> None:
+        response = await get_async_http_client().get(url)
+        response.raise_for_status()
+
+    result: Dict[str, Any] = {"calls": calls}
+    try:
+        for name, runner in (("bridge_loop", run_sync), ("loop_per_call", asyncio.run)):
+            before = http_pool_stats()["new_connections"]
+            for _ in range(calls):
+                runner(call())
+            opened = http_pool_stats()["new_connections"] - before
+            result[name] = {"new_connections": opened, "reuse_rate": round(1 - opened / calls, 4)}
+    finally:
+        server.shutdown()
+        server.server_close()
+    return result
+
+
+def compare(current: Dict[str, Any], previous: Dict[str, Any]) -> None:
+    print(f"\nChange vs {previous['commit']} ({previous['timestamp']}), p50:")
+    for pages, result in current["results"].items():
+        before = previous["results"].get(pages)
+        if not before:
+            continue
+        rows = [("generate_book_for_user", result["generate_book_for_user"], before["generate_book_for_user"])]
+        rows += [(name, result[name], before.get(name)) for name in ("rag_retrieval", "rag_retrieval_cached") if name in result]
+        rows += [(name, stats, before["stages"].get(name)) for name, stats in result["stages"].items()]
+        for name, now, then in rows:
+            if not then:
+                continue
+            delta = (now["p50_s"] - then["p50_s"]) / then["p50_s"] * 100 if then["p50_s"] else 0.0
+            print(f"  {pages:>3}p {name:<24}{then['p50_s']:>9.3f}s -> {now['p50_s']:>8.3f}s  {delta:+6.1f}%")
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Benchmark pipeline stages on the fake backends.")
+    cli.add_argument("--pages", default="2,10,30", help="comma-separated book lengths")
+    cli.add_argument("--runs", type=int, default=3)
+    cli.add_argument("--compare", type=Path, help="earlier result file to compare against")
+    cli.add_argument("--out", type=Path, default=RESULTS_DIR)
+    args = cli.parse_args()
+
+    ensure_rag_store()
+    result: Dict[str, Any] = {
+        "commit": _commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"main_model": MAIN_MODEL, "embedding_model": EMBEDDING_MODEL, "runs": args.runs, "rag_cache": RAG_CACHE_ENABLED},
+        "results": {},
+    }
+    for pages in [int(p) for p in args.pages.split(",") if p.strip()]:
+        print(f"⏱️  {pages} pages x {args.runs} runs...")
+        entry = bench_generation(pages, args.runs)
+        entry.update(bench_rag(pages))
+        result["results"][str(pages)] = entry
+        cached = f" (cached {entry['rag_retrieval_cached']['p50_s'] * 1000:.1f}ms)" if "rag_retrieval_cached" in entry else ""
+        print(f"   book p50 {entry['generate_book_for_user']['p50_s']:.2f}s, "
+              f"rag p50 {entry['rag_retrieval']['p50_s'] * 1000:.1f}ms{cached}, "
+              + ", ".join(f"{name} {stats['p50_s']:.2f}s" for name, stats in entry["stages"].items()))
+
+    result["connection_reuse"] = bench_connection_reuse()
+    reuse = result["connection_reuse"]
+    print(f"🔌 {reuse['calls']} sync calls opened {reuse['bridge_loop']['new_connections']} connections on the bridge loop, "
+          f"{reuse['loop_per_call']['new_connections']} with a loop per call")
+    result["rag_cache"] = rag_cache_stats()
+    args.out.mkdir(parents=True, exist_ok=True)
+    path = args.out / f"{time.strftime('%Y%m%d-%H%M%S')}_{result['commit']}.json"
+    path.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"📝 Saved {path}")
+
+    if args.compare:
+        compare(result, json.loads(args.compare.read_text(encoding="utf-8")))
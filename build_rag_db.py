@@ -1,35 +1,69 @@
 """
 Utility script that pulls books from the Project Gutenberg RapidAPI and
 persists them into the Chroma vector store.
+
+python build_rag_db.py                 # books from GUTENBERG_BOOK_IDS via the API
+python build_rag_db.py books/*.txt     # local text files instead, no API key needed
 """
 from __future__ import annotations
 
 import os
-from typing import Iterable
+import sys
+from pathlib import Path
+from typing import Iterable, Iterator
 
 from dotenv import load_dotenv
 
+from corpus_cleaning import gutenberg_title
+from fetchbooktitles import age_band_of, shelf_of
 from gutenberg_api import GutenbergAPIError, fetch_book_text
 from rag_store import build_vectorstore_from_texts
 
 DEFAULT_BOOK_IDS = ["1342", "1661", "98"]  
 
 
-def load_books_from_api(book_ids: Iterable[str]) -> dict[str, str]:
+def iter_books_from_api(book_ids: Iterable[str], book_tags: dict[str, dict[str, str]] | None = None) -> Iterator[tuple[str, str]]:
     """
-    Fetches a list of book IDs from the RapidAPI endpoint and returns {title: text}.
+    Fetches book IDs from the RapidAPI endpoint one at a time, yielding (title, text),
+    so only the books currently being processed are held in memory.
+    When `book_tags` is given it is filled with each title's shelf and age band
+    before the book is yielded.
     """
-    book_texts: dict[str, str] = {}
+    fetched = 0
     for book_id in book_ids:
         if not book_id:
             continue
         print(f"📚 Fetching book {book_id} ...")
         title, text = fetch_book_text(book_id)
-        book_texts[title] = text
+        if book_tags is not None:
+            shelf = shelf_of(book_id)
+            book_tags[title] = {"shelf": shelf, "age_band": age_band_of(shelf)}
         print(f"   ↳ Loaded '{title}' ({len(text)} chars)")
-    if not book_texts:
+        fetched += 1
+        yield title, text
+    if not fetched:
+        # Raised before the build prunes anything, so a bad key cannot empty the store.
         raise GutenbergAPIError("No books were fetched; check your book IDs and API credentials.")
-    return book_texts
+
+
+def iter_books_from_files(paths: Iterable[str]) -> Iterator[tuple[str, str]]:
+    """
+    Reads local text files one at a time, yielding (title, text); the title comes
+    from a Gutenberg "Title:" header line, else the file name.
+    """
+    for path in map(Path, paths):
+        text = path.read_text(encoding="utf-8", errors="replace")
+        title = gutenberg_title(text) or path.stem
+        print(f"📄 Read '{title}' from {path} ({len(text)} chars)")
+        yield title, text
+
+
+def load_books_from_api(book_ids: Iterable[str], book_tags: dict[str, dict[str, str]] | None = None) -> dict[str, str]:
+    """
+    Fetches a list of book IDs from the RapidAPI endpoint and returns {title: text}.
+    When `book_tags` is given it is filled with each title's shelf and age band.
+    """
+    return dict(iter_books_from_api(book_ids, book_tags))
 
 
 def _resolve_book_ids() -> list[str]:
@@ -44,6 +78,9 @@ def _resolve_book_ids() -> list[str]:
 
 if __name__ == "__main__":
     load_dotenv()
-    ids = _resolve_book_ids()
-    books = load_books_from_api(ids)
-    build_vectorstore_from_texts(books)
+    if len(sys.argv) > 1:
+        build_vectorstore_from_texts(iter_books_from_files(sys.argv[1:]))
+    else:
+        ids = _resolve_book_ids()
+        tags: dict[str, dict[str, str]] = {}
+        build_vectorstore_from_texts(iter_books_from_api(ids, tags), book_tags=tags)
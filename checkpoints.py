@@ -0,0 +1,131 @@
+"""
+Per-session checkpoints so a failed generation can resume from its last finished stage.
+
+Stage results are written next to the regular artifacts as
+`<dir>/session_<id>_<stage file>` and `session_<id>_state.json` records the
+profile plus which stages (and which chapters / critique rounds) are complete.
+"""
+from __future__ import annotations
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from uuid import uuid4
+
+from questionnaire import UserProfile
+
+CHECKPOINT_DIR = Path(os.getenv("OUTPUT_DIR", "outputs"))
+
+# Same file names save_artifacts uses, so a checkpointed session's stage files are
+# its downloadable artifacts rather than copies. Only sessions with a state file
+# can resume; outputs saved without one (before checkpoints existed) cannot.
+STAGE_FILES = {
+    "plan": "plan.txt",
+    "draft": "draft_raw.txt",
+    "edited": "edited.txt",
+    "final_text": "book_final.txt",
+    "critique": "critique.txt",
+}
+
+
+def _atomic_write(path: Path, content: str) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(content, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def new_session_id() -> str:
+    return uuid4().hex[:8]
+
+
+class SessionCheckpoint:
+    """
+    Reads and writes the checkpoint files of one generation session.
+    `guard`, if given, runs before every write and may raise to refuse it (the job
+    queue uses it so a worker whose job was requeued stops overwriting the session).
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        profile: Optional[UserProfile] = None,
+        directory: Optional[Path] = None,
+        guard: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.session_id = session_id
+        self.guard = guard
+        self.directory = Path(directory or CHECKPOINT_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.state: Dict[str, Any] = {"completed": [], "chapters": {}, "refine": None}
+        if self.state_path.exists():
+            self.state.update(json.loads(self.state_path.read_text(encoding="utf-8")))
+        if profile is not None:
+            self.state["profile"] = vars(profile)
+            self._write_state()
+
+    @classmethod
+    def load(cls, session_id: str, directory: Optional[Path] = None) -> "SessionCheckpoint":
+        """
+        Opens an existing session; raises FileNotFoundError if it was never checkpointed.
+        """
+        checkpoint = cls(session_id, directory=directory)
+        if "profile" not in checkpoint.state:
+            raise FileNotFoundError(f"No checkpoint found for session '{session_id}' in {checkpoint.directory}")
+        return checkpoint
+
+    @property
+    def prefix(self) -> str:
+        return f"session_{self.session_id}"
+
+    @property
+    def state_path(self) -> Path:
+        return self.directory / f"{self.prefix}_state.json"
+
+    @property
+    def profile(self) -> UserProfile:
+        return UserProfile(**self.state["profile"])
+
+    def _check_guard(self) -> None:
+        if self.guard is not None:
+            self.guard()
+
+    def _write_state(self) -> None:
+        self._check_guard()
+        self.state["updated_at"] = time.time()
+        _atomic_write(self.state_path, json.dumps(self.state, ensure_ascii=False, indent=2))
+
+    def stage_path(self, stage: str) -> Path:
+        return self.directory / f"{self.prefix}_{STAGE_FILES[stage]}"
+
+    def has(self, stage: str) -> bool:
+        return stage in self.state["completed"] and self.stage_path(stage).exists()
+
+    def get(self, stage: str) -> str:
+        return self.stage_path(stage).read_text(encoding="utf-8")
+
+    def save(self, stage: str, content: str) -> None:
+        self._check_guard()
+        _atomic_write(self.stage_path(stage), content)
+        if stage not in self.state["completed"]:
+            self.state["completed"].append(stage)
+        self._write_state()
+
+    # Chapter drafts are kept individually so drafting resumes with the missing chapters only.
+
+    def chapters(self) -> Dict[int, str]:
+        return {int(index): text for index, text in self.state["chapters"].items()}
+
+    def save_chapter(self, index: int, text: str) -> None:
+        self.state["chapters"][str(index)] = text
+        self._write_state()
+
+    # Critique loop progress: text after the last finished round plus its reports.
+
+    def refine_progress(self) -> Optional[Dict[str, Any]]:
+        return self.state.get("refine")
+
+    def save_refine_round(self, next_round: int, text: str, reports: List[str]) -> None:
+        self.state["refine"] = {"next_round": next_round, "text": text, "reports": reports}
+        self._write_state()
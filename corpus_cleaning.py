@@ -0,0 +1,232 @@
+"""
+Cleans book texts before they are chunked and embedded.
+
+  strip_gutenberg_boilerplate  drops the Project Gutenberg license header and
+                               footer, producer credits, [Illustration] tags and
+                               the table of contents, deterministically.
+  NearDuplicateIndex           MinHash signatures over word shingles, bucketed
+                               with LSH, so a chunk whose estimated Jaccard
+                               similarity to an already kept chunk reaches
+                               RAG_DEDUP_THRESHOLD (e.g. the same passage from
+                               another edition) is dropped instead of embedded.
+
+Runs offline on local text files and reports what would be saved:
+python corpus_cleaning.py books/*.txt
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import re
+import zlib
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 100
+RAG_STRIP_BOILERPLATE = os.getenv("RAG_STRIP_BOILERPLATE", "1") == "1"
+RAG_DEDUP = os.getenv("RAG_DEDUP", "1") == "1"
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+NUM_PERM = 128
+LSH_BANDS = 16  # 8 rows per band: pairs above ~0.7 Jaccard usually share a bucket, then get checked exactly
+SHINGLE_WORDS = 5
+CHARS_PER_TOKEN = 4  # rough English average, for reporting savings without a tokenizer
+TOC_MAX_LINES = 400
+
+_START = re.compile(r"^.*\*{3}\s*START OF (?:THE |THIS )?PROJECT GUTENBERG E-?BOOK.*$", re.I | re.M)
+_OLD_START = re.compile(r"^.*\*END\*THE SMALL PRINT!.*$", re.I | re.M)
+_END = re.compile(r"^.*\*{3}\s*END OF (?:THE |THIS )?PROJECT GUTENBERG E-?BOOK.*$", re.I | re.M)
+_OLD_END = re.compile(r"^\s*End of (?:the )?Project Gutenberg'?s?\b.*$", re.I | re.M)
+_CREDITS = re.compile(r"^\s*(?:produced by|e-?text prepared by|this e-?(?:book|text) was produced|transcriber'?s note)", re.I)
+_ILLUSTRATION = re.compile(r"\[Illustration[^\]]*\]", re.I)
+_CONTENTS = re.compile(r"^\s*(?:table of )?contents\.?\s*$", re.I)
+_TITLE = re.compile(r"^\s*Title:\s*(.+?)\s*$", re.I | re.M)
+_WORD = re.compile(r"[a-z0-9']+")
+
+_PRIME = 4294967291  # largest prime below 2**32: permuted hashes fit uint32 and a * x + b fits uint64
+_rng = np.random.default_rng(20240601)
+_PERM_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.uint64)
+
+
+def gutenberg_title(text: str) -> Optional[str]:
+    """
+    The "Title:" line of a Gutenberg header, if there is one.
+    """
+    match = _TITLE.search(text[:5000])
+    return match.group(1) if match else None
+
+
+def _normalize_heading(line: str) -> str:
+    line = re.sub(r"[\s.]*\d+\s*$", "", line)  # trailing page numbers / dot leaders
+    return " ".join(_WORD.findall(line.lower()))
+
+
+def _strip_contents(text: str) -> str:
+    """
+    Removes a table of contents: from a "Contents" heading up to where its first
+    entry reappears as a heading in the body. Left alone when that point is not
+    found nearby or the span does not look like a list of short entries.
+    """
+    lines = text.split("\n")
+    head = next((i for i, line in enumerate(lines[: max(200, len(lines) // 5)]) if _CONTENTS.match(line)), None)
+    if head is None:
+        return text
+    first = next((i for i in range(head + 1, min(len(lines), head + 20)) if lines[i].strip()), None)
+    if first is None:
+        return text
+    entry = _normalize_heading(lines[first])
+    for i in range(first + 1, min(len(lines), first + TOC_MAX_LINES)):
+        heading = _normalize_heading(lines[i])
+        if heading and (heading == entry or entry.startswith(heading + " ")):
+            listed = [line for line in lines[head:i] if line.strip()]
+            if sum(len(line.strip()) for line in listed) / len(listed) < 80:
+                return "\n".join(lines[:head] + lines[i:])
+            break
+    return text
+
+
+def strip_gutenberg_boilerplate(text: str) -> str:
+    """
+    The book text without Project Gutenberg license text, producer credits,
+    illustration tags or table of contents. Texts without the markers pass
+    through with only the latter three removed.
+    """
+    start = _START.search(text) or _OLD_START.search(text)
+    begin = start.end() if start else 0
+    end = _END.search(text, begin) or _OLD_END.search(text, begin)
+    body = text[begin:end.start() if end else len(text)]
+
+    paragraphs = re.split(r"\n\s*\n", body.strip())
+    while paragraphs and _CREDITS.match(paragraphs[0]):
+        paragraphs.pop(0)
+    body = _ILLUSTRATION.sub("", "\n\n".join(paragraphs))
+    body = _strip_contents(body)
+    return re.sub(r"\n\s*\n(?:\s*\n)+", "\n\n", body).strip()
+
+
+def minhash(text: str) -> Optional[np.ndarray]:
+    """
+    NUM_PERM-value MinHash signature of the text's word SHINGLE_WORDS-grams, or
+    None for text without words.
+    """
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    width = min(SHINGLE_WORDS, len(words))
+    shingles = {" ".join(words[i:i + width]) for i in range(len(words) - width + 1)}
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (_PERM_A[:, None] * hashes[None, :] + _PERM_B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    LSH over MinHash signatures; `add_if_new` keeps the first of each group of
+    near-duplicates.
+    """
+
+    def __init__(self, threshold: float = RAG_DEDUP_THRESHOLD, bands: int = LSH_BANDS) -> None:
+        self.threshold = threshold
+        self.rows = NUM_PERM // bands
+        self.buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self.signatures: List[np.ndarray] = []
+
+    def _keys(self, signature: np.ndarray) -> List[int]:
+        return [hash(signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(len(self.buckets))]
+
+    def find(self, signature: np.ndarray) -> Optional[int]:
+        """
+        Index of a kept signature at or above the threshold, if any.
+        """
+        checked = set()
+        for buckets, key in zip(self.buckets, self._keys(signature)):
+            for candidate in buckets.get(key, ()):
+                if candidate not in checked:
+                    checked.add(candidate)
+                    if float(np.mean(self.signatures[candidate] == signature)) >= self.threshold:
+                        return candidate
+        return None
+
+    def add(self, signature: np.ndarray) -> None:
+        position = len(self.signatures)
+        self.signatures.append(signature)
+        for buckets, key in zip(self.buckets, self._keys(signature)):
+            buckets.setdefault(key, []).append(position)
+
+    def add_if_new(self, signature: Optional[np.ndarray]) -> bool:
+        """
+        True (and remembered) unless the signature near-duplicates one already kept.
+        """
+        if signature is None:
+            return True
+        if self.find(signature) is not None:
+            return False
+        self.add(signature)
+        return True
+
+
+@dataclass
+class PreparedBook:
+    title: str
+    chunks: List[str]
+    signatures: List[Optional[np.ndarray]] = field(default_factory=list)
+    stripped_chars: int = 0
+
+
+_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def prepare_book(title: str, text: str) -> PreparedBook:
+    """
+    Strips boilerplate (RAG_STRIP_BOILERPLATE), splits into chunks and signs each
+    chunk for deduplication (RAG_DEDUP). CPU-bound; the build runs it in a process pool.
+    """
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    cleaned = strip_gutenberg_boilerplate(text) if RAG_STRIP_BOILERPLATE else text
+    chunks = _splitter.split_text(cleaned)
+    signatures = [minhash(chunk) for chunk in chunks] if RAG_DEDUP else [None] * len(chunks)
+    return PreparedBook(title, chunks, signatures, len(text) - len(cleaned))
+
+
+def estimate_tokens(chars: int) -> int:
+    return chars // CHARS_PER_TOKEN
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Report boilerplate and near-duplicate chunks in local book files.")
+    cli.add_argument("files", nargs="+", type=Path)
+    cli.add_argument("--threshold", type=float, default=RAG_DEDUP_THRESHOLD)
+    args = cli.parse_args()
+
+    index = NearDuplicateIndex(args.threshold)
+    raw_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    totals = {"raw": 0, "raw_chars": 0, "stripped": 0, "duplicates": 0, "kept": 0, "kept_chars": 0}
+    for path in args.files:
+        text = path.read_text(encoding="utf-8", errors="replace")
+        book = prepare_book(gutenberg_title(text) or path.stem, text)
+        raw = raw_splitter.split_text(text)
+        kept = [
+            chunk for chunk, signature in zip(book.chunks, book.signatures)
+            if index.add_if_new(minhash(chunk) if signature is None else signature)
+        ]
+        totals["raw"] += len(raw)
+        totals["raw_chars"] += sum(len(chunk) for chunk in raw)
+        totals["stripped"] += len(raw) - len(book.chunks)
+        totals["duplicates"] += len(book.chunks) - len(kept)
+        totals["kept"] += len(kept)
+        totals["kept_chars"] += sum(len(chunk) for chunk in kept)
+        print(f"📖 {book.title}: {len(raw)} chunks, {len(book.chunks)} after stripping {book.stripped_chars} boilerplate chars, {len(kept)} unique")
+    saved = totals["raw"] - totals["kept"]
+    print(
+        f"✅ {len(args.files)} files: {totals['raw']} -> {totals['kept']} chunks, {saved} saved "
+        f"({totals['stripped']} boilerplate, {totals['duplicates']} near-duplicates, {saved / max(totals['raw'], 1):.1%}); "
+        f"≈{estimate_tokens(totals['raw_chars'] - totals['kept_chars'])} of ≈{estimate_tokens(totals['raw_chars'])} "
+        f"embedding tokens saved ({CHARS_PER_TOKEN} chars/token)"
+    )
@@ -0,0 +1,267 @@
+"""
+Offline stand-ins for the chat and embedding models.
+
+Selected with MAIN_MODEL=fake (or "fake:latency=0.5,tps=80") and
+EMBEDDING_MODEL=fake (or "fake:dim=256"). Outputs are deterministic for a given
+prompt and shaped like the real ones: plans with a chapter outline sized to the
+requested pages, chapters of roughly the requested word count, edits and
+rewrites that return the text they were given, and valid critique JSON. Latency
+is a time-to-first-token plus a steady token rate, so the pipeline can be
+benchmarked and exercised without an API key.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORDS = (
+    "light river memory quiet engine window morning letter harbor lantern silence "
+    "promise garden stone thread season voice distance courage winter orchard map "
+    "shadow bridge question evening ember patience compass horizon echo harvest "
+    "walked remembered carried noticed listened opened waited gathered followed "
+    "slowly softly carefully again almost always never still perhaps together"
+).split()
+_BLOCK = re.compile(r"---- (\w+) START ----\n(.*?)\n\s*---- \1 END ----", re.S)
+_WORD_TARGET = re.compile(r"roughly (\d+) words")
+_PAGES = re.compile(r"Desired length \(pages\): (\d+)")
+_CHAPTER = re.compile(r'Draft ONLY chapter/section (\d+) of (\d+): "([^"]*)"')
+_ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII", "IX", "X", "XI", "XII"]
+
+
+def parse_options(spec: str) -> Dict[str, str]:
+    """
+    "fake:latency=0.5,tps=80" -> {"latency": "0.5", "tps": "80"}
+    """
+    _, _, options = spec.partition(":")
+    return dict(item.split("=", 1) for item in options.split(",") if "=" in item)
+
+
+def _rng(text: str) -> random.Random:
+    return random.Random(hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+
+def _sentence(rng: random.Random) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def _prose(rng: random.Random, word_count: int) -> str:
+    paragraphs, words = [], 0
+    while words < word_count:
+        paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+        paragraphs.append(paragraph)
+        words += len(paragraph.split())
+    return "\n\n".join(paragraphs)
+
+
+def _plan(rng: random.Random, pages: int) -> str:
+    chapters = max(3, min(12, pages))
+    title = " ".join(rng.choice(_WORDS) for _ in range(3)).title()
+    lines = [
+        f"Working title: The {title}",
+        f"Subtitle: A book about {rng.choice(_WORDS)} and {rng.choice(_WORDS)}",
+        "",
+        "Tone and style:",
+        "- lyrical reportage",
+        "- compressed argumentation",
+        "",
+        "Hook: " + _sentence(rng),
+        "",
+        "Outline:",
+    ]
+    for number in range(1, chapters + 1):
+        lines.append(f"Chapter {number}: The {rng.choice(_WORDS).title()} {rng.choice(_WORDS).title()}")
+        lines.append(f"- {_sentence(rng)} {_sentence(rng)}")
+        lines.append(f"- Reader response: {rng.choice(_WORDS)}, {rng.choice(_WORDS)}")
+    lines += ["", "Motifs: " + ", ".join(rng.choice(_WORDS) for _ in range(3)), "Main idea: " + _sentence(rng)]
+    return "\n".join(lines)
+
+
+def _critique(rng: random.Random, text: str) -> str:
+    sentences = [s for s in re.split(r"(?<=[.!?])\s+", text) if len(s.split()) >= 6]
+    evidence = [f'"{rng.choice(sentences)}"' for _ in range(2)] if sentences else ["none"]
+    return json.dumps({
+        "summary": _sentence(rng),
+        "strengths": ["Consistent voice", "Clear structure"],
+        "weaknesses": ["Pacing drags in the middle", "Some imagery repeats"],
+        "alignment": ["Tone suits the reader profile"],
+        "prose_craft": ["Sentence rhythm is varied"],
+        "motif_or_concept_usage": ["Motifs recur at chapter ends"],
+        "actions": ["Tighten the middle section", "Vary the imagery"],
+        "quality_score": round(rng.uniform(7.0, 9.0), 1),
+        "evidence_snippets": evidence,
+    })
+
+
+def fake_response(prompt: str) -> str:
+    """
+    Deterministic output for a rendered pipeline prompt.
+    """
+    rng = _rng(prompt)
+    blocks = {name: body for name, body in _BLOCK.findall(prompt)}
+    if "quality_score" in prompt:
+        return _critique(rng, blocks.get("TEXT", ""))
+    if "PASSAGE" in blocks:
+        return blocks["PASSAGE"].strip()
+    if "DRAFT" in blocks:
+        return blocks["DRAFT"].strip()
+    if "PLAN" in blocks:
+        return blocks["PLAN"].strip()
+    if "TEXT" in blocks:
+        return blocks["TEXT"].strip()
+    words = int(_WORD_TARGET.search(prompt).group(1)) if _WORD_TARGET.search(prompt) else 300
+    chapter = _CHAPTER.search(prompt)
+    if chapter:
+        number = int(chapter.group(1))
+        numeral = _ROMAN[number - 1] if number <= len(_ROMAN) else str(number)
+        return f"**{numeral}. {chapter.group(3)}**\n\n{_prose(rng, words)}"
+    if "OUTLINE" in blocks:
+        return _prose(rng, words)
+    pages = int(_PAGES.search(prompt).group(1)) if _PAGES.search(prompt) else 3
+    return _plan(rng, pages)
+
+
+def _render(messages: List[BaseMessage]) -> str:
+    return "\n\n".join(str(message.content) for message in messages)
+
+
+def _usage(prompt: str, output: str) -> Dict[str, int]:
+    input_tokens, output_tokens = len(prompt) // 4, max(1, len(output) // 4)
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+
+def _pieces(text: str, size: int = 16) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model returning fake_response() after `latency` seconds, then streaming at
+    `tokens_per_second` (4 characters per token).
+    """
+
+    model_name: str = "fake"
+    temperature: float = 0.0
+    latency: float = 0.05
+    tokens_per_second: float = 2000.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-book-model"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model_name": self.model_name, "temperature": self.temperature}
+
+    def _duration(self, text: str) -> float:
+        return len(text) / 4 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _result(self, prompt: str, output: str) -> ChatResult:
+        message = AIMessage(content=output, usage_metadata=_usage(prompt, output))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = _render(messages)
+        output = fake_response(prompt)
+        time.sleep(self.latency + self._duration(output))
+        return self._result(prompt, output)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        prompt = _render(messages)
+        output = fake_response(prompt)
+        await asyncio.sleep(self.latency + self._duration(output))
+        return self._result(prompt, output)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        prompt = _render(messages)
+        output = fake_response(prompt)
+        time.sleep(self.latency)
+        for piece in _pieces(output):
+            time.sleep(self._duration(piece))
+            if run_manager:
+                run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=_usage(prompt, output)))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        prompt = _render(messages)
+        output = fake_response(prompt)
+        await asyncio.sleep(self.latency)
+        for piece in _pieces(output):
+            await asyncio.sleep(self._duration(piece))
+            if run_manager:
+                await run_manager.on_llm_new_token(piece)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=_usage(prompt, output)))
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Feature-hashed bag-of-words vectors: deterministic, normalised, and texts that
+    share words land close together, so similarity thresholds behave sensibly.
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0) -> None:
+        self.dim = dim
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in re.findall(r"[a-z0-9']+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def fake_book_text(title: str, chars: int) -> str:
+    """
+    Deterministic filler "book" for building a local vector store.
+    """
+    rng = _rng(title)
+    return _prose(rng, chars // 6)[:chars]
@@ -1,4 +1,11 @@
-from gutenberg_api import fetch_book_text
+"""
+Gutenberg ids of the RAG catalog, grouped into shelves.
+
+`groups` is the catalog itself; `AGE_BANDS` says which readers a shelf is for
+and `shelf_of` looks a book up. Index builds tag chunks with both so retrieval
+can search only the shelves that fit a reader. Run the module to print the
+title of every book on every shelf.
+"""
 
 groups = {
     "children": [11, 55, 16, 17396, 271],
@@ -16,12 +23,31 @@ groups = {
     "religion": [10],
 }
 
-for shelf, ids in groups.items():
-    print(f"\n{shelf}:")
-    for book_id in ids:
-        try:
-            title, _ = fetch_book_text(str(book_id))
-            print(f"  {book_id}: {title}")
-        except Exception as e:
-            print(f"  {book_id}: failed ({e})")
+# Shelves not listed here are for adult readers.
+AGE_BANDS = {"children": "children", "teen": "teen"}
+
+# Books outside the catalog (e.g. extra GUTENBERG_BOOK_IDS) land here.
+UNSHELVED = "general"
+
+_shelf_by_id = {str(book_id): shelf for shelf, ids in groups.items() for book_id in ids}
+
+
+def shelf_of(book_id) -> str:
+    return _shelf_by_id.get(str(book_id), UNSHELVED)
+
+
+def age_band_of(shelf: str) -> str:
+    return AGE_BANDS.get(shelf, "adult")
+
+
+if __name__ == "__main__":
+    from gutenberg_api import fetch_book_text
 
+    for shelf, ids in groups.items():
+        print(f"\n{shelf}:")
+        for book_id in ids:
+            try:
+                title, _ = fetch_book_text(str(book_id))
+                print(f"  {book_id}: {title}")
+            except Exception as e:
+                print(f"  {book_id}: failed ({e})")
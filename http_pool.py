@@ -0,0 +1,182 @@
+"""
+Pooled HTTP transports shared by every LLM and embedding client in the process.
+
+The transports count requests and newly opened TCP connections (via httpcore's
+trace hook), so `ConnectionStats.snapshot()` shows how often calls reused a kept-alive connection,
+and route chat / embedding requests through the shared limits in rate_limit.py.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+import httpx
+
+import rate_limit
+import tracing
+
+
+class ConnectionStats:
+    """
+    Thread-safe counters shared by the sync transport and all per-loop async ones.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self, event_name: str) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self.new_connections += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            reused = max(0, self.requests - self.new_connections)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reused_connections": reused,
+                "reuse_rate": round(reused / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+def _record(stats: ConnectionStats, request: httpx.Request) -> None:
+    stats.record_request()
+    if request.url.path.endswith("/chat/completions"):
+        tracing.record(http_requests=1)
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """
+    Holds the limiter slot until the (possibly streamed) body has been consumed.
+    """
+
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]) -> None:
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+            self._release = lambda: None
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]) -> None:
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+            self._release = lambda: None
+
+
+def _with_stream(response: httpx.Response, stream: Any) -> httpx.Response:
+    return httpx.Response(
+        status_code=response.status_code,
+        headers=response.headers,
+        stream=stream,
+        extensions=response.extensions,
+    )
+
+
+class CountingTransport(httpx.HTTPTransport):
+    """
+    Counts connections and applies the shared provider limits from rate_limit.py.
+    """
+
+    def __init__(self, stats: ConnectionStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def _send(self, request: httpx.Request) -> httpx.Response:
+        _record(self.stats, request)
+        request.extensions["trace"] = lambda event_name, info: self.stats.record_connect(event_name)
+        return super().handle_request(request)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = rate_limit.limiter_for(request)
+        if limiter is None:
+            return self._send(request)
+        tokens = rate_limit.estimate_tokens(request)
+        attempt = 0
+        while True:
+            limiter.acquire(tokens)
+            started = time.monotonic()
+            try:
+                response = self._send(request)
+            except Exception:
+                limiter.release(None, time.monotonic() - started)
+                raise
+            latency = time.monotonic() - started
+            if response.status_code == 429 and attempt < rate_limit.LLM_RATE_MAX_RETRIES:
+                response.close()
+                limiter.release(429, latency)
+                delay = rate_limit.backoff_delay(attempt, response)
+                rate_limit.notify_wait(delay, "Provider rate limit hit, retrying")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            status = response.status_code
+            return _with_stream(response, _ReleasingStream(response.stream, lambda: limiter.release(status, latency)))
+
+
+class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats: ConnectionStats, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        _record(self.stats, request)
+
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self.stats.record_connect(event_name)
+
+        request.extensions["trace"] = trace
+        return await super().handle_async_request(request)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = rate_limit.limiter_for(request)
+        if limiter is None:
+            return await self._send(request)
+        tokens = rate_limit.estimate_tokens(request)
+        attempt = 0
+        while True:
+            await limiter.aacquire(tokens)
+            started = time.monotonic()
+            try:
+                response = await self._send(request)
+            except BaseException:
+                limiter.release(None, time.monotonic() - started)
+                raise
+            latency = time.monotonic() - started
+            if response.status_code == 429 and attempt < rate_limit.LLM_RATE_MAX_RETRIES:
+                await response.aclose()
+                limiter.release(429, latency)
+                delay = rate_limit.backoff_delay(attempt, response)
+                rate_limit.notify_wait(delay, "Provider rate limit hit, retrying")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            status = response.status_code
+            return _with_stream(response, _AsyncReleasingStream(response.stream, lambda: limiter.release(status, latency)))
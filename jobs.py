@@ -0,0 +1,435 @@
+"""
+Durable background queue for book generation.
+
+Jobs and every event they emit are stored in SQLite, so the HTTP request that
+enqueued a job can go away and any client can (re)attach later, replay the
+events emitted so far and follow new ones. Jobs are run by a pool of worker
+processes, each driving several generations concurrently on its event loop.
+
+Run a standalone pool with: python jobs.py --workers 4 --concurrency 8
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+from dotenv import load_dotenv
+
+from questionnaire import UserProfile
+
+load_dotenv()
+
+JOBS_DB = Path(os.getenv("JOBS_DB", "jobs/jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))  # processes started by the web app (they split LLM_RPM etc.); 0 = run jobs.py yourself
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))  # generations per worker process
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))  # requeue running jobs without a heartbeat
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+
+TERMINAL_STATUSES = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL,
+    lease TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class LeaseLost(RuntimeError):
+    """
+    The job was requeued (and possibly claimed by another worker) while this one still ran it.
+    """
+
+
+_schema_ready = False
+_worker_pool: List[multiprocessing.Process] = []
+
+
+@contextmanager
+def _connect() -> Iterator[sqlite3.Connection]:
+    """
+    Autocommit connection; multi-statement updates use explicit BEGIN IMMEDIATE.
+    """
+    global _schema_ready
+    JOBS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(JOBS_DB, timeout=30, isolation_level=None)
+    try:
+        if not _schema_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "lease" not in columns:  # queues created before leases
+                conn.execute("ALTER TABLE jobs ADD COLUMN lease TEXT")
+            _schema_ready = True
+        yield conn
+    finally:
+        conn.close()
+
+
+def _job_event(event_type: str, **payload: object) -> str:
+    return json.dumps({"type": event_type, **payload}, ensure_ascii=False)
+
+
+def _check_lease(conn: sqlite3.Connection, job_id: str, lease: Optional[str]) -> None:
+    if lease is None:
+        return
+    row = conn.execute("SELECT lease FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None or row[0] != lease:
+        raise LeaseLost(f"Job {job_id} is no longer leased to this worker")
+
+
+def append_event(job_id: str, line: str, lease: Optional[str] = None) -> int:
+    """
+    Stores one NDJSON event for the job and returns its sequence number.
+    With a `lease`, raises LeaseLost instead of writing if the job was requeued since it was claimed.
+    """
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _check_lease(conn, job_id, lease)
+        except LeaseLost:
+            conn.execute("ROLLBACK")
+            raise
+        (seq,) = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        conn.execute(
+            "INSERT INTO events (job_id, seq, payload) VALUES (?, ?, ?)", (job_id, seq, line.strip())
+        )
+        conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+        conn.execute("COMMIT")
+    return seq
+
+
+def enqueue_job(profile: UserProfile) -> str:
+    job_id = uuid4().hex[:12]
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, status, profile, created_at) VALUES (?, 'queued', ?, ?)",
+            (job_id, json.dumps(vars(profile), ensure_ascii=False), time.time()),
+        )
+    append_event(job_id, _job_event("job", job_id=job_id))
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with _connect() as conn:
+        conn.row_factory = sqlite3.Row
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["profile"] = json.loads(job["profile"])
+    return job
+
+
+def claim_job(worker_id: str) -> Optional[Tuple[str, UserProfile, str]]:
+    """
+    Atomically moves the oldest queued job to running and returns it with a fresh
+    lease token; every later write by this worker must present it.
+    """
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT id, profile FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        now = time.time()
+        lease = uuid4().hex
+        conn.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, lease = ?, attempts = attempts + 1, "
+            "started_at = ?, heartbeat_at = ? WHERE id = ?",
+            (worker_id, lease, now, now, row[0]),
+        )
+        conn.execute("COMMIT")
+    return row[0], UserProfile(**json.loads(row[1])), lease
+
+
+def heartbeat(job_id: str, lease: str) -> bool:
+    """
+    Refreshes the job's heartbeat; False if the lease was lost.
+    """
+    with _connect() as conn:
+        return bool(conn.execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND lease = ?", (time.time(), job_id, lease)
+        ).rowcount)
+
+
+def holds_lease(job_id: str, lease: str) -> bool:
+    with _connect() as conn:
+        return conn.execute("SELECT 1 FROM jobs WHERE id = ? AND lease = ?", (job_id, lease)).fetchone() is not None
+
+
+def finish_job(job_id: str, lease: str, status: str, error: Optional[str] = None) -> bool:
+    """
+    Records the outcome unless the lease was lost; returns whether it was recorded.
+    """
+    with _connect() as conn:
+        return bool(conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease = NULL WHERE id = ? AND lease = ?",
+            (status, error, time.time(), job_id, lease),
+        ).rowcount)
+
+
+def requeue_stale_jobs(stale_seconds: float = JOB_STALE_SECONDS) -> List[str]:
+    """
+    Puts running jobs whose worker stopped heartbeating back on the queue. Their
+    lease is revoked, so a worker that was only slow stops at its next write.
+    """
+    cutoff = time.time() - stale_seconds
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        stale = [
+            row[0]
+            for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (cutoff,)
+            )
+        ]
+        for job_id in stale:
+            conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease = NULL WHERE id = ?", (job_id,))
+        conn.execute("COMMIT")
+    for job_id in stale:
+        append_event(job_id, _job_event("restart", message="Worker lost; resuming from the last checkpoint..."))
+    return stale
+
+
+def requeue_job(job_id: str) -> bool:
+    """
+    Queues a failed job again. Returns False if the job is unknown or not failed.
+    """
+    with _connect() as conn:
+        updated = conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease = NULL, error = NULL, finished_at = NULL "
+            "WHERE id = ? AND status = 'failed'",
+            (job_id,),
+        ).rowcount
+    if updated:
+        append_event(job_id, _job_event("restart", message="Resuming from the last checkpoint..."))
+    return bool(updated)
+
+
+def read_events(job_id: str, after: int = 0) -> List[Tuple[int, str]]:
+    with _connect() as conn:
+        return conn.execute(
+            "SELECT seq, payload FROM events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, after)
+        ).fetchall()
+
+
+def _with_seq(seq: int, payload: str) -> str:
+    return json.dumps({"seq": seq, **json.loads(payload)}, ensure_ascii=False) + "\n"
+
+
+def _poll_events(job_id: str, after: int) -> Tuple[List[Tuple[int, str]], bool]:
+    """
+    Returns events after `after` and whether the job has finished.
+    Status is read first so no event written before completion can be missed.
+    """
+    job = get_job(job_id)
+    finished = job is None or job["status"] in TERMINAL_STATUSES
+    return read_events(job_id, after), finished
+
+
+def follow_events(job_id: str, after: int = 0, poll_interval: float = JOB_POLL_INTERVAL) -> Iterator[str]:
+    """
+    Replays stored events after `after`, then follows live ones until the job ends.
+    Each NDJSON line carries its `seq` so clients can resume from where they dropped.
+    Blocks its thread between polls: only the plain Flask routes use it, asgi_app
+    streams through afollow_events.
+    """
+    while True:
+        events, finished = _poll_events(job_id, after)
+        for seq, payload in events:
+            after = seq
+            yield _with_seq(seq, payload)
+        if finished:
+            return
+        time.sleep(poll_interval)
+
+
+async def afollow_events(job_id: str, after: int = 0, poll_interval: float = JOB_POLL_INTERVAL) -> AsyncIterator[str]:
+    while True:
+        events, finished = await asyncio.to_thread(_poll_events, job_id, after)
+        for seq, payload in events:
+            after = seq
+            yield _with_seq(seq, payload)
+        if finished:
+            return
+        await asyncio.sleep(poll_interval)
+
+
+# --- WORKERS ---
+
+async def _run_job(job_id: str, profile: UserProfile, lease: str) -> None:
+    from app import generate_events  # imported lazily: app imports this module
+    from checkpoints import SessionCheckpoint
+    from rate_limit import listen_for_waits
+
+    job_task = asyncio.current_task()
+    lost = False
+    pending_waits: set[asyncio.Task] = set()
+
+    def check_lease() -> None:
+        if not holds_lease(job_id, lease):
+            raise LeaseLost(f"Job {job_id} is no longer leased to this worker")
+
+    async def keep_alive() -> None:
+        nonlocal lost
+        while True:
+            await asyncio.sleep(JOB_STALE_SECONDS / 4)
+            if not await asyncio.to_thread(heartbeat, job_id, lease):
+                lost = True
+                job_task.cancel()
+                return
+
+    def store_wait(line: str) -> None:
+        try:
+            append_event(job_id, line, lease)
+        except LeaseLost:
+            pass
+
+    def on_wait(seconds: float, reason: str) -> None:
+        # Called from inside provider requests: on the loop the write is handed to a
+        # thread so the request path never blocks on SQLite; off the loop it is inline.
+        line = _job_event("wait", seconds=round(seconds, 1), message=f"{reason}: waiting {seconds:.0f}s")
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            store_wait(line)
+            return
+        task = loop.create_task(asyncio.to_thread(store_wait, line))
+        pending_waits.add(task)
+        task.add_done_callback(pending_waits.discard)
+
+    pulse = asyncio.create_task(keep_alive())
+    status, error = "done", None
+    try:
+        # The job id doubles as the checkpoint session, so requeued jobs resume.
+        # The guard stops checkpoint writes once another worker may own the session.
+        checkpoint = SessionCheckpoint(job_id, profile, guard=check_lease)
+        with listen_for_waits(on_wait):
+            async for line in generate_events(profile, checkpoint):
+                await asyncio.to_thread(append_event, job_id, line, lease)
+                event = json.loads(line)
+                if event.get("type") == "error":
+                    status, error = "failed", event.get("message")
+    except LeaseLost:
+        lost = True
+    except asyncio.CancelledError:
+        if not lost:
+            raise
+    except Exception as exc:
+        status, error = "failed", str(exc)
+        try:
+            await asyncio.to_thread(append_event, job_id, _job_event("error", message=str(exc)), lease)
+        except LeaseLost:
+            lost = True
+    finally:
+        pulse.cancel()
+    if lost:
+        print(f"⚠️  Job {job_id} was requeued while this worker ran it; stopped without writing further")
+        return
+    await asyncio.to_thread(finish_job, job_id, lease, status, error)
+
+
+async def _worker_loop(worker_id: str, concurrency: int) -> None:
+    running: set[asyncio.Task] = set()
+    last_sweep = 0.0
+    while True:
+        if time.monotonic() - last_sweep > JOB_STALE_SECONDS / 2:
+            last_sweep = time.monotonic()
+            for job_id in await asyncio.to_thread(requeue_stale_jobs):
+                print(f"♻️  Requeued stale job {job_id}")
+        while len(running) < concurrency:
+            claimed = await asyncio.to_thread(claim_job, worker_id)
+            if claimed is None:
+                break
+            task = asyncio.create_task(_run_job(*claimed))
+            running.add(task)
+            task.add_done_callback(running.discard)
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+
+
+def run_worker(concurrency: int = JOB_WORKER_CONCURRENCY, pool_size: int = 1) -> None:
+    worker_id = f"{os.uname().nodename if hasattr(os, 'uname') else 'local'}:{os.getpid()}"
+    print(f"👷 Worker {worker_id} started (concurrency={concurrency}, 1/{pool_size} of the provider budget)")
+    from rag_store import warm_vectorstore
+    from rate_limit import share_budget
+
+    # The pool shares one provider account, so each worker enforces its share of the limits.
+    share_budget(pool_size)
+
+    warm_vectorstore()
+    try:
+        asyncio.run(_worker_loop(worker_id, concurrency))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_worker_pool(
+    workers: int = JOB_WORKERS,
+    concurrency: int = JOB_WORKER_CONCURRENCY,
+    pool_size: Optional[int] = None,
+) -> List[multiprocessing.Process]:
+    """
+    Starts `workers` processes; `pool_size` (default `workers`) is how many split the provider budget.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(workers):
+        process = ctx.Process(target=run_worker, args=(concurrency, pool_size or workers), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def ensure_worker_pool() -> None:
+    """
+    Starts the web tier's own JOB_WORKERS processes on first use (no-op when JOB_WORKERS=0).
+    Dead workers are replaced.
+    """
+    global _worker_pool
+    _worker_pool = [process for process in _worker_pool if process.is_alive()]
+    missing = JOB_WORKERS - len(_worker_pool)
+    if missing > 0:
+        _worker_pool.extend(start_worker_pool(missing, pool_size=JOB_WORKERS))
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Run book generation workers.")
+    cli.add_argument("--workers", type=int, default=max(1, JOB_WORKERS))
+    cli.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    args = cli.parse_args()
+
+    pool = start_worker_pool(args.workers, args.concurrency)
+    try:
+        for process in pool:
+            process.join()
+    except KeyboardInterrupt:
+        print("Stopping workers...")
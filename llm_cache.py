@@ -0,0 +1,240 @@
+"""
+Disk-backed, content-addressed cache for chat model responses.
+
+Entries are keyed on the model settings string LangChain builds for each call
+(model name, temperature, ...) plus the rendered prompt messages, stored in
+SQLite, and evicted least-recently-used once the size/age limits are exceeded.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence
+
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration
+from langchain_core.runnables import Runnable, RunnableGenerator
+
+import tracing
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+# Size/age limits are enforced every this many writes (per process) rather than on each one.
+EVICT_EVERY_WRITES = 100
+
+
+class DiskLLMCache(BaseCache):
+    """
+    LangChain cache that persists generations in a SQLite file.
+
+    max_entries / max_bytes bound the cache size (least recently used entries go first),
+    max_age_seconds drops entries older than that regardless of use. 0 disables a limit.
+    Limits are checked every EVICT_EVERY_WRITES writes, so the cache may briefly run
+    that many entries over them.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        max_entries: int = 5000,
+        max_bytes: int = 512 * 1024 * 1024,
+        max_age_seconds: float = 30 * 24 * 3600,
+    ) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Connection that commits on success, rolls back on error and is always closed.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and self.max_age_seconds and now - row[1] > self.max_age_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                row = None
+            if row:
+                conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+
+        if row:
+            tracing.record(cache_hits=1)
+        with self._lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not row:
+            return None
+        return [ChatGeneration(message=AIMessage(content=text)) for text in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        key = self.make_key(prompt, llm_string)
+        # Only the text is kept; usage metadata is meaningless for a replayed response.
+        value = json.dumps([generation.text for generation in return_val], ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            with self._lock:
+                self._writes += 1
+                due = (self._writes - 1) % EVICT_EVERY_WRITES == 0  # first write, then every N
+            if due:
+                self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        removed = 0
+        if self.max_age_seconds:
+            removed += conn.execute(
+                "DELETE FROM entries WHERE created_at < ?", (now - self.max_age_seconds,)
+            ).rowcount
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        over_count = self.max_entries and count > self.max_entries
+        over_bytes = self.max_bytes and total > self.max_bytes
+        # The LRU scan only runs once a limit is actually exceeded.
+        rows = conn.execute("SELECT key, size FROM entries ORDER BY accessed_at ASC").fetchall() if over_count or over_bytes else []
+        stale = []
+        for key, size in rows:
+            over_count = self.max_entries and count > self.max_entries
+            over_bytes = self.max_bytes and total > self.max_bytes
+            if not (over_count or over_bytes):
+                break
+            stale.append((key,))
+            count -= 1
+            total -= size
+        if stale:
+            conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+            removed += len(stale)
+
+        if removed:
+            with self._lock:
+                self.evictions += removed
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+            }
+
+
+def stream_through_cache(llm: BaseChatModel) -> Runnable:
+    """
+    `.stream()` skips LangChain's cache, so streamed stages wrap the model with this.
+    A hit replays the stored text as one chunk; a miss streams normally and stores the result.
+    Returns the model unchanged when it has no DiskLLMCache attached.
+    """
+    cache = llm.cache
+    if not isinstance(cache, BaseCache):
+        return llm
+
+    def cache_key(prompt_value: Any) -> tuple[Any, str, str]:
+        messages = prompt_value.to_messages()
+        return messages, dumps(messages), llm._get_llm_string()
+
+    def replay(cached: Sequence[Any]) -> AIMessageChunk:
+        # A replay never starts the model, so count the call the trace would otherwise miss.
+        tracing.record(llm_calls=1)
+        return AIMessageChunk(content="".join(generation.text for generation in cached))
+
+    def as_generations(full: AIMessageChunk) -> list[ChatGeneration]:
+        return [ChatGeneration(message=AIMessage(content=full.content))]
+
+    def transform(inputs: Iterator[Any]) -> Iterator[AIMessageChunk]:
+        for prompt_value in inputs:
+            messages, prompt, llm_string = cache_key(prompt_value)
+            cached = cache.lookup(prompt, llm_string)
+            if cached:
+                yield replay(cached)
+                continue
+            full = None
+            for chunk in llm.stream(messages):
+                full = chunk if full is None else full + chunk
+                yield chunk
+            if full is not None:
+                cache.update(prompt, llm_string, as_generations(full))
+
+    async def atransform(inputs: AsyncIterator[Any]) -> AsyncIterator[AIMessageChunk]:
+        async for prompt_value in inputs:
+            messages, prompt, llm_string = cache_key(prompt_value)
+            cached = await cache.alookup(prompt, llm_string)
+            if cached:
+                yield replay(cached)
+                continue
+            full = None
+            async for chunk in llm.astream(messages):
+                full = chunk if full is None else full + chunk
+                yield chunk
+            if full is not None:
+                await cache.aupdate(prompt, llm_string, as_generations(full))
+
+    return RunnableGenerator(transform, atransform)
+
+
+if __name__ == "__main__":
+    # python llm_cache.py [stats|clear]
+    from llm_config import get_llm_cache
+
+    llm_cache = get_llm_cache()
+    if llm_cache is None:
+        print("LLM cache is disabled (LLM_CACHE_ENABLED=0).")
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        llm_cache.clear()
+        print(f"🧹 Cleared {llm_cache.path}")
+    else:
+        print(json.dumps(llm_cache.stats(), indent=2))
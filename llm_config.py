@@ -1,26 +1,218 @@
 # llm_config.py
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
+from fake_llm import FakeChatModel, FakeEmbeddings, parse_options
+from http_pool import AsyncCountingTransport, ConnectionStats, CountingTransport
+from llm_cache import DiskLLMCache
+from rate_limit import limiter_stats
+from tracing import trace_callback
+
 # Load .env so this works in local dev
 load_dotenv()
 
-# Model names can be overridden via env
+# Model names can be overridden via env; "fake" / "fake:latency=0.5,tps=80" (chat) and
+# "fake" / "fake:dim=256" (embeddings) select the offline backends in fake_llm.py.
 MAIN_MODEL = os.getenv("MAIN_MODEL", "gpt-5-nano")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 VECTOR_DB_DIR = os.getenv("VECTOR_DB_DIR", "vector_db")
 
-def get_llm(model: Optional[str] = None, temperature: float = 0.9) -> ChatOpenAI:
+# Response cache: identical (model, temperature, prompt) calls are served from disk.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache/responses.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+LLM_CACHE_MAX_AGE_DAYS = float(os.getenv("LLM_CACHE_MAX_AGE_DAYS", "30"))
+# Comma-separated stages that always go to the provider. The high-temperature
+# creative stages are skipped by default so identical profiles still get different
+# books; set it to "" to cache every stage (e.g. for reproducible benchmarks).
+LLM_CACHE_SKIP_STAGES = {
+    stage.strip() for stage in os.getenv("LLM_CACHE_SKIP_STAGES", "plan,draft").split(",") if stage.strip()
+}
+
+# Connection pool shared by all model and embedding clients in this process.
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("LLM_HTTP_KEEPALIVE_SECONDS", "60"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "600"))
+
+_llm_cache: Optional[DiskLLMCache] = None
+
+_http_stats = ConnectionStats()
+_http_client: Optional[httpx.Client] = None
+# httpx async connections belong to the event loop that opened them, so each loop
+# gets its own pooled client, closed when the loop shuts down (asyncio.run finalises
+# async generators first). Models are shared across loops: they hold a
+# _LoopAsyncClient that picks the running loop's client per request. The sync
+# pipeline wrappers all run on the long-lived loop in async_utils.py, so their pool
+# stays warm across calls; code calling asyncio.run() per request starts cold each time.
+_async_http_clients: Dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_loop_closers: Dict[asyncio.AbstractEventLoop, Any] = {}
+_llm_registry: Dict[Tuple[Any, ...], BaseChatModel] = {}
+_registry_lock = threading.Lock()
+
+def get_llm_cache() -> Optional[DiskLLMCache]:
+    """
+    Returns the shared response cache, or None when caching is disabled.
+    """
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _llm_cache is None:
+        _llm_cache = DiskLLMCache(
+            LLM_CACHE_PATH,
+            max_entries=LLM_CACHE_MAX_ENTRIES,
+            max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+            max_age_seconds=LLM_CACHE_MAX_AGE_DAYS * 24 * 3600,
+        )
+    return _llm_cache
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_SECONDS,
+    )
+
+def _http_timeout() -> httpx.Timeout:
+    return httpx.Timeout(LLM_HTTP_TIMEOUT, connect=10.0)
+
+def get_http_client() -> httpx.Client:
+    """
+    Returns the process-wide pooled client used for synchronous calls.
+    """
+    global _http_client
+    with _registry_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                transport=CountingTransport(_http_stats, limits=_http_limits()),
+                timeout=_http_timeout(),
+            )
+        return _http_client
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def _close_with_loop(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient) -> None:
+    """
+    Closes `client` when `loop` shuts down: a suspended async generator is
+    finalised by loop.shutdown_asyncgens() while the loop can still run aclose().
+    """
+    async def closer():
+        try:
+            yield
+        finally:
+            await client.aclose()
+
+    agen = closer()
+    _loop_closers[loop] = agen  # referenced until then, or GC would finalise it early
+    loop.create_task(agen.__anext__())
+
+def get_async_http_client() -> Optional[httpx.AsyncClient]:
+    """
+    Returns the pooled async client of the running event loop (None outside a loop).
+    Its kept-alive connections last as long as the loop does.
+    """
+    loop = _running_loop()
+    if loop is None:
+        return None
+    with _registry_lock:
+        for closed in [other for other in _async_http_clients if other.is_closed()]:
+            _async_http_clients.pop(closed, None)
+            _loop_closers.pop(closed, None)
+        client = _async_http_clients.get(loop)
+        if client is None:
+            client = httpx.AsyncClient(
+                transport=AsyncCountingTransport(_http_stats, limits=_http_limits()),
+                timeout=_http_timeout(),
+            )
+            _async_http_clients[loop] = client
+            _close_with_loop(loop, client)
+        return client
+
+class _LoopAsyncClient(httpx.AsyncClient):
     """
-    Returns a ChatOpenAI LLM instance.
+    The async client given to ChatOpenAI. Requests go through the pooled client of
+    whichever loop is running when they are sent, so a model built outside any loop
+    (e.g. by the sync stream_* wrappers) still gets the pool, limiter and 429 handling.
     """
+
+    async def send(self, request: httpx.Request, **kwargs: Any) -> httpx.Response:
+        return await get_async_http_client().send(request, **kwargs)
+
+    async def aclose(self) -> None:
+        # Shared by every model; the per-loop clients are closed with their loops.
+        pass
+
+_loop_async_client: Optional[_LoopAsyncClient] = None
+
+def _get_loop_async_client() -> _LoopAsyncClient:
+    global _loop_async_client
+    with _registry_lock:
+        if _loop_async_client is None:
+            _loop_async_client = _LoopAsyncClient(timeout=_http_timeout())
+        return _loop_async_client
+
+def http_pool_stats() -> Dict[str, Any]:
+    """
+    Request / new connection counters across all pooled clients, plus the state
+    of the shared provider rate limiters.
+    """
+    return {**_http_stats.snapshot(), "event_loops": len(_async_http_clients), "limits": limiter_stats()}
+
+def _build_llm(model: str, temperature: float, cache: Optional[DiskLLMCache]) -> BaseChatModel:
+    if model.startswith("fake"):
+        options = parse_options(model)
+        return FakeChatModel(
+            model_name=model,
+            temperature=temperature,
+            latency=float(options.get("latency", os.getenv("FAKE_LLM_LATENCY", "0.05"))),
+            tokens_per_second=float(options.get("tps", os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "2000"))),
+            cache=cache if cache is not None else False,
+            callbacks=[trace_callback],
+        )
     return ChatOpenAI(
-        model=model or MAIN_MODEL,
+        model=model,
         temperature=temperature,
+        cache=cache if cache is not None else False,
+        http_client=get_http_client(),
+        http_async_client=_get_loop_async_client(),
+        # Token usage on streamed responses too, for the stage traces.
+        stream_usage=True,
+        callbacks=[trace_callback],
     )
 
+def get_llm(model: Optional[str] = None, temperature: float = 0.9, stage: Optional[str] = None) -> BaseChatModel:
+    """
+    Returns a shared chat model instance for these settings.
+    `stage` names the pipeline step so it can opt out of the response cache.
+    """
+    cache = get_llm_cache() if stage not in LLM_CACHE_SKIP_STAGES else None
+    key = (model or MAIN_MODEL, temperature, cache is not None)
+    with _registry_lock:
+        llm = _llm_registry.get(key)
+    if llm is None:
+        llm = _build_llm(model or MAIN_MODEL, temperature, cache)
+        with _registry_lock:
+            llm = _llm_registry.setdefault(key, llm)
+    return llm
+
+def _build_embeddings() -> Embeddings:
+    if EMBEDDING_MODEL.startswith("fake"):
+        options = parse_options(EMBEDDING_MODEL)
+        return FakeEmbeddings(dim=int(options.get("dim", "256")), latency=float(options.get("latency", "0")))
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL, http_client=get_http_client())
+
 # Single embedding object reused across RAG
-embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+embeddings = _build_embeddings()
@@ -0,0 +1,368 @@
+"""Helpers for reading structure out of plans and manuscripts."""
+
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+# "Chapter 3: ...", "Section II - ...", "Introduction: ...", "Conclusion"
+_KEYWORD_HEADING = re.compile(
+    r"(?i)^(?:(?:chapter|section|part|movement)\s+(?:\d+|[ivxlc]+)\b|"
+    r"introduction\b|prologue\b|epilogue\b|interlude\b|conclusion\b|coda\b)"
+)
+# "1) Title", "2. Title", "IV. Title"
+_NUMBERED_HEADING = re.compile(r"^(?:\d+|[IVXLC]+)[.)]\s+\S")
+# Plan blocks that come after the chapter outline.
+_OUTLINE_END = re.compile(r"(?i)^(?:\d+[.)]\s*)?(?:symbolic\s+)?(?:motifs?|conceptual anchors?|main idea|lesson)\b")
+_TITLE_LINE = re.compile(r"(?i)^(?:working\s+)?title\s*[:\-]\s*(.+)")
+_SUBTITLE_LINE = re.compile(r"(?i)^(?:optional\s+)?subtitle\s*[:\-]\s*(.+)")
+_NUMBER_PREFIX = re.compile(r"^(?:\d+|[IVXLC]+)[.)]\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+@dataclass
+class OutlineSection:
+    index: int
+    heading: str
+    notes: str = ""
+
+    def summary(self, max_chars: int = 400) -> str:
+        """First sentences of the planning notes, trimmed for neighbour context."""
+        text = " ".join(line.strip("-•* ").strip() for line in self.notes.splitlines() if line.strip())
+        if len(text) <= max_chars:
+            return text
+        out = ""
+        for sentence in _SENTENCE_END.split(text):
+            if len(out) + len(sentence) > max_chars:
+                break
+            out = f"{out} {sentence}".strip()
+        return out or text[:max_chars].rstrip() + "..."
+
+
+def clean_line(line: str) -> str:
+    """Strip markdown emphasis, heading marks and list bullets from a line."""
+    stripped = line.strip()
+    stripped = re.sub(r"^#{1,6}\s*", "", stripped)
+    stripped = stripped.replace("**", "").replace("__", "")
+    return stripped.strip()
+
+
+def _normalize_heading(heading: str) -> str:
+    return re.sub(r"[^a-z0-9]+", " ", heading.lower()).strip()
+
+
+def _collect_sections(lines: List[str], is_heading) -> List[OutlineSection]:
+    sections: List[OutlineSection] = []
+    current_heading = None
+    current_notes: List[str] = []
+
+    def flush() -> None:
+        if current_heading is not None:
+            heading = _NUMBER_PREFIX.sub("", current_heading)
+            sections.append(OutlineSection(len(sections), heading, "\n".join(current_notes).strip()))
+
+    for raw in lines:
+        line = clean_line(raw)
+        if _OUTLINE_END.match(line) and current_heading is not None:
+            break
+        bullet_free = line.lstrip("-•* ").strip()
+        if bullet_free and is_heading(bullet_free):
+            flush()
+            current_heading = bullet_free
+            current_notes = []
+        elif current_heading is not None:
+            current_notes.append(line)
+    flush()
+    return sections
+
+
+def _merge_duplicates(sections: List[OutlineSection]) -> List[OutlineSection]:
+    """
+    Plans often list headings twice (a bullet list, then a detailed pass).
+    Keep first-seen order but the occurrence with the richest notes.
+    """
+    best: Dict[str, OutlineSection] = {}
+    order: List[str] = []
+    for section in sections:
+        key = _normalize_heading(section.heading)
+        if key not in best:
+            order.append(key)
+            best[key] = section
+        elif len(section.notes) > len(best[key].notes):
+            best[key] = section
+    return [OutlineSection(idx, best[key].heading, best[key].notes) for idx, key in enumerate(order)]
+
+
+def parse_plan_outline(plan: str) -> List[OutlineSection]:
+    """
+    Extract the chapter/section outline from a `run_planning` result.
+    Returns an empty list when no usable outline is found.
+    """
+    lines = plan.splitlines()
+
+    sections = _merge_duplicates(
+        _collect_sections(lines, lambda line: bool(_KEYWORD_HEADING.match(line)))
+    )
+    if len(sections) >= 2:
+        return sections
+
+    # Fall back to a numbered list that follows an "Outline" marker.
+    for idx, raw in enumerate(lines):
+        if "outline" in raw.lower():
+            sections = _merge_duplicates(
+                _collect_sections(lines[idx + 1:], lambda line: bool(_NUMBERED_HEADING.match(line)))
+            )
+            if len(sections) >= 2:
+                return sections
+    return []
+
+
+def extract_plan_title(plan: str) -> str:
+    """
+    Returns "Title" or "Title\\nSubtitle" as written in the plan, or "" if absent.
+    """
+    title = ""
+    subtitle = ""
+    for raw in plan.splitlines():
+        line = clean_line(raw).lstrip("-•* ")
+        if not title:
+            match = _TITLE_LINE.match(line)
+            if match:
+                title = match.group(1).strip("\"' ")
+                continue
+        if title and not subtitle:
+            match = _SUBTITLE_LINE.match(line)
+            if match:
+                subtitle = match.group(1).strip("\"' ")
+                break
+    return f"{title}\n{subtitle}" if subtitle else title
+
+
+# --- Manuscript paragraphs ---
+
+_PARAGRAPH_BREAK = re.compile(r"(\n\s*)")
+_MANUSCRIPT_HEADING = re.compile(
+    r"(?i)^(?:(?:chapter|section|part)\s+(?:\d+|[ivxlc]+)\b|[IVXLC]+[.:)]\s+\S|"
+    r"introduction\b|prologue\b|epilogue\b|conclusion\b)"
+)
+_SECTION_REFERENCE = re.compile(r"(?i)\b(chapter|section|part)\s+(\d+|[ivxlc]+)\b")
+_HEADING_NUMBER = re.compile(r"(?i)^(?:(?:chapter|section|part)\s+)?(\d+|[ivxlc]+)\b")
+# Double quotes always delimit; single quotes only at word boundaries, so
+# possessives and contractions ("the author's", "don't") never open or close one.
+_QUOTED = re.compile(r"[\"“”]([^\"“”]{12,})[\"“”]|(?<!\w)['‘](\S[^\"“”]{10,}?\S)['’](?!\w)")
+_WORD = re.compile(r"[a-z0-9']+")
+_ROMAN_VALUES = {"i": 1, "v": 5, "x": 10, "l": 50, "c": 100}
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """
+    Splits text into alternating [paragraph, separator, paragraph, ...] pieces, one
+    paragraph per line (manuscripts use both blank-line and single-newline breaks).
+    "".join(pieces) == text, so edited paragraphs can be spliced back byte-exactly.
+    """
+    return _PARAGRAPH_BREAK.split(text)
+
+
+def is_heading(paragraph: str) -> bool:
+    line = clean_line(paragraph)
+    return "\n" not in line and len(line) <= 120 and bool(_MANUSCRIPT_HEADING.match(line))
+
+
+def _roman_to_int(numeral: str) -> int:
+    total = 0
+    values = [_ROMAN_VALUES[ch] for ch in numeral.lower()]
+    for idx, value in enumerate(values):
+        total += -value if idx + 1 < len(values) and values[idx + 1] > value else value
+    return total
+
+
+def _section_number(token: str) -> int:
+    return int(token) if token.isdigit() else _roman_to_int(token)
+
+
+def _normalize_text(text: str) -> str:
+    text = text.replace("’", "'").replace("‘", "'").replace("“", '"').replace("”", '"')
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def _snippet_quotes(snippet: str) -> List[str]:
+    quotes = [match.group(1) or match.group(2) for match in _QUOTED.finditer(snippet)]
+    if quotes:
+        return quotes
+    # An unquoted snippet is matched as a whole unless it is only a section reference.
+    bare = _SECTION_REFERENCE.sub("", snippet).strip(" :-–—,.")
+    return [snippet] if len(bare) >= 12 else []
+
+
+def _best_paragraph(quote: str, candidates: Dict[int, str], min_overlap: float = 0.6) -> Optional[int]:
+    needle = _normalize_text(quote).strip("\"' .…")
+    for idx, paragraph in candidates.items():
+        if needle and needle in paragraph:
+            return idx
+    # Fuzzy fallback for paraphrased evidence: share of the snippet's words in the paragraph.
+    words = set(_WORD.findall(needle))
+    if len(words) < 4:
+        return None
+    best_idx, best_score = None, 0.0
+    for idx, paragraph in candidates.items():
+        score = len(words & set(_WORD.findall(paragraph))) / len(words)
+        if score > best_score:
+            best_idx, best_score = idx, score
+    return best_idx if best_score >= min_overlap else None
+
+
+def locate_passages(pieces: List[str], snippets: List[str], section_paragraphs: int = 2) -> Dict[int, List[str]]:
+    """
+    Maps critique evidence snippets to paragraph positions in `split_paragraphs` output.
+    Quoted phrases are matched exactly (then fuzzily); snippets that only name a
+    section ("Section II", "chapter 3") select the first body paragraphs of that section.
+    Returns {piece_index: [snippets that point at it]}.
+    """
+    body: Dict[int, str] = {}
+    sections: Dict[int, List[int]] = {}
+    current: Optional[List[int]] = None
+    for idx in range(0, len(pieces), 2):
+        paragraph = pieces[idx]
+        if not paragraph.strip():
+            continue
+        if is_heading(paragraph):
+            numbered = _HEADING_NUMBER.match(clean_line(paragraph))
+            number = _section_number(numbered.group(1)) if numbered else len(sections) + 1
+            current = sections.setdefault(number, [])
+            continue
+        body[idx] = _normalize_text(paragraph)
+        if current is not None:
+            current.append(idx)
+
+    targets: Dict[int, List[str]] = {}
+    for snippet in snippets:
+        hits = [idx for idx in (_best_paragraph(quote, body) for quote in _snippet_quotes(snippet)) if idx is not None]
+        reference = _SECTION_REFERENCE.search(snippet)
+        if not hits and reference:
+            hits = sections.get(_section_number(reference.group(2)), [])[:section_paragraphs]
+        for idx in hits:
+            targets.setdefault(idx, []).append(snippet)
+    return targets
+
+
+# --- Manuscript sections for chunked editing ---
+
+@dataclass
+class ManuscriptChunk:
+    index: int
+    text: str  # exact slice of the manuscript; the chunks join back to it
+    context_before: str = ""
+    context_after: str = ""
+
+    def wrap(self, edited: str) -> str:
+        """Puts the chunk's original leading/trailing whitespace around an edited body."""
+        lead = self.text[: len(self.text) - len(self.text.lstrip())]
+        trail = self.text[len(self.text.rstrip()):]
+        return f"{lead}{edited.strip()}{trail}"
+
+
+def _paragraph_ranges(pieces: List[str], max_chars: int) -> List[range]:
+    """
+    Piece ranges of the heading-delimited sections, with sections longer than
+    `max_chars` cut between paragraphs.
+    """
+    starts = [0] + [idx for idx in range(2, len(pieces), 2) if pieces[idx].strip() and is_heading(pieces[idx])]
+    ranges: List[range] = []
+    for start, end in zip(starts, starts[1:] + [len(pieces)]):
+        part_start, size, has_body = start, 0, False
+        for idx in range(start, end, 2):
+            length = len(pieces[idx]) + (len(pieces[idx + 1]) if idx + 1 < end else 0)
+            # Never leave a heading (or title block) on its own without body text.
+            if has_body and size + length > max_chars:
+                ranges.append(range(part_start, idx))
+                part_start, size, has_body = idx, 0, False
+            size += length
+            has_body = has_body or (bool(pieces[idx].strip()) and not is_heading(pieces[idx]))
+        ranges.append(range(part_start, end))
+    return [r for r in ranges if len(r)]
+
+
+def split_sections(text: str, max_chars: int = 12000, overlap_paragraphs: int = 1) -> List[ManuscriptChunk]:
+    """
+    Splits a manuscript on its chapter/section headings into chunks of at most
+    `max_chars` (small neighbouring sections are merged, long ones are cut between
+    paragraphs). Each chunk carries the last/first `overlap_paragraphs` paragraphs
+    of its neighbours as read-only context for seamless editing.
+    """
+    pieces = split_paragraphs(text)
+    groups: List[List[range]] = []
+    size = 0
+    for section in _paragraph_ranges(pieces, max_chars):
+        length = sum(len(pieces[idx]) for idx in section)
+        if groups and size + length <= max_chars:
+            groups[-1].append(section)
+            size += length
+        else:
+            groups.append([section])
+            size = length
+
+    spans = [range(group[0].start, group[-1].stop) for group in groups]
+
+    def paragraphs(span: range) -> List[str]:
+        return [pieces[idx].strip() for idx in span if idx % 2 == 0 and pieces[idx].strip()]
+
+    chunks = []
+    for index, span in enumerate(spans):
+        before = paragraphs(spans[index - 1])[-overlap_paragraphs:] if index > 0 and overlap_paragraphs else []
+        after = paragraphs(spans[index + 1])[:overlap_paragraphs] if index + 1 < len(spans) and overlap_paragraphs else []
+        chunks.append(ManuscriptChunk(
+            index=index,
+            text="".join(pieces[idx] for idx in span),
+            context_before="\n".join(before),
+            context_after="\n".join(after),
+        ))
+    return chunks
+
+
+def _sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+
+
+def _trim_echo(lines: List[str], echoed: set, from_end: bool = False) -> List[str]:
+    lines = lines[::-1] if from_end else list(lines)
+    while lines and echoed:
+        if not lines[0].strip():
+            lines.pop(0)
+            continue
+        sentences = _sentences(lines[0])
+        if from_end:
+            sentences = sentences[::-1]
+        repeated = 0
+        while repeated < len(sentences) and _normalize_text(sentences[repeated]) in echoed:
+            repeated += 1
+        if not repeated:
+            break
+        rest = sentences[repeated:]
+        if rest:
+            lines[0] = " ".join(rest[::-1] if from_end else rest)
+            break
+        lines.pop(0)
+    return lines[::-1] if from_end else lines
+
+
+def trim_context_echo(edited: str, context_before: str = "", context_after: str = "") -> str:
+    """
+    Drops sentences at the start/end of an edited chunk that merely repeat the
+    read-only context (or the neighbouring chunk's edited tail) it was shown.
+    """
+    before = {_normalize_text(sentence) for sentence in _sentences(context_before)}
+    after = {_normalize_text(sentence) for sentence in _sentences(context_after)}
+    lines = _trim_echo(edited.strip().split("\n"), before)
+    lines = _trim_echo(lines, after, from_end=True)
+    return "\n".join(lines).strip()
+
+
+def restore_heading(chunk: ManuscriptChunk, edited: str) -> str:
+    """Re-inserts the chunk's opening heading if the editor dropped it."""
+    first = chunk.text.strip().split("\n", 1)[0]
+    if not is_heading(first):
+        return edited
+    if _normalize_text(edited.strip().split("\n", 1)[0]).strip("*# ") == _normalize_text(first).strip("*# "):
+        return edited
+    return f"{first}\n{edited.strip()}"
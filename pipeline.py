@@ -1,24 +1,160 @@
 # pipeline.py
+import asyncio
 import json
-from typing import Any, Dict, List, Optional, Tuple
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Collection, Dict, Iterator, List, Optional, Tuple
 
+import numpy as np
 from langchain_core.output_parsers import StrOutputParser
 
 from questionnaire import UserProfile
-from llm_config import get_llm
-from rag_store import get_vectorstore
-from prompts import plan_prompt, draft_prompt, edit_prompt, critique_prompt, rewrite_prompt
+from async_utils import iterate_sync, run_sync
+from checkpoints import SessionCheckpoint
+from llm_config import EMBEDDING_MODEL, embeddings, get_llm
+from llm_cache import stream_through_cache
+from rag_store import (
+    fetch_with_vectors,
+    get_sparse_index,
+    get_vectorstore,
+    search_with_vectors,
+    vectorstore_version,
+)
+from rerank import mmr_select, reciprocal_rank_fusion
+from shelves import route_shelves
+from rag_cache import RAG_CACHE_ENABLED, normalize_query, query_embeddings, retrieval_results
+from plan_cache import get_plan_cache, profile_text
+from tracing import SessionTrace, record, stage, traced
+from manuscript import (
+    ManuscriptChunk,
+    OutlineSection,
+    extract_plan_title,
+    locate_passages,
+    parse_plan_outline,
+    restore_heading,
+    split_paragraphs,
+    split_sections,
+    trim_context_echo,
+)
+from prompts import (
+    plan_prompt,
+    adapt_plan_prompt,
+    draft_prompt,
+    draft_chapter_prompt,
+    edit_prompt,
+    edit_section_prompt,
+    critique_prompt,
+    rewrite_prompt,
+    patch_rewrite_prompt,
+)
 
 parser = StrOutputParser()
 
 # Retrieval tuning
 RAG_TOP_K = 3  # final number of chunks injected into the prompt
-RAG_CANDIDATE_K = 10  # initial pool for filtering
+RAG_CANDIDATE_K = int(os.getenv("RAG_CANDIDATE_K", "200"))  # pool the reranker picks from
 RAG_SCORE_THRESHOLD = 0.4  # lower (closer) is better for Chroma distances
+# MMR reranking: 1.0 ranks by relevance only, lower trades relevance for variety.
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_MAX_PER_TITLE = int(os.getenv("RAG_MAX_PER_TITLE", "2"))  # 0 = no cap
+# Hybrid retrieval fuses BM25 hits with a smaller dense pool by reciprocal rank fusion.
+RAG_HYBRID = os.getenv("RAG_HYBRID", "1") == "1"
+RAG_HYBRID_DENSE_K = int(os.getenv("RAG_HYBRID_DENSE_K", "50"))
+RAG_SPARSE_K = int(os.getenv("RAG_SPARSE_K", "50"))
+# Search only the catalog shelves that fit the reader (shelves.py), falling back to everything.
+RAG_PARTITIONS = os.getenv("RAG_PARTITIONS", "1") == "1"
+
+# Drafting: "chapters" drafts outline sections concurrently, "single" makes one call.
+DRAFT_MODE = os.getenv("DRAFT_MODE", "chapters")
+DRAFT_MAX_WORKERS = int(os.getenv("DRAFT_MAX_WORKERS", "4"))
+
+# Streaming: flush buffered tokens once either limit is reached.
+DELTA_MAX_CHARS = int(os.getenv("DELTA_MAX_CHARS", "200"))
+DELTA_MAX_INTERVAL = float(os.getenv("DELTA_MAX_INTERVAL", "0.25"))
+
+# Editing: "sections" edits drafts longer than EDIT_CHUNK_MAX_CHARS in heading-delimited
+# chunks concurrently, "single" always sends the whole draft in one call.
+EDIT_MODE = os.getenv("EDIT_MODE", "sections")
+EDIT_CHUNK_MAX_CHARS = int(os.getenv("EDIT_CHUNK_MAX_CHARS", "12000"))
+EDIT_CHUNK_OVERLAP_PARAGRAPHS = int(os.getenv("EDIT_CHUNK_OVERLAP_PARAGRAPHS", "1"))
+EDIT_MAX_WORKERS = int(os.getenv("EDIT_MAX_WORKERS", "4"))
+
+# Micro rewrites: "patch" rewrites only the paragraphs the critique's evidence points at,
+# "full" sends the whole manuscript back. Patch mode falls back to full when nothing is located.
+REWRITE_MODE = os.getenv("REWRITE_MODE", "patch")
+PATCH_CONTEXT_PARAGRAPHS = int(os.getenv("PATCH_CONTEXT_PARAGRAPHS", "1"))
+PATCH_MAX_PARAGRAPHS = int(os.getenv("PATCH_MAX_PARAGRAPHS", "8"))
+PATCH_MAX_WORKERS = int(os.getenv("PATCH_MAX_WORKERS", "4"))
 
 def estimate_words(pages: int, words_per_page: int = 350) -> int:
     return pages * words_per_page
 
+async def abatch_deltas(
+    chunks: AsyncIterator[str],
+    max_chars: int = DELTA_MAX_CHARS,
+    max_interval: float = DELTA_MAX_INTERVAL,
+) -> AsyncIterator[str]:
+    """
+    Groups streamed tokens so callers emit one frame per batch instead of per token.
+    A batch is flushed when it reaches `max_chars` or `max_interval` seconds have passed.
+    """
+    buffer: List[str] = []
+    size = 0
+    last_flush = time.monotonic()
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        buffer.append(chunk)
+        size += len(chunk)
+        now = time.monotonic()
+        if size >= max_chars or now - last_flush >= max_interval:
+            yield "".join(buffer)
+            buffer, size, last_flush = [], 0, now
+    if buffer:
+        yield "".join(buffer)
+
+def embed_query(query: str) -> List[float]:
+    """
+    Query embedding, served from the in-process cache when the same query repeats.
+    """
+    if not RAG_CACHE_ENABLED:
+        return embeddings.embed_query(query)
+    key = (EMBEDDING_MODEL, normalize_query(query))
+    vector = query_embeddings.get(key)
+    if vector is None:
+        vector = embeddings.embed_query(query)
+        query_embeddings.put(key, vector)
+    return vector
+
+def _retrieval_candidates(
+    db: Any, query: str, vector: List[float], shelves: Optional[List[str]] = None
+) -> Tuple[List[Any], np.ndarray, Optional[np.ndarray], np.ndarray]:
+    """
+    (documents, embeddings, relevance for MMR or None for cosine, eligibility mask).
+    Dense-only candidates are eligible when they clear RAG_SCORE_THRESHOLD; in hybrid
+    mode every BM25 hit is too, and relevance is the normalised fused RRF score.
+    """
+    sparse = get_sparse_index() if RAG_HYBRID else None
+    if sparse is None:
+        docs, distances, candidates = search_with_vectors(db, vector, RAG_CANDIDATE_K, shelves)
+        return docs, candidates, None, distances <= RAG_SCORE_THRESHOLD
+
+    docs, distances, candidates = search_with_vectors(db, vector, RAG_HYBRID_DENSE_K, shelves)
+    sparse_ids = [chunk_id for chunk_id, _ in sparse.search(query, RAG_SPARSE_K, shelves)]
+    fused = reciprocal_rank_fusion([[doc.id for doc in docs], sparse_ids])
+    dense_ids = {doc.id for doc in docs}
+    extra_docs, extra_candidates = fetch_with_vectors(db, [chunk_id for chunk_id in sparse_ids if chunk_id not in dense_ids])
+    if extra_docs:
+        docs = docs + extra_docs
+        candidates = np.concatenate([candidates, extra_candidates]) if len(candidates) else extra_candidates
+        distances = np.concatenate([distances, np.full(len(extra_docs), np.inf, dtype=np.float32)])
+    relevance = np.asarray([fused.get(doc.id, 0.0) for doc in docs], dtype=np.float32)
+    relevance /= relevance.max() if len(relevance) and relevance.max() > 0 else 1.0
+    hits = set(sparse_ids)
+    eligible = (distances <= RAG_SCORE_THRESHOLD) | np.asarray([doc.id in hits for doc in docs], dtype=bool)
+    return docs, candidates, relevance, eligible
+
 def get_rag_context(profile: UserProfile, extra_query: Optional[str] = None, k: int = 2) -> str:
     """
     Use the vector DB to grab a few relevant passages for inspiration.
@@ -39,68 +175,292 @@ def get_rag_context(profile: UserProfile, extra_query: Optional[str] = None, k:
         query_parts.append(extra_query)
 
     query = " | ".join([q for q in query_parts if q])
-    # Fetch a wider pool, then keep only high-similarity and diverse sources.
-    scored = db.similarity_search_with_score(query, k=RAG_CANDIDATE_K)
+    shelves = route_shelves(profile) if RAG_PARTITIONS else None
+    result_key = (normalize_query(query), k, tuple(shelves or ()), vectorstore_version())
+    if RAG_CACHE_ENABLED:
+        cached = retrieval_results.get(result_key)
+        if cached is not None:
+            return cached
+
+    # Fetch a wide pool, then pick relevant but mutually different chunks with MMR.
+    vector = embed_query(query)
+    max_chunks = k or RAG_TOP_K
+    docs, candidates, relevance, eligible = _retrieval_candidates(db, query, vector, shelves)
+    if shelves is not None and len(docs) < max_chunks:
+        # The reader's shelves are (nearly) empty in this store; search everything.
+        docs, candidates, relevance, eligible = _retrieval_candidates(db, query, vector)
+    # Prefer chunks that clear the threshold; when too few do, rank the whole pool.
+    if eligible.sum() < max_chunks:
+        eligible = None
+    picks = mmr_select(
+        vector,
+        candidates,
+        max_chunks,
+        lambda_mult=RAG_MMR_LAMBDA,
+        titles=[doc.metadata.get("title") for doc in docs],
+        max_per_title=RAG_MAX_PER_TITLE,
+        eligible=eligible,
+        relevance=relevance,
+    )
+    chosen = [docs[i] for i in picks]
+
+    context = "\n\n".join([doc.page_content for doc in chosen])
+    if RAG_CACHE_ENABLED:
+        retrieval_results.put(result_key, context)
+    return context
+
+async def aget_rag_context(profile: UserProfile, extra_query: Optional[str] = None, k: int = 2) -> str:
+    # The vector store client is synchronous; keep it off the event loop.
+    return await asyncio.to_thread(get_rag_context, profile, extra_query, k)
 
-    filtered: List[Any] = []
-    for doc, score in scored:
-        if score <= RAG_SCORE_THRESHOLD:
-            filtered.append(doc)
+# --- STEP 1: PLANNING ---
 
-    # Fallback to top candidates if nothing cleared the threshold.
-    if not filtered:
-        filtered = [doc for doc, _ in scored[:k or RAG_TOP_K]]
+async def arun_planning(profile: UserProfile) -> str:
+    llm = get_llm(temperature=0.7, stage="plan")
+    chain = plan_prompt | llm | parser
+    return await chain.ainvoke(vars(profile))
 
-    # Prefer diversity by book title and cap total chunks.
-    chosen: List[Any] = []
-    seen_titles = set()
-    max_chunks = k or RAG_TOP_K
-    for doc in filtered:
-        title = doc.metadata.get("title") if hasattr(doc, "metadata") else None
-        if title and title in seen_titles and len(chosen) >= max_chunks:
-            continue
-        chosen.append(doc)
-        if title:
-            seen_titles.add(title)
-        if len(chosen) >= max_chunks:
-            break
+def astream_planning(profile: UserProfile) -> AsyncIterator[str]:
+    llm = get_llm(temperature=0.7, stage="plan")
+    chain = plan_prompt | stream_through_cache(llm) | parser
+    return abatch_deltas(chain.astream(vars(profile)))
 
-    return "\n\n".join([doc.page_content for doc in chosen])
+def astream_plan_adaptation(profile: UserProfile, cached_plan: str) -> AsyncIterator[str]:
+    llm = get_llm(temperature=0.3, stage="plan")
+    chain = adapt_plan_prompt | stream_through_cache(llm) | parser
+    return abatch_deltas(chain.astream({**vars(profile), "cached_plan": cached_plan}))
 
-# --- STEP 1: PLANNING ---
+async def aiter_plan_events(profile: UserProfile) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streams the plan as "delta" events. With the plan cache enabled, a plan made for
+    a near-identical profile is reused (or lightly adapted) instead of planning anew,
+    and freshly planned outlines are stored for later profiles.
+    """
+    cache = get_plan_cache()
+    embedding: Optional[List[float]] = None
+    if cache is not None:
+        try:
+            embedding = await asyncio.to_thread(embeddings.embed_query, profile_text(profile))
+            match = await asyncio.to_thread(cache.lookup, profile, embedding)
+        except Exception as exc:
+            print(f"⚠️  Plan cache unavailable, planning from scratch: {exc}")
+            cache, match = None, None
+        if match is not None and not match.adapt:
+            record(cache_hits=1)
+            yield {"type": "status", "message": f"Reusing a plan made for a similar reader (similarity {match.similarity:.2f})."}
+            yield {"type": "delta", "stage": "plan", "content": match.plan}
+            return
+        if match is not None:
+            record(adapted_hits=1)
+            yield {"type": "status", "message": f"Adapting a plan made for a similar reader (similarity {match.similarity:.2f})..."}
+            async for delta in astream_plan_adaptation(profile, match.plan):
+                yield {"type": "delta", "stage": "plan", "content": delta}
+            return
+
+    pieces: List[str] = []
+    async for delta in astream_planning(profile):
+        pieces.append(delta)
+        yield {"type": "delta", "stage": "plan", "content": delta}
+    if cache is not None and embedding is not None:
+        await asyncio.to_thread(cache.store, profile, embedding, "".join(pieces))
 
 def run_planning(profile: UserProfile) -> str:
-    llm = get_llm(temperature=0.7)
-    chain = plan_prompt | llm | parser
-    return chain.invoke(vars(profile))
-
-# --- STEP 2: DRAFTING (with RAG context) ---
+    return run_sync(arun_planning(profile))
 
-def run_drafting(profile: UserProfile, plan: str) -> str:
-    llm = get_llm(temperature=0.9)
-    chain = draft_prompt | llm | parser
+def stream_planning(profile: UserProfile) -> Iterator[str]:
+    return iterate_sync(astream_planning(profile))
 
-    approx_words = estimate_words(profile.length_in_pages)
-    rag_context = get_rag_context(profile, extra_query="literary style inspiration", k=5)
+# --- STEP 2: DRAFTING (with RAG context) ---
 
-    variables: Dict[str, object] = {
+async def _draft_variables(profile: UserProfile, plan: str) -> Dict[str, object]:
+    return {
         **vars(profile),
         "plan": plan,
-        "approx_word_count": approx_words,
-        "rag_context": rag_context,
+        "approx_word_count": estimate_words(profile.length_in_pages),
+        "rag_context": await aget_rag_context(profile, extra_query="literary style inspiration", k=5),
     }
-    return chain.invoke(variables)
+
+def chapter_sections_for(plan: str, mode: Optional[str] = None) -> List[OutlineSection]:
+    """
+    Outline sections to draft concurrently, or [] when drafting should be a single call
+    (single mode, or an outline we could not parse into at least two sections).
+    """
+    if (mode or DRAFT_MODE) != "chapters":
+        return []
+    sections = parse_plan_outline(plan)
+    return sections if len(sections) >= 2 else []
+
+async def aiter_chapter_drafts(
+    profile: UserProfile,
+    plan: str,
+    sections: List[OutlineSection],
+    max_workers: int = DRAFT_MAX_WORKERS,
+    skip: Collection[int] = (),
+) -> AsyncIterator[Tuple[OutlineSection, str]]:
+    """
+    Drafts every outline section concurrently, at most `max_workers` at a time.
+    Sections whose index is in `skip` (already drafted) are left out.
+    Yields (section, text) pairs in completion order.
+    """
+    llm = get_llm(temperature=0.9, stage="draft")
+    chain = draft_chapter_prompt | llm | parser
+
+    shared = await _draft_variables(profile, plan)
+    words_per_chapter = max(150, int(shared["approx_word_count"]) // len(sections))
+    limit = asyncio.Semaphore(max(1, max_workers))
+
+    def chapter_variables(section: OutlineSection) -> Dict[str, object]:
+        previous = sections[section.index - 1] if section.index > 0 else None
+        following = sections[section.index + 1] if section.index + 1 < len(sections) else None
+        return {
+            **shared,
+            "approx_word_count": words_per_chapter,
+            "chapter_number": section.index + 1,
+            "chapter_count": len(sections),
+            "chapter_heading": section.heading,
+            "chapter_notes": section.notes or "none",
+            "previous_summary": f"{previous.heading}: {previous.summary()}" if previous else "none (this opens the book)",
+            "next_summary": f"{following.heading}: {following.summary()}" if following else "none (this closes the book)",
+        }
+
+    async def draft_one(section: OutlineSection) -> Tuple[OutlineSection, str]:
+        async with limit:
+            return section, await chain.ainvoke(chapter_variables(section))
+
+    tasks = [asyncio.ensure_future(draft_one(section)) for section in sections if section.index not in skip]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def iter_chapter_drafts(
+    profile: UserProfile,
+    plan: str,
+    sections: List[OutlineSection],
+    max_workers: int = DRAFT_MAX_WORKERS,
+    skip: Collection[int] = (),
+) -> Iterator[Tuple[OutlineSection, str]]:
+    return iterate_sync(aiter_chapter_drafts(profile, plan, sections, max_workers, skip))
+
+def stitch_chapters(plan: str, sections: List[OutlineSection], chapters: Dict[int, str]) -> str:
+    """
+    Joins drafted chapters in outline order under the plan's title.
+    """
+    parts = [extract_plan_title(plan)]
+    parts.extend(chapters[section.index].strip() for section in sections)
+    return "\n\n".join(part for part in parts if part)
+
+async def arun_drafting(profile: UserProfile, plan: str, mode: Optional[str] = None) -> str:
+    sections = chapter_sections_for(plan, mode)
+    if sections:
+        chapters = {section.index: text async for section, text in aiter_chapter_drafts(profile, plan, sections)}
+        return stitch_chapters(plan, sections, chapters)
+
+    llm = get_llm(temperature=0.9, stage="draft")
+    chain = draft_prompt | llm | parser
+    return await chain.ainvoke(await _draft_variables(profile, plan))
+
+async def astream_drafting(profile: UserProfile, plan: str) -> AsyncIterator[str]:
+    """
+    Single-call drafting with incremental output; chapter mode reports per chapter instead.
+    """
+    llm = get_llm(temperature=0.9, stage="draft")
+    chain = draft_prompt | stream_through_cache(llm) | parser
+    variables = await _draft_variables(profile, plan)
+    async for delta in abatch_deltas(chain.astream(variables)):
+        yield delta
+
+def run_drafting(profile: UserProfile, plan: str, mode: Optional[str] = None) -> str:
+    return run_sync(arun_drafting(profile, plan, mode))
+
+def stream_drafting(profile: UserProfile, plan: str) -> Iterator[str]:
+    return iterate_sync(astream_drafting(profile, plan))
 
 # --- STEP 3: EDITING ---
 
-def run_editing(profile: UserProfile, draft: str) -> str:
-    llm = get_llm(temperature=0.6)
+async def arun_editing(profile: UserProfile, draft: str) -> str:
+    llm = get_llm(temperature=0.6, stage="edit")
     chain = edit_prompt | llm | parser
-    return chain.invoke({
+    return await chain.ainvoke({
         **vars(profile),
         "draft": draft,
     })
 
+def astream_editing(profile: UserProfile, draft: str) -> AsyncIterator[str]:
+    llm = get_llm(temperature=0.6, stage="edit")
+    chain = edit_prompt | stream_through_cache(llm) | parser
+    return abatch_deltas(chain.astream({
+        **vars(profile),
+        "draft": draft,
+    }))
+
+def edit_chunks_for(draft: str, mode: str = EDIT_MODE) -> List[ManuscriptChunk]:
+    """
+    Chunks to edit separately, or [] when the draft should be edited in one call.
+    """
+    if mode != "sections" or len(draft) <= EDIT_CHUNK_MAX_CHARS:
+        return []
+    chunks = split_sections(draft, EDIT_CHUNK_MAX_CHARS, EDIT_CHUNK_OVERLAP_PARAGRAPHS)
+    return chunks if len(chunks) > 1 else []
+
+async def aiter_section_edits(
+    profile: UserProfile,
+    chunks: List[ManuscriptChunk],
+    max_workers: int = EDIT_MAX_WORKERS,
+) -> AsyncIterator[Tuple[ManuscriptChunk, str]]:
+    """
+    Edits the chunks concurrently (at most `max_workers` in flight) and yields
+    (chunk, edited_text) as each finishes. Context echoes and dropped headings
+    are repaired per chunk; stitch_edited_chunks handles the seams.
+    """
+    llm = get_llm(temperature=0.6, stage="edit")
+    chain = edit_section_prompt | llm | parser
+    limit = asyncio.Semaphore(max(1, max_workers))
+
+    async def edit_one(chunk: ManuscriptChunk) -> Tuple[ManuscriptChunk, str]:
+        async with limit:
+            edited = await chain.ainvoke({
+                **vars(profile),
+                "draft": chunk.text.strip(),
+                "section_number": chunk.index + 1,
+                "section_count": len(chunks),
+                "context_before": chunk.context_before or "(start of manuscript)",
+                "context_after": chunk.context_after or "(end of manuscript)",
+            })
+        edited = trim_context_echo(edited, chunk.context_before, chunk.context_after)
+        return chunk, restore_heading(chunk, edited) if edited else chunk.text.strip()
+
+    tasks = [asyncio.ensure_future(edit_one(chunk)) for chunk in chunks]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+def stitch_edited_chunks(chunks: List[ManuscriptChunk], edited: Dict[int, str]) -> str:
+    """
+    Joins edited chunks in order with their original separators, dropping any
+    opening sentences that repeat the previous chunk's edited ending.
+    """
+    parts: List[str] = []
+    previous = ""
+    for chunk in chunks:
+        text = edited.get(chunk.index, chunk.text.strip())
+        if previous:
+            text = trim_context_echo(text, context_before=previous.rsplit("\n", 1)[-1]) or text
+        parts.append(chunk.wrap(text))
+        previous = text
+    return "".join(parts)
+
+def run_editing(profile: UserProfile, draft: str) -> str:
+    return run_sync(arun_editing(profile, draft))
+
+def stream_editing(profile: UserProfile, draft: str) -> Iterator[str]:
+    return iterate_sync(astream_editing(profile, draft))
+
 # --- STEP 4: CRITIQUE + MICRO REWRITE ---
 
 def ensure_list(value: Any) -> List[str]:
@@ -152,41 +512,124 @@ def format_critique_report(critique: Dict[str, Any], round_number: int) -> str:
         f"Action Items:\n{actions}\n"
     ).strip()
 
-def run_structured_critique(profile: UserProfile, final_text: str) -> Dict[str, Any]:
-    llm = get_llm(temperature=0.5)
+async def arun_structured_critique(profile: UserProfile, final_text: str) -> Dict[str, Any]:
+    llm = get_llm(temperature=0.5, stage="critique")
     chain = critique_prompt | llm | parser
-    raw_response = chain.invoke({
+    raw_response = await chain.ainvoke({
         **vars(profile),
         "final_text": final_text,
     })
     critique = parse_critique_response(raw_response)
     return critique
 
-def run_micro_rewrite(profile: UserProfile, current_text: str, weaknesses: List[str]) -> str:
-    llm = get_llm(temperature=0.5)
-    chain = rewrite_prompt | llm | parser
+def run_structured_critique(profile: UserProfile, final_text: str) -> Dict[str, Any]:
+    return run_sync(arun_structured_critique(profile, final_text))
+
+def _rewrite_variables(profile: UserProfile, current_text: str, weaknesses: List[str]) -> Dict[str, object]:
     focus_block = "\n".join(f"- {w}" for w in weaknesses) if weaknesses else "none"
-    return chain.invoke({
+    return {
         **vars(profile),
         "current_text": current_text,
         "critique_focus": focus_block,
-    })
+    }
+
+async def arun_micro_rewrite(profile: UserProfile, current_text: str, weaknesses: List[str]) -> str:
+    llm = get_llm(temperature=0.5, stage="rewrite")
+    chain = rewrite_prompt | llm | parser
+    return await chain.ainvoke(_rewrite_variables(profile, current_text, weaknesses))
+
+def astream_micro_rewrite(profile: UserProfile, current_text: str, weaknesses: List[str]) -> AsyncIterator[str]:
+    llm = get_llm(temperature=0.5, stage="rewrite")
+    chain = rewrite_prompt | stream_through_cache(llm) | parser
+    return abatch_deltas(chain.astream(_rewrite_variables(profile, current_text, weaknesses)))
+
+def run_micro_rewrite(profile: UserProfile, current_text: str, weaknesses: List[str]) -> str:
+    return run_sync(arun_micro_rewrite(profile, current_text, weaknesses))
+
+def stream_micro_rewrite(profile: UserProfile, current_text: str, weaknesses: List[str]) -> Iterator[str]:
+    return iterate_sync(astream_micro_rewrite(profile, current_text, weaknesses))
+
+async def arun_patch_rewrite(
+    profile: UserProfile,
+    current_text: str,
+    weaknesses: List[str],
+    evidence_snippets: List[str],
+) -> Tuple[str, int]:
+    """
+    Rewrites only the paragraphs the critique's evidence points at, concurrently,
+    and splices them back; every other byte of the text is left untouched.
+    Returns (new_text, paragraphs_rewritten); 0 means nothing could be located.
+    """
+    pieces = split_paragraphs(current_text)
+    targets = locate_passages(pieces, evidence_snippets)
+    if not targets:
+        return current_text, 0
+    chosen = sorted(targets)[:PATCH_MAX_PARAGRAPHS]
+
+    llm = get_llm(temperature=0.5, stage="rewrite")
+    chain = patch_rewrite_prompt | llm | parser
+    limit = asyncio.Semaphore(max(1, PATCH_MAX_WORKERS))
+    span = 2 * PATCH_CONTEXT_PARAGRAPHS
+
+    async def rewrite_one(idx: int) -> Tuple[int, str]:
+        before = "".join(pieces[max(0, idx - span):idx]).strip()
+        after = "".join(pieces[idx + 1:idx + 1 + span]).strip()
+        async with limit:
+            revised = await chain.ainvoke({
+                **_rewrite_variables(profile, "", weaknesses),
+                "passage": pieces[idx],
+                "context_before": before or "(start of manuscript)",
+                "context_after": after or "(end of manuscript)",
+                "evidence": "\n".join(f"- {snippet}" for snippet in targets[idx]),
+            })
+        # Paragraphs are single lines in split_paragraphs output: collapse whitespace
+        # within each paragraph, and if the passage came back as several, join them
+        # with the separator this manuscript uses between paragraphs.
+        paragraphs = [" ".join(part.split()) for part in re.split(r"\n\s*", revised.strip())]
+        neighbours = pieces[idx + 1:idx + 2] + pieces[max(0, idx - 1):idx]
+        separator = next((piece for piece in neighbours if piece), "\n\n")
+        revised = separator.join(part for part in paragraphs if part)
+        return idx, revised or pieces[idx]
+
+    for idx, revised in await asyncio.gather(*(rewrite_one(idx) for idx in chosen)):
+        pieces[idx] = revised
+    return "".join(pieces), len(chosen)
+
+def run_patch_rewrite(
+    profile: UserProfile,
+    current_text: str,
+    weaknesses: List[str],
+    evidence_snippets: List[str],
+) -> Tuple[str, int]:
+    return run_sync(arun_patch_rewrite(profile, current_text, weaknesses, evidence_snippets))
 
 def should_stop_revision(score: float, weaknesses: List[str], threshold: float) -> bool:
     no_real_weaknesses = not weaknesses or all(w.lower() == "none" for w in weaknesses)
     return score >= threshold or no_real_weaknesses
 
-def refine_with_critique(
+async def aiter_refine_with_critique(
     profile: UserProfile,
     edited_text: str,
     max_rounds: int = 2,
     quality_threshold: float = 8.5,
-) -> Tuple[str, str]:
+    start_round: int = 0,
+    prior_reports: Optional[List[str]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming form of the critique/rewrite loop. Yields event dicts:
+        {"type": "critique_round", "round", "score"} after each critique,
+        {"type": "status", "message"} when flagged paragraphs were patched in place,
+        {"type": "delta", "stage": "rewrite", "round", "content"} while rewriting the whole text,
+        {"type": "revised", "round", "text", "reports"} after each rewrite,
+        {"type": "refined", "final_text", "critique"} once at the end.
+    `start_round`/`prior_reports` continue a loop from a saved "revised" event.
+    """
     current_text = edited_text
-    critique_reports: List[str] = []
+    critique_reports: List[str] = list(prior_reports or [])
 
-    for round_idx in range(max_rounds):
-        critique = run_structured_critique(profile, current_text)
+    for round_idx in range(start_round, max_rounds):
+        with stage("critique", round=round_idx + 1):
+            critique = await arun_structured_critique(profile, current_text)
         critiques_list = ensure_list(critique.get("weaknesses"))
         try:
             score = float(critique.get("quality_score", 0))
@@ -194,6 +637,7 @@ def refine_with_critique(
             score = 0.0
 
         critique_reports.append(format_critique_report(critique, round_idx + 1))
+        yield {"type": "critique_round", "round": round_idx + 1, "score": score}
 
         normalized_weaknesses = [
             w.strip() for w in critiques_list if w.strip() and w.strip().lower() != "none"
@@ -202,27 +646,227 @@ def refine_with_critique(
         if round_idx == max_rounds - 1 or should_stop_revision(score, normalized_weaknesses, quality_threshold):
             break
 
-        current_text = run_micro_rewrite(profile, current_text, normalized_weaknesses)
+        with stage("rewrite", round=round_idx + 1):
+            patched = 0
+            if REWRITE_MODE == "patch":
+                evidence = [
+                    e.strip() for e in ensure_list(critique.get("evidence_snippets"))
+                    if e.strip() and e.strip().lower() != "none"
+                ]
+                current_text, patched = await arun_patch_rewrite(profile, current_text, normalized_weaknesses, evidence)
+                if patched:
+                    yield {"type": "status", "message": f"Rewrote {patched} flagged passages."}
+
+            if not patched:
+                pieces: List[str] = []
+                async for delta in astream_micro_rewrite(profile, current_text, normalized_weaknesses):
+                    pieces.append(delta)
+                    yield {"type": "delta", "stage": "rewrite", "round": round_idx + 1, "content": delta}
+                current_text = "".join(pieces)
+        yield {"type": "revised", "round": round_idx + 1, "text": current_text, "reports": list(critique_reports)}
+
+    yield {"type": "refined", "final_text": current_text, "critique": "\n\n".join(critique_reports)}
+
+def iter_refine_with_critique(
+    profile: UserProfile,
+    edited_text: str,
+    max_rounds: int = 2,
+    quality_threshold: float = 8.5,
+) -> Iterator[Dict[str, Any]]:
+    return iterate_sync(aiter_refine_with_critique(profile, edited_text, max_rounds, quality_threshold))
 
-    combined_report = "\n\n".join(critique_reports)
+async def arefine_with_critique(
+    profile: UserProfile,
+    edited_text: str,
+    max_rounds: int = 2,
+    quality_threshold: float = 8.5,
+) -> Tuple[str, str]:
+    current_text = edited_text
+    combined_report = ""
+    async for event in aiter_refine_with_critique(profile, edited_text, max_rounds, quality_threshold):
+        if event["type"] == "refined":
+            current_text = event["final_text"]
+            combined_report = event["critique"]
     return current_text, combined_report
 
+def refine_with_critique(
+    profile: UserProfile,
+    edited_text: str,
+    max_rounds: int = 2,
+    quality_threshold: float = 8.5,
+) -> Tuple[str, str]:
+    return run_sync(arefine_with_critique(profile, edited_text, max_rounds, quality_threshold))
+
 # --- FULL PIPELINE ---
 
-def generate_book_for_user(profile: UserProfile) -> Dict[str, str]:
+RESULT_STAGES = ("plan", "draft", "final_text", "critique")
+
+async def aiter_book_generation(
+    profile: UserProfile,
+    checkpoint: Optional[SessionCheckpoint] = None,
+    trace: Optional[SessionTrace] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Runs plan -> draft -> edit -> iterative critique/rewrite and yields event dicts
+    ("status", "delta", "chapter", then "plan", "draft", "final_text", "critique"
+    carrying each finished result).
+    With a checkpoint, finished stages are restored instead of regenerated and
+    every new result is saved as soon as it exists.
+    With a trace, every stage that actually runs adds a record to it.
+    """
+    stages = _aiter_book_stages(profile, checkpoint)
+    async for event in (traced(stages, trace) if trace is not None else stages):
+        yield event
+
+async def _aiter_book_stages(
+    profile: UserProfile,
+    checkpoint: Optional[SessionCheckpoint],
+) -> AsyncIterator[Dict[str, Any]]:
+    def restored(stage: str) -> bool:
+        return checkpoint is not None and checkpoint.has(stage)
+
+    # Plan
+    if restored("plan"):
+        plan = checkpoint.get("plan")
+        yield {"type": "status", "message": "Restored plan from checkpoint."}
+    else:
+        yield {"type": "status", "message": "Planning outline..."}
+        pieces: List[str] = []
+        with stage("plan"):
+            async for event in aiter_plan_events(profile):
+                if event["type"] == "delta":
+                    pieces.append(event["content"])
+                yield event
+        plan = "".join(pieces)
+        if checkpoint:
+            checkpoint.save("plan", plan)
+    yield {"type": "plan", "content": plan}
+
+    # Draft
+    if restored("draft"):
+        draft = checkpoint.get("draft")
+        yield {"type": "status", "message": "Restored draft from checkpoint."}
+    else:
+        sections = chapter_sections_for(plan)
+        if sections:
+            chapters = checkpoint.chapters() if checkpoint else {}
+            chapters = {index: text for index, text in chapters.items() if index < len(sections)}
+            remaining = len(sections) - len(chapters)
+            yield {"type": "status", "message": f"Drafting {remaining} chapters in parallel..."}
+            for index in sorted(chapters):
+                yield {"type": "chapter", "index": index, "title": sections[index].heading,
+                       "completed": len(chapters), "total": len(sections)}
+            with stage("draft"):
+                async for section, text in aiter_chapter_drafts(profile, plan, sections, skip=chapters.keys()):
+                    chapters[section.index] = text
+                    if checkpoint:
+                        checkpoint.save_chapter(section.index, text)
+                    yield {"type": "chapter", "index": section.index, "title": section.heading,
+                           "completed": len(chapters), "total": len(sections)}
+            draft = stitch_chapters(plan, sections, chapters)
+        else:
+            yield {"type": "status", "message": "Drafting manuscript..."}
+            pieces = []
+            with stage("draft"):
+                async for delta in astream_drafting(profile, plan):
+                    pieces.append(delta)
+                    yield {"type": "delta", "stage": "draft", "content": delta}
+            draft = "".join(pieces)
+        if checkpoint:
+            checkpoint.save("draft", draft)
+    yield {"type": "draft", "content": draft}
+
+    # Edit
+    if restored("edited"):
+        edited_text = checkpoint.get("edited")
+        yield {"type": "status", "message": "Restored edited text from checkpoint."}
+    else:
+        yield {"type": "status", "message": "Editing for polish..."}
+        chunks = edit_chunks_for(draft)
+        with stage("edit"):
+            if chunks:
+                yield {"type": "status", "message": f"Editing {len(chunks)} sections in parallel..."}
+                edited_chunks: Dict[int, str] = {}
+                async for chunk, text in aiter_section_edits(profile, chunks):
+                    edited_chunks[chunk.index] = text
+                    yield {"type": "status", "message": f"Edited section {len(edited_chunks)}/{len(chunks)}."}
+                edited_text = stitch_edited_chunks(chunks, edited_chunks)
+                yield {"type": "delta", "stage": "edit", "content": edited_text}
+            else:
+                pieces = []
+                async for delta in astream_editing(profile, draft):
+                    pieces.append(delta)
+                    yield {"type": "delta", "stage": "edit", "content": delta}
+                edited_text = "".join(pieces)
+        if checkpoint:
+            checkpoint.save("edited", edited_text)
+
+    # Critique / rewrite
+    if restored("final_text") and restored("critique"):
+        final_text, critique = checkpoint.get("final_text"), checkpoint.get("critique")
+        yield {"type": "status", "message": "Restored critique results from checkpoint."}
+    else:
+        progress = checkpoint.refine_progress() if checkpoint else None
+        start_round = progress["next_round"] if progress else 0
+        yield {"type": "status", "message": "Iterating with critique loop..."}
+        final_text, critique = edited_text, ""
+        async for event in aiter_refine_with_critique(
+            profile,
+            progress["text"] if progress else edited_text,
+            start_round=start_round,
+            prior_reports=progress["reports"] if progress else None,
+        ):
+            event_type = event["type"]
+            if event_type == "refined":
+                final_text, critique = event["final_text"], event["critique"]
+            elif event_type == "revised":
+                if checkpoint:
+                    checkpoint.save_refine_round(event["round"], event["text"], event["reports"])
+            elif event_type == "critique_round":
+                yield {"type": "status", "message": f"Critique round {event['round']} scored {event['score']:.1f}/10"}
+            else:
+                yield event
+        if checkpoint:
+            checkpoint.save("final_text", final_text)
+            checkpoint.save("critique", critique)
+    yield {"type": "final_text", "content": final_text}
+
+    yield {"type": "status", "message": "Summarizing critique insights..."}
+    yield {"type": "critique", "content": critique}
+
+async def generate_book_for_user_async(
+    profile: UserProfile,
+    checkpoint: Optional[SessionCheckpoint] = None,
+    trace: Optional[SessionTrace] = None,
+) -> Dict[str, str]:
     """
     High-level function that does:
         plan -> draft -> edit -> iterative critique/rewrite
     Returns all intermediate results.
+    Pass a trace to collect per-stage timings and token usage; the caller writes it.
     """
-    plan = run_planning(profile)
-    draft = run_drafting(profile, plan)
-    edited_text = run_editing(profile, draft)
-    final_text, critique_report = refine_with_critique(profile, edited_text)
+    results: Dict[str, str] = {}
+    async for event in aiter_book_generation(profile, checkpoint, trace):
+        if event["type"] in RESULT_STAGES:
+            results[event["type"]] = event["content"]
+    return results
 
-    return {
-        "plan": plan,
-        "draft": draft,
-        "final_text": final_text,
-        "critique": critique_report,
-    }
+def generate_book_for_user(
+    profile: UserProfile,
+    checkpoint: Optional[SessionCheckpoint] = None,
+    trace: Optional[SessionTrace] = None,
+) -> Dict[str, str]:
+    """
+    Synchronous wrapper around generate_book_for_user_async.
+    """
+    return run_sync(generate_book_for_user_async(profile, checkpoint, trace))
+
+async def resume_book_async(session_id: str) -> Dict[str, str]:
+    """
+    Continues a checkpointed session from its first unfinished stage.
+    """
+    checkpoint = SessionCheckpoint.load(session_id)
+    return await generate_book_for_user_async(checkpoint.profile, checkpoint)
+
+def resume_book(session_id: str) -> Dict[str, str]:
+    return run_sync(resume_book_async(session_id))
@@ -0,0 +1,192 @@
+"""
+Semantic cache of book plans keyed on profile similarity.
+
+Profiles are embedded as "field: value" text; a new profile reuses a stored plan
+when their cosine similarity clears PLAN_CACHE_REUSE_SIMILARITY, or gets a light
+adaptation of it when it only clears PLAN_CACHE_MIN_SIMILARITY. Candidates must
+ask for the same page count and be within PLAN_CACHE_MAX_AGE_GAP years of age,
+which embeddings do not capture reliably. Each entry serves at most
+PLAN_CACHE_MAX_REUSES profiles so books stay varied.
+
+Inspect with: python plan_cache.py [stats|clear]
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from questionnaire import UserProfile
+
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "0") == "1"
+PLAN_CACHE_PATH = Path(os.getenv("PLAN_CACHE_PATH", "llm_cache/plans.sqlite3"))
+PLAN_CACHE_REUSE_SIMILARITY = float(os.getenv("PLAN_CACHE_REUSE_SIMILARITY", "0.97"))
+PLAN_CACHE_MIN_SIMILARITY = float(os.getenv("PLAN_CACHE_MIN_SIMILARITY", "0.92"))
+PLAN_CACHE_MAX_REUSES = int(os.getenv("PLAN_CACHE_MAX_REUSES", "3"))
+PLAN_CACHE_MAX_AGE_GAP = int(os.getenv("PLAN_CACHE_MAX_AGE_GAP", "5"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    length_in_pages INTEGER NOT NULL,
+    age INTEGER NOT NULL,
+    profile_text TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    plan TEXT NOT NULL,
+    uses INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    last_used_at REAL
+);
+CREATE INDEX IF NOT EXISTS plans_length ON plans (length_in_pages);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def profile_text(profile: UserProfile) -> str:
+    return "\n".join(f"{name}: {value}" for name, value in vars(profile).items() if value not in ("", None))
+
+
+@dataclass
+class PlanMatch:
+    entry_id: int
+    plan: str
+    similarity: float
+
+    @property
+    def adapt(self) -> bool:
+        """
+        True when the match is close but not close enough to reuse verbatim.
+        """
+        return self.similarity < PLAN_CACHE_REUSE_SIMILARITY
+
+
+class PlanCache:
+    """
+    SQLite store of (profile embedding, plan) pairs with per-entry reuse counts.
+    """
+
+    def __init__(self, path: Path = PLAN_CACHE_PATH) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """
+        Connection that commits on success, rolls back on error and is always closed.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, conn: sqlite3.Connection, name: str) -> None:
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def lookup(self, profile: UserProfile, embedding: List[float]) -> Optional[PlanMatch]:
+        """
+        Claims the best eligible entry (least used, then most similar) and counts
+        the hit or miss. Claiming increments the entry's use count.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, embedding, plan, uses FROM plans "
+                "WHERE length_in_pages = ? AND ABS(age - ?) <= ? AND uses < ?",
+                (profile.length_in_pages, profile.age, PLAN_CACHE_MAX_AGE_GAP, PLAN_CACHE_MAX_REUSES),
+            ).fetchall()
+            # Entries embedded with a different model (other dimension) are ignored.
+            rows = [row for row in rows if len(row[1]) == query.nbytes]
+            best: Optional[Tuple[int, float, int, str]] = None
+            if rows:
+                matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                similarities = matrix @ query  # stored vectors are normalised
+                for (entry_id, _, plan, uses), similarity in zip(rows, similarities.tolist()):
+                    if similarity < PLAN_CACHE_MIN_SIMILARITY:
+                        continue
+                    rank = (uses, -similarity)
+                    if best is None or rank < (best[2], -best[1]):
+                        best = (entry_id, similarity, uses, plan)
+            if best is None:
+                self._count(conn, "misses")
+                return None
+            conn.execute("UPDATE plans SET uses = uses + 1, last_used_at = ? WHERE id = ?", (time.time(), best[0]))
+            self._count(conn, "hits_adapted" if best[1] < PLAN_CACHE_REUSE_SIMILARITY else "hits")
+        return PlanMatch(best[0], best[3], round(best[1], 4))
+
+    def store(self, profile: UserProfile, embedding: List[float], plan: str) -> None:
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO plans (length_in_pages, age, profile_text, embedding, plan, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (profile.length_in_pages, profile.age, profile_text(profile), vector.tobytes(), plan, time.time()),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, exhausted = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(uses >= ?), 0) FROM plans", (PLAN_CACHE_MAX_REUSES,)
+            ).fetchone()
+        hits, adapted, misses = counters.get("hits", 0), counters.get("hits_adapted", 0), counters.get("misses", 0)
+        lookups = hits + adapted + misses
+        return {
+            "hits": hits,
+            "adapted_hits": adapted,
+            "misses": misses,
+            "hit_rate": round((hits + adapted) / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "exhausted_entries": exhausted,
+        }
+
+    def clear(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM plans")
+            conn.execute("DELETE FROM counters")
+
+
+_plan_cache: Optional[PlanCache] = None
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """
+    Returns the shared plan cache, or None when PLAN_CACHE_ENABLED is off.
+    """
+    global _plan_cache
+    if not PLAN_CACHE_ENABLED:
+        return None
+    if _plan_cache is None:
+        _plan_cache = PlanCache()
+    return _plan_cache
+
+
+if __name__ == "__main__":
+    cache = PlanCache()
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        cache.clear()
+        print(f"🧹 Cleared {cache.path}")
+    else:
+        print(json.dumps(cache.stats(), indent=2))
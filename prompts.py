@@ -65,6 +65,38 @@ plan_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+# Light adaptation of a cached plan written for a very similar profile.
+adapt_plan_prompt = ChatPromptTemplate.from_messages([
+    plan_prompt.messages[0],
+    (
+        "human",
+        dedent(
+            """
+            User profile:
+            - Age: {age}
+            - Education: {education_level}
+            - Preferred theme: {preferred_theme}
+            - Purpose of reading: {purpose_of_reading}
+            - Today's mood: {mood_today}
+            - Favorite author: {favorite_author}
+            - Desired length (pages): {length_in_pages}
+            - Special request: {special_request}
+
+            The plan below was written for a reader with a very similar profile:
+            ---- PLAN START ----
+            {cached_plan}
+            ---- PLAN END ----
+
+            Adapt it for this reader. Change only what the profile differences call for
+            (tone, emphasis, special request); keep the deliverable structure, headings and
+            outline format. Give it a fresh working title.
+            Return only the adapted plan.
+            """
+        ),
+    ),
+])
+
+
 # 2) DRAFTING (includes RAG context)
 
 draft_prompt = ChatPromptTemplate.from_messages([
@@ -142,6 +174,54 @@ draft_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+# 2b) CHAPTER DRAFTING (one call per outline section, run concurrently)
+
+draft_chapter_prompt = ChatPromptTemplate.from_messages([
+    draft_prompt.messages[0],
+    (
+        "human",
+        dedent(
+            """
+            User profile:
+            - Age: {age}
+            - Education: {education_level}
+            - Preferred theme: {preferred_theme}
+            - Purpose of reading: {purpose_of_reading}
+            - Today's mood: {mood_today}
+            - Favorite author: {favorite_author}
+            - Desired length (pages): {length_in_pages}
+            - Special request: {special_request}
+
+            Approved outline for the whole book:
+            ---- OUTLINE START ----
+            {plan}
+            ---- OUTLINE END ----
+
+            Optional reference passages for tonal inspiration:
+            ---- REFERENCES START ----
+            {rag_context}
+            ---- REFERENCES END ----
+
+            Other writers are drafting the neighbouring chapters at the same time. Use these notes to keep continuity:
+            - Previous chapter: {previous_summary}
+            - Next chapter: {next_summary}
+
+            Draft ONLY chapter/section {chapter_number} of {chapter_count}: "{chapter_heading}"
+            Planning notes for this chapter:
+            {chapter_notes}
+
+            • Start with the chapter/section heading in bold with the roman numeral for {chapter_number}.
+            • Do NOT write the book title and do NOT write any other chapter.
+            • Aim for roughly {approx_word_count} words without stating counts.
+            • Hand off naturally from the previous chapter and set up the next one without summarizing them.
+            • Maintain originality.
+            Output ONLY this chapter.
+            """
+        ),
+    ),
+])
+
+
 # 3) EDITING
 
 edit_prompt = ChatPromptTemplate.from_messages([
@@ -196,6 +276,53 @@ edit_prompt = ChatPromptTemplate.from_messages([
 ])
 
 
+# Section-sized editing for long manuscripts; neighbours are shown for continuity only.
+edit_section_prompt = ChatPromptTemplate.from_messages([
+    edit_prompt.messages[0],
+    (
+        "human",
+        dedent(
+            """
+            User profile:
+            - Age: {age}
+            - Education: {education_level}
+            - Purpose of reading: {purpose_of_reading}
+            - Favorite author: {favorite_author}
+            - Special request: {special_request}
+
+            You are editing part {section_number} of {section_count} of a longer manuscript.
+
+            End of the previous part (context only, do not return it):
+            ---- BEFORE START ----
+            {context_before}
+            ---- BEFORE END ----
+
+            Part requiring edits:
+            ---- DRAFT START ----
+            {draft}
+            ---- DRAFT END ----
+
+            Start of the next part (context only, do not return it):
+            ---- AFTER START ----
+            {context_after}
+            ---- AFTER END ----
+
+            Editing checklist:
+            1. Correct grammar, spelling, punctuation, tense, and pronoun usage.
+            2. Tighten sentences while keeping nuance.
+            3. Smooth transitions, including from the previous part and into the next one.
+            4. Remove redundancy or clichés; upgrade phrasing when needed.
+            5. Maintain tone appropriate to this reader.
+            6. Avoid using overly complex languages or sentence structures.
+            7. Keep every heading of this part, in order; do not add headings.
+
+            Return only the revised part.
+            """
+        ),
+    ),
+])
+
+
 # 4) CRITIQUE
 
 critique_prompt = ChatPromptTemplate.from_messages([
@@ -287,3 +414,50 @@ rewrite_prompt = ChatPromptTemplate.from_messages([
         ),
     ),
 ])
+
+
+# 5b) PATCH REWRITE (one weak paragraph at a time)
+
+patch_rewrite_prompt = ChatPromptTemplate.from_messages([
+    rewrite_prompt.messages[0],
+    (
+        "human",
+        dedent(
+            """
+            User profile:
+            - Age: {age}
+            - Education: {education_level}
+            - Purpose of reading: {purpose_of_reading}
+            - Favorite author: {favorite_author}
+            - Special request: {special_request}
+
+            Text just before the passage (context only, do not return it):
+            ---- BEFORE START ----
+            {context_before}
+            ---- BEFORE END ----
+
+            Passage to revise:
+            ---- PASSAGE START ----
+            {passage}
+            ---- PASSAGE END ----
+
+            Text just after the passage (context only, do not return it):
+            ---- AFTER START ----
+            {context_after}
+            ---- AFTER END ----
+
+            Critique weaknesses for the manuscript:
+            ---- WEAKNESSES START ----
+            {critique_focus}
+            ---- WEAKNESSES END ----
+
+            Evidence the critic pointed at in this passage:
+            {evidence}
+
+            Revise ONLY the passage so it addresses the weaknesses that apply to it.
+            Keep it a single paragraph that flows from the text before and into the text after.
+            Return only the revised passage, without markers or commentary.
+            """
+        ),
+    ),
+])
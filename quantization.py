@@ -0,0 +1,196 @@
+"""
+Compressed embedding codes for the NumPy vector index.
+
+  int8  scalar quantization, one signed byte per dimension with a per-dimension
+        scale (4x smaller than float32).
+  pq    product quantization: vectors are cut into RAG_PQ_SUBVECTOR_DIM-wide
+        pieces, each replaced by the id of its nearest of 256 k-means centroids
+        (one byte per piece, 32x smaller at the default width of 8).
+
+Search is two-stage: approximate scores over the codes for every row in scope,
+then exact float32 rescoring of the best `RAG_RESCORE_FACTOR * k` rows. Only
+the codes are scanned, so only they need to stay resident; the float32 matrix
+is touched a few rows at a time through its memory map.
+
+Compare recall and memory against the unquantized export with:
+python quantization.py [--k 10] [--queries 200]
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+RAG_QUANTIZATION = os.getenv("RAG_QUANTIZATION", "none")  # none | int8 | pq
+RAG_PQ_SUBVECTOR_DIM = int(os.getenv("RAG_PQ_SUBVECTOR_DIM", "8"))
+RAG_PQ_TRAIN_SAMPLE = int(os.getenv("RAG_PQ_TRAIN_SAMPLE", "20000"))
+RAG_PQ_ITERATIONS = int(os.getenv("RAG_PQ_ITERATIONS", "12"))
+RAG_RESCORE_FACTOR = int(os.getenv("RAG_RESCORE_FACTOR", "10"))
+BLOCK_ROWS = 65536  # rows decoded at a time, so scoring never materialises a float copy of the codes
+
+
+# -- int8 --
+
+def train_int8(matrix: np.ndarray) -> np.ndarray:
+    """
+    Per-dimension scales mapping each dimension's largest magnitude to 127.
+    """
+    peak = np.abs(matrix).max(axis=0) if len(matrix) else np.ones(matrix.shape[1], dtype=np.float32)
+    return (np.where(peak == 0, 1.0, peak) / 127.0).astype(np.float32)
+
+
+def encode_int8(matrix: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return np.clip(np.rint(matrix / scales), -127, 127).astype(np.int8)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    weighted = (query * scales).astype(np.float32)
+    return np.concatenate([
+        codes[start:start + BLOCK_ROWS].astype(np.float32) @ weighted
+        for start in range(0, len(codes), BLOCK_ROWS)
+    ]) if len(codes) else np.zeros(0, dtype=np.float32)
+
+
+# -- product quantization --
+
+def _nearest(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * points @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def train_pq(
+    matrix: np.ndarray,
+    subvector_dim: int = RAG_PQ_SUBVECTOR_DIM,
+    sample: int = RAG_PQ_TRAIN_SAMPLE,
+    iterations: int = RAG_PQ_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    k-means codebooks, shape (pieces, 256, subvector_dim), trained on a row sample.
+    """
+    dim = matrix.shape[1]
+    if dim % subvector_dim:
+        raise ValueError(f"embedding dim {dim} is not a multiple of RAG_PQ_SUBVECTOR_DIM={subvector_dim}")
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)
+    training = np.asarray(matrix[np.sort(rows)], dtype=np.float32)
+    pieces = dim // subvector_dim
+    clusters = min(256, len(training))
+    codebooks = np.zeros((pieces, 256, subvector_dim), dtype=np.float32)
+    for piece in range(pieces):
+        points = training[:, piece * subvector_dim:(piece + 1) * subvector_dim]
+        centroids = points[rng.choice(len(points), size=clusters, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = _nearest(points, centroids)
+            counts = np.bincount(assignment, minlength=clusters)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Empty clusters restart on random points instead of dying.
+            centroids[empty] = points[rng.choice(len(points), size=int(empty.sum()))]
+        codebooks[piece, :clusters] = centroids
+        codebooks[piece, clusters:] = np.inf  # unused slots are never nearest
+    return codebooks
+
+
+def encode_pq(matrix: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    pieces, _, width = codebooks.shape
+    codes = np.zeros((len(matrix), pieces), dtype=np.uint8)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = np.asarray(matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+        for piece in range(pieces):
+            centroids = np.nan_to_num(codebooks[piece], posinf=1e6)
+            codes[start:start + len(block), piece] = _nearest(block[:, piece * width:(piece + 1) * width], centroids)
+    return codes
+
+
+def pq_scores(codes: np.ndarray, codebooks: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Asymmetric distance computation: the query's dot product with every centroid is
+    tabulated once, then each row's score is a sum of table lookups.
+    """
+    pieces, _, width = codebooks.shape
+    table = np.einsum("pcw,pw->pc", np.nan_to_num(codebooks, posinf=0.0), query.reshape(pieces, width))
+    columns = np.arange(pieces)
+    return np.concatenate([
+        table[columns, codes[start:start + BLOCK_ROWS]].sum(axis=1)
+        for start in range(0, len(codes), BLOCK_ROWS)
+    ]).astype(np.float32) if len(codes) else np.zeros(0, dtype=np.float32)
+
+
+# -- shared --
+
+def quantize(matrix: np.ndarray, method: str) -> Dict[str, np.ndarray]:
+    """
+    Arrays to store next to the float32 matrix for `method` ("none" stores nothing).
+    """
+    if method == "int8":
+        scales = train_int8(matrix)
+        return {"int8_scales": scales, "int8_codes": encode_int8(matrix, scales)}
+    if method == "pq":
+        codebooks = train_pq(matrix)
+        return {"pq_codebooks": codebooks, "pq_codes": encode_pq(matrix, codebooks)}
+    if method != "none":
+        raise ValueError(f"Unknown RAG_QUANTIZATION '{method}' (expected none, int8 or pq)")
+    return {}
+
+
+def approximate_scores(arrays: Dict[str, np.ndarray], query: np.ndarray, start: int, end: int) -> Optional[np.ndarray]:
+    """
+    Approximate similarities of rows [start, end) from whichever codes are present.
+    """
+    if "int8_codes" in arrays:
+        return int8_scores(arrays["int8_codes"][start:end], arrays["int8_scales"], query)
+    if "pq_codes" in arrays:
+        return pq_scores(arrays["pq_codes"][start:end], arrays["pq_codebooks"], query)
+    return None
+
+
+def code_bytes(arrays: Dict[str, np.ndarray]) -> int:
+    return sum(int(array.nbytes) for array in arrays.values())
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Recall and memory of quantized search vs. exact float32 search.")
+    cli.add_argument("--k", type=int, default=10)
+    cli.add_argument("--queries", type=int, default=200)
+    cli.add_argument("--index", default=os.path.join(os.getenv("VECTOR_DB_DIR", "vector_db"), "numpy_index"), help="NumPy export directory")
+    args = cli.parse_args()
+
+    from vector_index import current_generation
+
+    matrix = np.load(current_generation(args.index) / "vectors.npy", mmap_mode="r")
+    rng = np.random.default_rng(1)
+    # Queries: stored vectors nudged off their own position, so the exact top-k is not trivial.
+    queries = np.asarray(matrix[rng.choice(len(matrix), size=min(args.queries, len(matrix)), replace=False)])
+    queries = queries + rng.normal(scale=0.5 / np.sqrt(matrix.shape[1]), size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    k = min(args.k, len(matrix))
+    exact = [set(np.argpartition(-(matrix @ query), k - 1)[:k]) for query in queries]
+
+    print(f"{len(matrix)} vectors x {matrix.shape[1]} dims, recall@{k} over {len(queries)} queries")
+    print(f"{'method':<8}{'memory':>12}{'ratio':>8}{'recall (codes)':>16}{'recall (rescored)':>19}{'ms/query':>10}")
+    print(f"{'float32':<8}{matrix.nbytes / 2**20:>10.1f}MB{1.0:>8.1f}{1.0:>16.3f}{1.0:>19.3f}{'':>10}")
+    for method in ("int8", "pq"):
+        try:
+            arrays = quantize(matrix, method)
+        except ValueError as exc:
+            print(f"{method:<8} skipped: {exc}")
+            continue
+        rescore = min(len(matrix), max(k, RAG_RESCORE_FACTOR * k))
+        hits_codes = hits_rescored = 0
+        started = time.perf_counter()
+        for query, truth in zip(queries, exact):
+            approx = approximate_scores(arrays, query, 0, len(matrix))
+            hits_codes += len(truth & set(np.argpartition(-approx, k - 1)[:k]))
+            shortlist = np.argpartition(-approx, rescore - 1)[:rescore]
+            rescored = shortlist[np.argpartition(-(np.asarray(matrix[shortlist]) @ query), k - 1)[:k]]
+            hits_rescored += len(truth & set(rescored))
+        elapsed = (time.perf_counter() - started) / len(queries) * 1000
+        size = code_bytes(arrays)
+        total = len(queries) * k
+        print(f"{method:<8}{size / 2**20:>10.1f}MB{matrix.nbytes / size:>8.1f}{hits_codes / total:>16.3f}{hits_rescored / total:>19.3f}{elapsed:>10.2f}")
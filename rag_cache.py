@@ -0,0 +1,88 @@
+"""
+In-memory LRU/TTL caches in front of retrieval.
+
+`get_rag_context` builds its query from a handful of profile fields, so the set
+of distinct queries is small. Query embeddings are cached by (embedding model,
+normalized query) so repeats skip the embedding API round-trip, and the final
+filtered context by (normalized query, k, index version) so a rebuilt vector
+store never serves stale passages. Both are per process and bounded by
+RAG_CACHE_MAX_ENTRIES and RAG_CACHE_TTL_SECONDS; `rag_cache_stats()` reports
+hit rates (batch manifests and benchmark results include them).
+"""
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+RAG_CACHE_ENABLED = os.getenv("RAG_CACHE_ENABLED", "1") == "1"
+RAG_CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "512"))
+RAG_CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", "3600"))
+
+
+def normalize_query(text: str) -> str:
+    """
+    Case- and whitespace-insensitive form of a query, used as the cache key.
+    """
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class LRUCache:
+    """
+    Thread-safe LRU mapping whose entries also expire `ttl` seconds after insertion.
+    """
+
+    def __init__(self, max_entries: int = RAG_CACHE_MAX_ENTRIES, ttl: float = RAG_CACHE_TTL_SECONDS) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl <= 0 or time.monotonic() - entry[0] < self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+query_embeddings = LRUCache()
+retrieval_results = LRUCache()
+
+
+def rag_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {"query_embeddings": query_embeddings.stats(), "retrieval_results": retrieval_results.stats()}
+
@@ -1,54 +1,636 @@
 # rag_store.py
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
+import numpy as np
 from langchain_community.vectorstores import Chroma
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain.docstore.document import Document
+from langchain_core.documents import Document
 
-from llm_config import embeddings, VECTOR_DB_DIR
+from checkpoints import _atomic_write
+from corpus_cleaning import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    RAG_DEDUP,
+    RAG_DEDUP_THRESHOLD,
+    RAG_STRIP_BOILERPLATE,
+    NUM_PERM,
+    NearDuplicateIndex,
+    PreparedBook,
+    estimate_tokens,
+    prepare_book,
+)
+from llm_config import embeddings, EMBEDDING_MODEL, VECTOR_DB_DIR
+from fetchbooktitles import UNSHELVED, age_band_of
+from vector_index import EXPORT_PAGE_SIZE, NumpyVectorIndex, export_numpy_index, has_numpy_index
+from sparse_index import SparseIndex, build_sparse_index, has_sparse_index
 
-def build_vectorstore_from_texts(book_texts: Dict[str, str]) -> None:
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "128"))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "4"))
+# Processes splitting books into chunks (1 splits in-process) and books buffered per ingest stage.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+INGEST_QUEUE_BOOKS = max(1, int(os.getenv("INGEST_QUEUE_BOOKS", "8")))
+EMBED_PROGRESS_SECONDS = 5.0
+INDEX_MANIFEST = "index_manifest.json"
+# MinHash signatures of each indexed book's kept chunks, so unchanged books seed
+# near-duplicate detection without being split again.
+DEDUP_SIGNATURES = "dedup_signatures.npz"
+
+# Rewritten whenever a build changes the index; its mtime tells long-running processes to reopen the store.
+BUILD_MARKER = "build_info.txt"
+# How often (seconds) the shared handle checks the directory for a rebuild; 0 checks every call.
+RAG_RELOAD_CHECK_SECONDS = float(os.getenv("RAG_RELOAD_CHECK_SECONDS", "10"))
+RAG_WARM_ON_STARTUP = os.getenv("RAG_WARM_ON_STARTUP", "1") == "1"
+# "chroma" queries the Chroma DB; "numpy" serves queries from a memory-mapped export of it.
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma")
+NUMPY_INDEX_DIR = "numpy_index"
+SPARSE_INDEX_DIR = "bm25_index"
+
+VectorStore = Union[Chroma, NumpyVectorIndex]
+
+def _chunk_ids(title: str, chunks: List[str]) -> List[str]:
     """
-    book_texts: dict {title: full_text}
-    Splits into chunks, embeds, and persists a Chroma DB.
+    Stable ids from (book, chunk content); repeated identical chunks get an occurrence suffix.
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=100
-    )
+    book = hashlib.sha1(title.encode("utf-8")).hexdigest()[:12]
+    seen: Dict[str, int] = {}
+    ids = []
+    for chunk in chunks:
+        digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:20]
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(f"{book}-{digest}-{seen[digest] - 1}")
+    return ids
 
-    docs = []
-    for title, text in book_texts.items():
-        chunks = splitter.split_text(text)
-        for chunk in chunks:
-            docs.append(
-                Document(
-                    page_content=chunk,
-                    metadata={"title": title}
-                )
-            )
+def _load_manifest(path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
 
-    db = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=VECTOR_DB_DIR,
+StoredSignatures = Dict[str, Tuple[str, List[Tuple[str, np.ndarray]]]]
+
+def _load_signatures(path: Path) -> StoredSignatures:
+    """
+    {title: (text hash, [(chunk id, signature), ...])} as saved by `_save_signatures`;
+    empty when the file is missing or unreadable.
+    """
+    try:
+        with np.load(path) as data:
+            titles, hashes, counts = data["titles"].tolist(), data["hashes"].tolist(), data["counts"].tolist()
+            ids, signatures = data["ids"].tolist(), data["signatures"]
+    except (OSError, ValueError, KeyError):
+        return {}
+    stored: StoredSignatures = {}
+    start = 0
+    for title, text_hash, count in zip(titles, hashes, counts):
+        stored[title] = (text_hash, list(zip(ids[start:start + count], signatures[start:start + count])))
+        start += count
+    return stored
+
+def _save_signatures(path: Path, stored: StoredSignatures) -> None:
+    rows = [row for _, book_rows in stored.values() for row in book_rows]
+    tmp = path.with_name(f".{path.name}.tmp.npz")
+    np.savez(
+        tmp,
+        titles=np.asarray(list(stored), dtype=str),
+        hashes=np.asarray([text_hash for text_hash, _ in stored.values()], dtype=str),
+        counts=np.asarray([len(book_rows) for _, book_rows in stored.values()], dtype=np.int64),
+        ids=np.asarray([chunk_id for chunk_id, _ in rows], dtype=str),
+        signatures=np.asarray([signature for _, signature in rows], dtype=np.uint32).reshape(len(rows), NUM_PERM),
     )
+    os.replace(tmp, path)
+
+def _already_indexed(db: Chroma, ids: List[str]) -> Set[str]:
+    found: Set[str] = set()
+    for start in range(0, len(ids), 5000):
+        found.update(db._collection.get(ids=ids[start:start + 5000], include=[])["ids"])
+    return found
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _embed_into(
+    db: Chroma,
+    chunks: Iterable[Tuple[str, str, str]],
+    metadata: Dict[str, Dict[str, str]],
+    on_written: Callable[[List[Tuple[str, str, str]]], None],
+) -> Tuple[int, float]:
+    """
+    Embeds (id, title, chunk) triples, tagged with their book's `metadata`, in EMBED_BATCH_SIZE batches on EMBED_WORKERS
+    threads and writes each batch to the store as soon as it is embedded, so an
+    interrupted build keeps its finished batches. `chunks` is consumed lazily, a
+    batch at a time as slots free up. Returns the chunks written and the seconds spent.
+    """
+    started = last_report = time.monotonic()
+    batches = _batched(chunks, EMBED_BATCH_SIZE)
+    in_flight: Dict[Future, List[Tuple[str, str, str]]] = {}
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed") as pool:
+        def submit() -> None:
+            batch = next(batches, None)
+            if batch is not None:
+                in_flight[pool.submit(embeddings.embed_documents, [chunk for _, _, chunk in batch])] = batch
+
+        # A bounded window keeps memory flat however large the corpus is.
+        try:
+            for _ in range(EMBED_WORKERS * 2):
+                submit()
+            while in_flight:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    batch = in_flight.pop(future)
+                    # Chroma writes stay on this thread; only embedding runs in the pool.
+                    db._collection.upsert(
+                        ids=[chunk_id for chunk_id, _, _ in batch],
+                        embeddings=future.result(),
+                        documents=[chunk for _, _, chunk in batch],
+                        metadatas=[metadata[title] for _, title, _ in batch],
+                    )
+                    on_written(batch)
+                    done += len(batch)
+                    submit()
+                now = time.monotonic()
+                if now - last_report >= EMBED_PROGRESS_SECONDS:
+                    last_report = now
+                    print(f"   ↳ {done} chunks embedded ({done / (now - started):.0f} chunks/s)")
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+    return done, time.monotonic() - started
+
+def _prefetch(items: Iterable[Any], size: int) -> Iterator[Any]:
+    """
+    Iterates `items` (e.g. books being downloaded) on a background thread, at most
+    `size` items ahead of the consumer.
+    """
+    buffer: "queue.Queue[Tuple[Optional[BaseException], Any]]" = queue.Queue(maxsize=size)
+    finished = object()
+    stop = threading.Event()
+
+    def put(entry: Tuple[Optional[BaseException], Any]) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put((None, item)):
+                    return
+        except BaseException as e:
+            put((e, None))
+            return
+        put((None, finished))
+
+    threading.Thread(target=produce, name="ingest-prefetch", daemon=True).start()
+    try:
+        while True:
+            error, item = buffer.get()
+            if error is not None:
+                raise error
+            if item is finished:
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _split_book(title: str, text: str) -> Tuple[PreparedBook, List[str]]:
+    """
+    Runs in the ingest process pool: a book's cleaned, signed chunks and their stable ids.
+    """
+    book = prepare_book(title, text)
+    return book, _chunk_ids(title, book.chunks)
+
+def _book_metadata(title: str, tags: Optional[Dict[str, str]]) -> Dict[str, str]:
+    shelf = (tags or {}).get("shelf", UNSHELVED)
+    return {"title": title, "shelf": shelf, "age_band": (tags or {}).get("age_band", age_band_of(shelf))}
+
+def build_vectorstore_from_texts(
+    book_texts: Union[Dict[str, str], Iterable[Tuple[str, str]]],
+    prune: bool = True,
+    book_tags: Optional[Dict[str, Dict[str, str]]] = None,
+) -> None:
+    """
+    book_texts: dict {title: full_text}, or any iterable of (title, full_text) pairs,
+        e.g. a generator downloading books one at a time.
+    book_tags: optional {title: {"shelf": ..., "age_band": ...}} (see fetchbooktitles);
+        untagged books go on the "general" shelf. Retrieval routes queries by these.
+        A streamed source may fill it as it goes, as long as each entry precedes its book.
+    Incrementally indexes the books into the persisted Chroma DB: only chunks that are
+    not indexed yet are embedded, chunks that disappeared from a changed book are
+    deleted, and with `prune` so are books missing from `book_texts`.
+    `index_manifest.json` in the DB dir records what is indexed; a book is entered
+    once all its chunks are written, and chunks an interrupted build already wrote
+    are found in the store and skipped, so rerunning resumes.
+
+    Books stream through fetch -> split -> embed -> write with bounded buffers
+    between stages (INGEST_QUEUE_BOOKS books read ahead, as many being split on
+    INGEST_WORKERS processes, EMBED_WORKERS * 2 batches embedding), so memory stays
+    flat however many books are ingested.
+    """
+    started = time.perf_counter()
+    directory = Path(VECTOR_DB_DIR)
+    manifest_path = directory / INDEX_MANIFEST
+    settings = {
+        "embedding_model": EMBEDDING_MODEL,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "strip_boilerplate": RAG_STRIP_BOILERPLATE,
+        "dedup_threshold": RAG_DEDUP_THRESHOLD if RAG_DEDUP else None,
+    }
+    manifest = _load_manifest(manifest_path)
+
+    db = Chroma(persist_directory=VECTOR_DB_DIR, embedding_function=embeddings)
+    if manifest.get("settings") != settings and db._collection.count():
+        # Stores built before the manifest (random ids) or with other chunking/embeddings
+        # cannot be diffed; start over once.
+        print("♻️  Index settings changed or no manifest found; re-indexing everything.")
+        db.delete_collection()
+        db = Chroma(persist_directory=VECTOR_DB_DIR, embedding_function=embeddings)
+        manifest = {}
+    books: Dict[str, Any] = manifest.get("books", {}) if manifest.get("settings") == settings else {}
+
+    counts = {"added": 0, "resumed": 0, "deleted": 0, "retagged": 0, "unchanged": 0, "duplicates": 0, "saved_chars": 0}
+    # Near-duplicates are dropped against every chunk kept so far in this build,
+    # including those of unchanged books, which are signed but not re-embedded.
+    dedup = NearDuplicateIndex() if RAG_DEDUP else None
+    signatures_path = directory / DEDUP_SIGNATURES
+    # Kept signatures per book; an entry is only trusted while its hash matches the book's.
+    signed: StoredSignatures = _load_signatures(signatures_path) if dedup is not None and books else {}
+    saved_hashes = {title: text_hash for title, (text_hash, _) in signed.items()}
+    resigned: Set[str] = set()  # books whose signatures were recomputed this build
+    updated: Dict[str, Any] = {}  # manifest entries recorded once all their chunks are written
+    remaining: Dict[str, int] = {}  # chunks of each updated book still to be written
+    metadata: Dict[str, Dict[str, str]] = {}
+    seen: Set[str] = set()
+
+    def save_manifest() -> None:
+        _atomic_write(manifest_path, json.dumps({"settings": settings, "books": books}, ensure_ascii=False, indent=2))
+
+    def finish(title: str) -> None:
+        books[title] = updated.pop(title)
+        remaining.pop(title, None)
+        save_manifest()
+
+    def delete(ids: List[str]) -> None:
+        if ids:
+            db.delete(ids=ids)
+            counts["deleted"] += len(ids)
+
+    def retag(title: str, ids: List[str]) -> None:
+        for start in range(0, len(ids), EXPORT_PAGE_SIZE):
+            batch = ids[start:start + EXPORT_PAGE_SIZE]
+            db._collection.update(ids=batch, metadatas=[metadata[title]] * len(batch))
+        counts["retagged"] += len(ids)
+
+    def index_book(title: str, text_hash: str, book: PreparedBook, ids: List[str]) -> Iterator[Tuple[str, str, str]]:
+        chunks = book.chunks
+        duplicates = 0
+        if dedup is not None:
+            unique = [dedup.add_if_new(signature) for signature in book.signatures]
+            duplicates = unique.count(False)
+            counts["duplicates"] += duplicates
+            counts["saved_chars"] += sum(len(chunk) for chunk, keep in zip(chunks, unique) if not keep)
+            chunks = [chunk for chunk, keep in zip(chunks, unique) if keep]
+            resigned.add(title)
+            signed[title] = (text_hash, [
+                (chunk_id, signature) for chunk_id, signature, keep in zip(ids, book.signatures, unique)
+                if keep and signature is not None
+            ])
+            ids = [chunk_id for chunk_id, keep in zip(ids, unique) if keep]
+        counts["saved_chars"] += book.stripped_chars
+        entry = books.get(title)
+        old_ids = set(entry["chunk_ids"]) if entry else set()
+        delete(sorted(old_ids - set(ids)))
+        if entry is not None and entry.get("metadata") != metadata[title]:
+            retag(title, [chunk_id for chunk_id in ids if chunk_id in old_ids])
+        new = [(chunk_id, chunk) for chunk_id, chunk in zip(ids, chunks) if chunk_id not in old_ids]
+        counts["added"] += len(new)
+        # Chunks written by an interrupted build are already in the store under the same ids.
+        resumed = _already_indexed(db, [chunk_id for chunk_id, _ in new])
+        counts["resumed"] += len(resumed)
+        pending = [(chunk_id, title, chunk) for chunk_id, chunk in new if chunk_id not in resumed]
+        updated[title] = {
+            "text_sha256": text_hash,
+            "chunk_ids": ids,
+            "metadata": metadata[title],
+            "duplicates": duplicates,
+            "indexed_at": time.time(),
+        }
+        remaining[title] = len(pending)
+        if not pending:
+            finish(title)
+        yield from pending
+
+    # (text hash, split) in book order; no hash marks an unchanged book that only seeds `dedup`,
+    # from its saved signatures or, failing those, from a fresh split.
+    splitting: Deque[Tuple[Optional[str], Future]] = deque()
+
+    def next_split() -> Iterator[Tuple[str, str, str]]:
+        text_hash, split = splitting.popleft()
+        book, ids = split.result()
+        if text_hash is None:
+            entry = books[book.title]
+            indexed = set(entry["chunk_ids"])
+            kept = [(chunk_id, signature) for chunk_id, signature in zip(ids, book.signatures) if chunk_id in indexed and signature is not None]
+            for _, signature in kept:
+                dedup.add(signature)
+            signed[book.title] = (entry["text_sha256"], kept)
+            resigned.add(book.title)
+            return iter(())
+        return index_book(book.title, text_hash, book, ids)
+
+    def stream(pool: Optional[ProcessPoolExecutor]) -> Iterator[Tuple[str, str, str]]:
+        source = book_texts.items() if isinstance(book_texts, dict) else book_texts
+        for title, text in _prefetch(source, INGEST_QUEUE_BOOKS):
+            seen.add(title)
+            metadata[title] = _book_metadata(title, (book_tags or {}).get(title))
+            text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            entry = books.get(title)
+            if entry and entry["text_sha256"] == text_hash:
+                if entry.get("metadata") != metadata[title]:
+                    retag(title, entry["chunk_ids"])
+                    entry["metadata"] = metadata[title]
+                    save_manifest()
+                else:
+                    counts["unchanged"] += 1
+                if dedup is None:
+                    continue
+                text_hash = None
+            stored = signed.get(title) if text_hash is None else None
+            split: Future = Future()
+            if stored is not None and stored[0] == entry["text_sha256"]:
+                # Seeding from the saved signatures; the book is not split again.
+                book = PreparedBook(title, [], [signature for _, signature in stored[1]])
+                split.set_result((book, [chunk_id for chunk_id, _ in stored[1]]))
+            elif pool is None:
+                split.set_result(_split_book(title, text))
+            else:
+                split = pool.submit(_split_book, title, text)
+            splitting.append((text_hash, split))
+            # Waiting on the oldest split is the backpressure: no more than
+            # INGEST_QUEUE_BOOKS texts are held between fetching and embedding.
+            while len(splitting) >= INGEST_QUEUE_BOOKS:
+                yield from next_split()
+        while splitting:
+            yield from next_split()
+
+    def on_written(batch: List[Tuple[str, str, str]]) -> None:
+        for _, title, _ in batch:
+            remaining[title] -= 1
+            if remaining[title] == 0:
+                finish(title)
+
+    save_manifest()  # records a reset store before anything is written to it
+    pool = ProcessPoolExecutor(max_workers=INGEST_WORKERS) if INGEST_WORKERS > 1 else None
+    try:
+        embedded, embed_s = _embed_into(db, stream(pool), metadata, on_written)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    removed = [title for title in books if title not in seen] if prune else []
+    for title in removed:
+        delete(books.pop(title)["chunk_ids"])
+    if counts["deleted"]:
+        # Deleted chunks may be what another book's near-duplicates were dropped in
+        # favour of; forgetting those books' hashes makes the next build re-split
+        # them and embed whatever is missing now.
+        recheck = [title for title, entry in books.items() if entry.get("duplicates")]
+        for title in recheck:
+            books[title]["text_sha256"] = ""
+        if recheck:
+            print(f"⚠️  {len(recheck)} books had near-duplicate chunks dropped; rerun the build to restore any whose original was deleted.")
+    if dedup is not None:
+        current = {title: (entry["text_sha256"], signed[title][1]) for title, entry in books.items() if title in signed}
+        if resigned or {title: text_hash for title, (text_hash, _) in current.items()} != saved_hashes:
+            _save_signatures(signatures_path, current)
+    save_manifest()
     db.persist()
-    print(f"✅ Built vector DB at: {VECTOR_DB_DIR}")
 
-def get_vectorstore() -> Optional[Chroma]:
+    changed = bool(counts["added"] or counts["deleted"] or counts["retagged"])
+    # An existing export is kept in sync even when this process uses Chroma.
+    exported_before = has_numpy_index(directory / NUMPY_INDEX_DIR)
+    if (RAG_BACKEND == "numpy" and not exported_before) or (exported_before and changed):
+        exported = export_numpy_index(db._collection, directory / NUMPY_INDEX_DIR)
+        print(f"📦 Exported {exported} chunks to the NumPy index")
+        changed = True
+    if changed or not has_sparse_index(directory / SPARSE_INDEX_DIR):
+        indexed = build_sparse_index(db._collection, directory / SPARSE_INDEX_DIR)
+        print(f"🔤 Built the BM25 index over {indexed} chunks")
+        changed = True
+    if changed or not (directory / BUILD_MARKER).exists():
+        chunk_count = sum(len(entry["chunk_ids"]) for entry in books.values())
+        (directory / BUILD_MARKER).write_text(f"{time.time()}\n{chunk_count} chunks\n", encoding="utf-8")
+    rate = f", {embedded / embed_s:.0f} chunks/s" if embedded and embed_s else ""
+    print(
+        f"✅ Vector DB at {VECTOR_DB_DIR}: {embedded} chunks embedded{rate}, {counts['resumed']} resumed, "
+        f"{counts['deleted']} deleted, {counts['retagged']} retagged, {counts['unchanged']} books unchanged, {len(removed)} removed, "
+        f"{counts['duplicates']} near-duplicate chunks skipped, ≈{estimate_tokens(counts['saved_chars'])} embedding tokens saved by cleaning "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+
+def _store_version(path: Path) -> Optional[Tuple[float, int]]:
+    """
+    Identifies the on-disk build: the build marker's mtime, or the Chroma sqlite file's
+    for stores built before the marker existed. None when there is no store.
+    """
+    for name in (BUILD_MARKER, "chroma.sqlite3"):
+        try:
+            stat = (path / name).stat()
+        except OSError:
+            continue
+        return stat.st_mtime, stat.st_size
+    return None
+
+class VectorStoreHandle:
+    """
+    Process-wide store handle (Chroma or the NumPy index, per RAG_BACKEND): opened
+    once, shared by all threads, and reopened when the directory is rebuilt
+    (checked at most every RAG_RELOAD_CHECK_SECONDS).
+    """
+
+    def __init__(self, directory: str = VECTOR_DB_DIR) -> None:
+        self.path = Path(directory)
+        self._db: Optional[VectorStore] = None
+        self._sparse: Optional[SparseIndex] = None
+        self._version: Optional[Tuple[float, int]] = None
+        self._checked_at = 0.0
+        self._warned_missing = False
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[VectorStore]:
+        now = time.monotonic()
+        if self._db is not None and now - self._checked_at < RAG_RELOAD_CHECK_SECONDS:
+            return self._db
+        with self._lock:
+            if self._db is not None and now - self._checked_at < RAG_RELOAD_CHECK_SECONDS:
+                return self._db
+            self._checked_at = now
+            version = _store_version(self.path)
+            if version is None:
+                if not self._warned_missing:
+                    print(f"⚠️  Vector DB dir '{self.path}' not found. Run build_rag_db.py first.")
+                    self._warned_missing = True
+                self._db = self._sparse = None
+                return None
+            self._warned_missing = False
+            if self._db is None or version != self._version:
+                self._open(reload=self._db is not None)
+                self._version = version
+            return self._db
+
+    def _open(self, reload: bool) -> None:
+        if reload:
+            print(f"🔄 Vector DB at '{self.path}' was rebuilt; reloading.")
+        if RAG_BACKEND == "numpy":
+            index_dir = self.path / NUMPY_INDEX_DIR
+            if not has_numpy_index(index_dir):
+                # Stores built with the Chroma backend are exported on first use.
+                export_numpy_index(Chroma(persist_directory=str(self.path))._collection, index_dir)
+            self._db = NumpyVectorIndex(index_dir)
+        else:
+            stale = None
+            if reload:
+                # Chroma keeps one system per directory in-process; drop it so a rebuild
+                # made by another process is read from disk instead of the stale index.
+                from chromadb.api.shared_system_client import SharedSystemClient
+
+                stale = self._db._client._system
+                SharedSystemClient.clear_system_cache()
+            self._db = Chroma(
+                persist_directory=str(self.path),
+                embedding_function=embeddings,
+            )
+            if stale is not None:
+                # Clearing the cache only forgets the old system; stopping it releases
+                # its sqlite connections and in-memory index.
+                stale.stop()
+        sparse_dir = self.path / SPARSE_INDEX_DIR
+        if not has_sparse_index(sparse_dir):
+            # Stores built before the BM25 index existed get one on first use.
+            build_sparse_index(Chroma(persist_directory=str(self.path))._collection, sparse_dir)
+        self._sparse = SparseIndex(sparse_dir)
+
+    @property
+    def sparse(self) -> Optional[SparseIndex]:
+        return self._sparse
+
+    @property
+    def version(self) -> Optional[Tuple[float, int]]:
+        return self._version
+
+    def warm(self) -> bool:
+        """
+        Opens the store and runs one query so the index is loaded before the first
+        book needs it. Queries by a stored vector, so no embedding call is made.
+        """
+        db = self.get()
+        if db is None:
+            return False
+        started = time.perf_counter()
+        if isinstance(db, NumpyVectorIndex):
+            db.warm()
+            print(f"🔥 NumPy index ({len(db)} chunks) warmed in {time.perf_counter() - started:.2f}s")
+            return True
+        sample = db._collection.peek(limit=1)
+        vectors = sample.get("embeddings")
+        if vectors is not None and len(vectors):
+            db.similarity_search_by_vector(list(vectors[0]), k=1)
+        print(f"🔥 Vector DB warmed in {time.perf_counter() - started:.2f}s")
+        return True
+
+_handle = VectorStoreHandle()
+
+def get_vectorstore() -> Optional[VectorStore]:
     """
-    Loads the existing Chroma DB if present.
-    Returns None if it doesn't exist yet.
+    Returns the shared vector store, or None if it doesn't exist yet.
     """
-    path = Path(VECTOR_DB_DIR)
-    if not path.exists():
-        print(f"⚠️  Vector DB dir '{VECTOR_DB_DIR}' not found. Run build_rag_db.py first.")
-        return None
+    return _handle.get()
 
-    db = Chroma(
-        persist_directory=VECTOR_DB_DIR,
-        embedding_function=embeddings,
+def _as_matrix(embeddings: Any) -> np.ndarray:
+    vectors = np.asarray(embeddings if embeddings is not None else [], dtype=np.float32)
+    return vectors if vectors.ndim == 2 else np.zeros((0, 0), dtype=np.float32)
+
+def search_with_vectors(
+    db: VectorStore, embedding: List[float], k: int, shelves: Optional[List[str]] = None
+) -> Tuple[List[Document], np.ndarray, np.ndarray]:
+    """
+    Top-k documents, distances and their embeddings from either backend, closest first.
+    `shelves` restricts the search to those partitions: the NumPy index scans only
+    their row spans, Chroma filters on the chunks' shelf tag.
+    """
+    if isinstance(db, NumpyVectorIndex):
+        return db.search_with_vectors(embedding, k, shelves)
+    result = db._collection.query(
+        query_embeddings=[embedding],
+        n_results=k,
+        where={"shelf": {"$in": list(shelves)}} if shelves is not None else None,
+        include=["documents", "metadatas", "distances", "embeddings"],
     )
-    return db
+    documents = [
+        Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+        for chunk_id, text, metadata in zip(result["ids"][0], result["documents"][0], result["metadatas"][0])
+    ]
+    return documents, np.asarray(result["distances"][0], dtype=np.float32), _as_matrix(result["embeddings"][0])
+
+def fetch_with_vectors(db: VectorStore, ids: List[str]) -> Tuple[List[Document], np.ndarray]:
+    """
+    Documents and embeddings for chunk ids from either backend.
+    """
+    if isinstance(db, NumpyVectorIndex):
+        return db.fetch(ids)
+    if not ids:
+        return [], _as_matrix([])
+    result = db._collection.get(ids=ids, include=["documents", "metadatas", "embeddings"])
+    documents = [
+        Document(id=chunk_id, page_content=text or "", metadata=metadata or {})
+        for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"])
+    ]
+    return documents, _as_matrix(result["embeddings"])
+
+def get_sparse_index() -> Optional[SparseIndex]:
+    """
+    The BM25 index of the build the shared handle serves (call after get_vectorstore).
+    """
+    return _handle.sparse
+
+def vectorstore_version() -> Optional[Tuple[float, int]]:
+    """
+    Identifies the build the shared handle currently serves (for cache keys).
+    """
+    return _handle.version
+
+def _warm_quietly() -> None:
+    try:
+        _handle.warm()
+    except Exception as exc:
+        print(f"⚠️  Vector DB warm-up failed: {exc}")
+
+def warm_vectorstore() -> None:
+    """
+    Warms the shared store in a background thread at startup of long-running
+    processes, unless RAG_WARM_ON_STARTUP=0.
+    """
+    if RAG_WARM_ON_STARTUP:
+        threading.Thread(target=_warm_quietly, name="warm-vectorstore", daemon=True).start()
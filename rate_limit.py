@@ -0,0 +1,314 @@
+"""
+Process-wide provider rate limiting for chat and embedding requests.
+
+Every request that goes through the pooled transports in http_pool.py passes a
+ProviderLimiter first: token buckets for requests- and tokens-per-minute, plus an
+adaptive concurrency cap that halves on 429s / latency spikes and creeps back up
+after a window of healthy responses. 429s are retried here with jittered
+exponential backoff (honouring Retry-After) instead of failing the book.
+
+Callers that want to show waits (the job workers) register a listener with
+`listen_for_waits`; without one, long waits are printed.
+
+The limits below are for the whole account. A pool of processes sharing it calls
+`share_budget(processes)` in each process (the job workers do), so every process
+enforces its even share and the pool as a whole stays within the limits.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+import httpx
+
+# Account-wide budgets; each of N processes enforces 1/N after share_budget(N).
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))  # 0 disables a bucket
+LLM_TPM = float(os.getenv("LLM_TPM", "200000"))
+EMBEDDING_RPM = float(os.getenv("EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = float(os.getenv("EMBEDDING_TPM", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_RATE_MAX_RETRIES = int(os.getenv("LLM_RATE_MAX_RETRIES", "6"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "60"))
+# Completion size assumed when a request does not set max tokens.
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "1500"))
+LATENCY_SPIKE_FACTOR = float(os.getenv("LLM_LATENCY_SPIKE_FACTOR", "3.0"))
+WAIT_NOTICE_SECONDS = float(os.getenv("LLM_WAIT_NOTICE_SECONDS", "1.0"))
+
+WaitListener = Callable[[float, str], None]
+_wait_listener: contextvars.ContextVar[Optional[WaitListener]] = contextvars.ContextVar("wait_listener", default=None)
+
+
+@contextmanager
+def listen_for_waits(listener: WaitListener) -> Iterator[None]:
+    """
+    Routes wait notices of requests made in this context to `listener(seconds, reason)`.
+    """
+    token = _wait_listener.set(listener)
+    try:
+        yield
+    finally:
+        _wait_listener.reset(token)
+
+
+def notify_wait(seconds: float, reason: str) -> None:
+    if seconds < WAIT_NOTICE_SECONDS:
+        return
+    listener = _wait_listener.get()
+    if listener is not None:
+        listener(seconds, reason)
+    else:
+        print(f"⏳ {reason}: waiting {seconds:.1f}s")
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to one minute's worth.
+    `reserve` always succeeds and returns how long the caller must wait first,
+    so concurrent callers are spaced out instead of racing for the refill.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float) -> float:
+        if self.per_minute <= 0:
+            return 0.0
+        now = time.monotonic()
+        self.level = min(self.per_minute, self.level + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+        self.level -= min(amount, self.per_minute)
+        return 0.0 if self.level >= 0 else -self.level * 60 / self.per_minute
+
+
+class ProviderLimiter:
+    """
+    Shared limits for one kind of provider request (chat or embeddings).
+    """
+
+    def __init__(self, name: str, rpm: float, tpm: float, max_concurrency: int = LLM_MAX_CONCURRENCY) -> None:
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+        self.in_flight = 0
+        # Requests waiting for a concurrency slot, oldest first. Each entry wakes its
+        # waiter after a freed slot has been handed to it (in_flight already counts it).
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self.latency_ewma: Optional[float] = None
+        self.throttled = 0
+        self.waited_s = 0.0
+        self._healthy = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    # -- admission --
+
+    def _reserve(self, tokens: int) -> float:
+        with self._lock:
+            return max(self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def _try_enter(self, waiter: Optional[Callable[[], None]] = None) -> bool:
+        """
+        Takes a free slot unless others are already queued for one; otherwise
+        queues `waiter` (if given) to be woken once a slot is handed to it.
+        """
+        with self._lock:
+            if self.in_flight < self.concurrency and not self._waiters:
+                self.in_flight += 1
+                return True
+            if waiter is not None:
+                self._waiters.append(waiter)
+            return False
+
+    def _hand_over(self) -> None:
+        # Called with the lock held: gives free slots to queued waiters in arrival order.
+        while self._waiters and self.in_flight < self.concurrency:
+            waiter = self._waiters.popleft()
+            self.in_flight += 1
+            try:
+                waiter()
+            except RuntimeError:  # the waiter's event loop has closed
+                self.in_flight -= 1
+
+    def _return_slot(self) -> None:
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._hand_over()
+
+    def _queue_estimate(self) -> float:
+        with self._lock:
+            return (self.latency_ewma or 1.0) * len(self._waiters) / self.concurrency
+
+    def acquire(self, tokens: int) -> None:
+        wait = self._reserve(tokens)
+        if wait:
+            notify_wait(wait, f"{self.name} rate limit")
+            time.sleep(wait)
+        started = time.monotonic()
+        granted = threading.Event()
+        if not self._try_enter(granted.set):
+            notify_wait(self._queue_estimate(), f"{self.name} concurrency limit")
+            granted.wait()
+        self._add_wait(wait + time.monotonic() - started)
+
+    async def aacquire(self, tokens: int) -> None:
+        wait = self._reserve(tokens)
+        if wait:
+            notify_wait(wait, f"{self.name} rate limit")
+            await asyncio.sleep(wait)
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def grant() -> None:
+            if granted.done():  # the waiter was cancelled before the slot reached it
+                self._return_slot()
+            else:
+                granted.set_result(None)
+
+        def waiter() -> None:
+            loop.call_soon_threadsafe(grant)
+
+        if not self._try_enter(waiter):
+            notify_wait(self._queue_estimate(), f"{self.name} concurrency limit")
+            try:
+                await granted
+            except asyncio.CancelledError:
+                with self._lock:
+                    queued = waiter in self._waiters
+                    if queued:
+                        self._waiters.remove(waiter)
+                if not queued and granted.done() and not granted.cancelled():
+                    self._return_slot()
+                raise
+        self._add_wait(wait + time.monotonic() - started)
+
+    def _add_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.waited_s += seconds
+
+    # -- feedback --
+
+    def release(self, status_code: Optional[int], latency: float) -> None:
+        """
+        Frees the slot and adapts concurrency: multiplicative decrease on 429s and
+        latency spikes (at most once per second), +1 after a window of healthy calls.
+        Free slots go straight to the longest-waiting request.
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            self._adapt(status_code, latency)
+            self._hand_over()
+
+    def _adapt(self, status_code: Optional[int], latency: float) -> None:
+        now = time.monotonic()
+        if status_code == 429:
+            self.throttled += 1
+            self._decrease(now, halve=True)
+            return
+        if status_code is None or status_code >= 500:
+            return
+        spike = self.latency_ewma is not None and latency > LATENCY_SPIKE_FACTOR * self.latency_ewma
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if spike:
+            self._decrease(now, halve=False)
+            return
+        self._healthy += 1
+        if self._healthy >= self.concurrency and self.concurrency < self.max_concurrency:
+            self.concurrency += 1
+            self._healthy = 0
+
+    def _decrease(self, now: float, halve: bool) -> None:
+        self._healthy = 0
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.concurrency = max(1, self.concurrency // 2 if halve else self.concurrency - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "concurrency": self.concurrency,
+                "in_flight": self.in_flight,
+                "waiting": len(self._waiters),
+                "throttled": self.throttled,
+                "waited_s": round(self.waited_s, 2),
+                "latency_ewma_s": round(self.latency_ewma or 0.0, 3),
+            }
+
+
+def backoff_delay(attempt: int, response: httpx.Response) -> float:
+    """
+    Full-jitter exponential backoff, never shorter than the provider's Retry-After.
+    """
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    try:
+        delay = max(delay, float(response.headers.get("retry-after", 0)))
+    except ValueError:
+        pass
+    return delay
+
+
+def _build_limiters(processes: int) -> Dict[str, ProviderLimiter]:
+    concurrency = max(1, LLM_MAX_CONCURRENCY // processes)
+    return {
+        "chat": ProviderLimiter("chat", LLM_RPM / processes, LLM_TPM / processes, concurrency),
+        "embeddings": ProviderLimiter("embeddings", EMBEDDING_RPM / processes, EMBEDDING_TPM / processes, concurrency),
+    }
+
+
+_limiters = _build_limiters(1)
+
+
+def share_budget(processes: int) -> None:
+    """
+    Limits this process to 1/`processes` of every budget (requests, tokens and
+    concurrency). Call before the first request; counters start fresh.
+    """
+    global _limiters
+    _limiters = _build_limiters(max(1, processes))
+
+
+def limiter_for(request: httpx.Request) -> Optional[ProviderLimiter]:
+    path = request.url.path
+    if path.endswith("/chat/completions"):
+        return _limiters["chat"]
+    if path.endswith("/embeddings"):
+        return _limiters["embeddings"]
+    return None
+
+
+def estimate_tokens(request: httpx.Request) -> int:
+    """
+    Rough prompt + completion token count for the TPM bucket: exact for embedding
+    inputs sent as token ids, 4 characters per token for text.
+    """
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return LLM_COMPLETION_TOKEN_ESTIMATE
+    if "input" in body:
+        inputs = body["input"]
+        # A single token-id list, a list of them (what OpenAIEmbeddings sends), or text.
+        if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        return sum(len(item) if isinstance(item, list) else len(str(item)) // 4 for item in inputs) + 1
+    prompt_chars = sum(len(str(message.get("content", ""))) for message in body.get("messages", []))
+    completion = body.get("max_completion_tokens") or body.get("max_tokens") or LLM_COMPLETION_TOKEN_ESTIMATE
+    return prompt_chars // 4 + int(completion)
+
+
+def limiter_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
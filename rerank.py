@@ -0,0 +1,84 @@
+"""
+Maximal-marginal-relevance reranking of retrieval candidates.
+
+Works on the candidate embedding matrix: query similarities and the pairwise
+candidate similarities are computed once with two matrix products, then each
+pick is an argmax over `lambda * relevance - (1 - lambda) * redundancy` with
+already chosen rows and titles at their cap masked out. With a few hundred
+candidates and a handful of picks this stays well under a millisecond.
+
+`reciprocal_rank_fusion` merges the dense and BM25 rankings for hybrid retrieval.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> Dict[str, float]:
+    """
+    Fuses ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] = fused.get(item, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+def mmr_select(
+    query: Sequence[float],
+    candidates: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.7,
+    titles: Optional[Sequence[Optional[str]]] = None,
+    max_per_title: int = 0,
+    eligible: Optional[np.ndarray] = None,
+    relevance: Optional[np.ndarray] = None,
+) -> List[int]:
+    """
+    Indices of up to `k` candidate rows in pick order.
+
+    lambda_mult: 1.0 ranks purely by relevance, lower values favour chunks unlike
+        those already picked.
+    max_per_title: at most this many chunks per title (0 = no cap).
+    eligible: optional boolean mask; rows outside it are never picked.
+    relevance: optional per-row relevance in [0, 1] replacing cosine similarity to
+        the query (e.g. fused hybrid scores).
+    """
+    count = len(candidates)
+    if count == 0 or k <= 0:
+        return []
+    vectors = _normalize(np.asarray(candidates, dtype=np.float32))
+    if relevance is None:
+        relevance = vectors @ _normalize(np.asarray(query, dtype=np.float32))
+    relevance = np.asarray(relevance, dtype=np.float32)
+    pairwise = vectors @ vectors.T
+
+    title_ids = None
+    if titles is not None and max_per_title > 0:
+        _, title_ids = np.unique([title or "" for title in titles], return_inverse=True)
+        title_counts = np.zeros(title_ids.max() + 1, dtype=np.int32)
+
+    available = np.ones(count, dtype=bool) if eligible is None else np.asarray(eligible, dtype=bool).copy()
+    # Highest similarity to any picked row; anti-correlated rows get no bonus.
+    redundancy = np.zeros(count, dtype=np.float32)
+    chosen: List[int] = []
+    while len(chosen) < k and available.any():
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        pick = int(np.argmax(scores))
+        chosen.append(pick)
+        available[pick] = False
+        redundancy = np.maximum(redundancy, pairwise[pick])
+        if title_ids is not None:
+            title_counts[title_ids[pick]] += 1
+            if title_counts[title_ids[pick]] >= max_per_title:
+                available &= title_ids != title_ids[pick]
+    return chosen
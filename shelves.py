@@ -0,0 +1,61 @@
+"""
+Routes a reader profile to the catalog shelves worth searching.
+
+Age picks the allowed age bands (children / teen / adult, see
+fetchbooktitles.AGE_BANDS); words in `preferred_theme` pick shelves by keyword.
+A theme match narrows the search to those shelves (kept within the reader's
+bands when possible), otherwise every shelf in the reader's bands is searched.
+Unshelved books are always included. `None` means search everything.
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Optional
+
+from fetchbooktitles import UNSHELVED, age_band_of, groups
+from questionnaire import UserProfile
+
+SHELF_KEYWORDS = {
+    "children": ["children", "child", "kids", "fairy tale", "bedtime"],
+    "teen": ["teen", "young adult", "ya", "coming of age", "school"],
+    "classics": ["classic", "classics", "novel", "literary", "literature"],
+    "fantasy": ["fantasy", "magic", "dragon", "wizard", "myth"],
+    "science fiction": ["science fiction", "sci-fi", "scifi", "space", "future", "robot", "dystopia"],
+    "mystery": ["mystery", "detective", "crime", "thriller", "suspense", "murder"],
+    "romance": ["romance", "romantic", "love"],
+    "adventure": ["adventure", "quest", "journey", "pirate", "explore", "exploration"],
+    "philosophical essays": ["philosophy", "philosophical", "essay", "essays", "stoic", "meaning"],
+    "academic nonfiction": ["nonfiction", "non-fiction", "history", "science", "academic", "economics"],
+    "poetry": ["poetry", "poem", "poems", "verse"],
+    "folklore": ["folklore", "folk", "legend", "legends", "fable"],
+    "religion": ["religion", "religious", "spiritual", "faith", "bible"],
+}
+
+
+def age_bands_for(age: int) -> List[str]:
+    if age < 13:
+        return ["children"]
+    if age < 18:
+        return ["children", "teen"]
+    return ["teen", "adult"]
+
+
+def themed_shelves(theme: str) -> List[str]:
+    text = theme.lower()
+    return [
+        shelf for shelf, keywords in SHELF_KEYWORDS.items()
+        if any(re.search(rf"\b{re.escape(keyword)}\b", text) for keyword in keywords)
+    ]
+
+
+def route_shelves(profile: UserProfile) -> Optional[List[str]]:
+    """
+    Shelves to search for this reader, or None when that would be all of them.
+    """
+    bands = age_bands_for(profile.age)
+    in_band = [shelf for shelf in groups if age_band_of(shelf) in bands]
+    themed = themed_shelves(profile.preferred_theme or "")
+    shelves = [shelf for shelf in themed if shelf in in_band] or themed or in_band
+    if set(shelves) >= set(groups):
+        return None
+    return sorted(shelves) + [UNSHELVED]
@@ -0,0 +1,147 @@
+"""
+Local BM25 inverted index over the vector store's chunks.
+
+Dense similarity on a query made mostly of style words does poorly on author
+names and concrete terms; exact term matching covers them. The index is
+rebuilt from the Chroma collection whenever a build changes it and stored as
+flat arrays that are memory-mapped on load:
+
+  postings.npy    int32 chunk rows, grouped by term
+  tfs.npy         uint16 term frequencies, parallel to postings
+  term_starts.npy int64 start of each term's postings (+ final end)
+  norms.npy       float32 per-chunk BM25 length norm k1 * (1 - b + b * len / avg)
+  terms.json      vocabulary in term-id order
+  ids.json        chunk ids in row order (the Chroma ids)
+  shelves.npy     uint16 shelf of each chunk, indexing shelf_names.json
+
+Scoring a query is a few vectorised array updates per query term. Builds are
+published as whole generations like the NumPy vector index (see vector_index.py).
+"""
+from __future__ import annotations
+
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from vector_index import _publish, current_generation
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+EXPORT_PAGE_SIZE = 5000
+
+_TOKEN = re.compile(r"[a-z0-9][a-z0-9']*")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i in is it its me my no not of on or "
+    "our she so that the their them there they this to was we were what when which who will with you your "
+    "would could into than then out up".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN.findall(text.lower()) if token not in _STOPWORDS and len(token) > 1]
+
+
+def build_sparse_index(collection: Any, directory: Path) -> int:
+    """
+    Tokenizes every chunk of a Chroma collection and writes the index files.
+    Returns the number of chunks indexed.
+    """
+    ids: List[str] = []
+    lengths: List[int] = []
+    term_rows: Dict[str, List[Tuple[int, int]]] = {}
+    shelf_names: Dict[str, int] = {}
+    shelf_rows: List[int] = []
+    total = collection.count()
+    for offset in range(0, total, EXPORT_PAGE_SIZE):
+        page = collection.get(include=["documents", "metadatas"], limit=EXPORT_PAGE_SIZE, offset=offset)
+        for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            row = len(ids)
+            ids.append(chunk_id)
+            shelf = (metadata or {}).get("shelf", "")
+            shelf_rows.append(shelf_names.setdefault(shelf, len(shelf_names)))
+            counts = Counter(tokenize(document or ""))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_rows.setdefault(term, []).append((row, tf))
+
+    terms = sorted(term_rows)
+    term_starts = np.zeros(len(terms) + 1, dtype=np.int64)
+    np.cumsum([len(term_rows[term]) for term in terms], out=term_starts[1:])
+    postings = np.fromiter((row for term in terms for row, _ in term_rows[term]), dtype=np.int32, count=int(term_starts[-1]))
+    tfs = np.fromiter((min(tf, 65535) for term in terms for _, tf in term_rows[term]), dtype=np.uint16, count=int(term_starts[-1]))
+    doc_lengths = np.asarray(lengths, dtype=np.float32)
+    average = float(doc_lengths.mean()) if len(doc_lengths) else 1.0
+    norms = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_lengths / (average or 1.0))
+
+    _publish(directory, {
+        "postings.npy": lambda handle: np.save(handle, postings),
+        "tfs.npy": lambda handle: np.save(handle, tfs),
+        "term_starts.npy": lambda handle: np.save(handle, term_starts),
+        "norms.npy": lambda handle: np.save(handle, norms.astype(np.float32)),
+        "terms.json": lambda handle: handle.write(json.dumps(terms).encode("utf-8")),
+        "shelves.npy": lambda handle: np.save(handle, np.asarray(shelf_rows, dtype=np.uint16)),
+        "shelf_names.json": lambda handle: handle.write(json.dumps(list(shelf_names)).encode("utf-8")),
+        "ids.json": lambda handle: handle.write(json.dumps(ids).encode("utf-8")),
+    })
+    return len(ids)
+
+
+def has_sparse_index(directory: Path) -> bool:
+    generation = current_generation(directory)
+    return (generation / "ids.json").exists() and (generation / "shelves.npy").exists()
+
+
+class SparseIndex:
+    """
+    Memory-mapped BM25 index; `search` returns chunk ids with their scores.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = current_generation(directory)
+        self.postings = np.load(self.directory / "postings.npy", mmap_mode="r")
+        self.tfs = np.load(self.directory / "tfs.npy", mmap_mode="r")
+        self.term_starts = np.load(self.directory / "term_starts.npy", mmap_mode="r")
+        self.norms = np.load(self.directory / "norms.npy", mmap_mode="r")
+        self.ids: List[str] = json.loads((self.directory / "ids.json").read_text(encoding="utf-8"))
+        self.shelves = np.load(self.directory / "shelves.npy", mmap_mode="r")
+        self.shelf_ids = {name: index for index, name in enumerate(json.loads((self.directory / "shelf_names.json").read_text(encoding="utf-8")))}
+        terms = json.loads((self.directory / "terms.json").read_text(encoding="utf-8"))
+        self.term_ids = {term: index for index, term in enumerate(terms)}
+        if len(self.norms) != len(self.ids) or len(self.term_starts) != len(terms) + 1:
+            raise ValueError(f"BM25 index at '{self.directory}' is inconsistent; rebuild it with build_rag_db.py")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: str, k: int, shelves: Optional[Collection[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (chunk id, BM25 score) pairs, best first; chunks matching no query term
+        (or, with `shelves`, outside those shelves) are left out.
+        """
+        count = len(self.ids)
+        scores = np.zeros(count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.term_ids.get(term)
+            if term_id is None:
+                continue
+            start, end = int(self.term_starts[term_id]), int(self.term_starts[term_id + 1])
+            rows = self.postings[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            idf = math.log(1.0 + (count - (end - start) + 0.5) / ((end - start) + 0.5))
+            # Each row appears once per term, so plain fancy-index addition is safe.
+            scores[rows] += idf * tf * (BM25_K1 + 1.0) / (tf + self.norms[rows])
+        if shelves is not None:
+            wanted = [self.shelf_ids[shelf] for shelf in shelves if shelf in self.shelf_ids]
+            scores[~np.isin(self.shelves, wanted)] = 0.0
+        matched = int(np.count_nonzero(scores))
+        k = min(k, matched)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[row], float(scores[row])) for row in top]
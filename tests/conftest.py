@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# The modules live at the repository root; the offline models in fake_llm.py let
+# modules that build LLM clients at import time load without credentials.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("MAIN_MODEL", "fake")
+os.environ.setdefault("EMBEDDING_MODEL", "fake")
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
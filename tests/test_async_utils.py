@@ -0,0 +1,64 @@
+import asyncio
+import contextvars
+
+import pytest
+
+from async_utils import iterate_sync, run_sync
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+async def running_loop():
+    return asyncio.get_running_loop()
+
+
+def test_sync_calls_share_one_long_lived_loop():
+    first, second = run_sync(running_loop()), run_sync(running_loop())
+    assert first is second and first.is_running()
+
+
+def test_context_variables_reach_the_coroutine():
+    async def read():
+        return request_id.get()
+
+    token = request_id.set("book-1")
+    try:
+        assert run_sync(read()) == "book-1"
+    finally:
+        request_id.reset(token)
+
+
+def test_errors_propagate_to_the_caller():
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        run_sync(fail())
+
+
+def test_closing_early_closes_the_async_generator():
+    closed = []
+
+    async def numbers():
+        try:
+            for n in range(10):
+                yield n
+        finally:
+            closed.append(True)
+
+    stream = iterate_sync(numbers())
+    assert [next(stream), next(stream)] == [0, 1]
+    stream.close()
+    assert closed == [True]
+
+
+def test_run_sync_refuses_a_running_loop():
+    async def nested():
+        coroutine = running_loop()
+        try:
+            run_sync(coroutine)
+        finally:
+            coroutine.close()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(nested())
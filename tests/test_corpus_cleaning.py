@@ -0,0 +1,107 @@
+import random
+
+import pytest
+
+from corpus_cleaning import NearDuplicateIndex, gutenberg_title, minhash, strip_gutenberg_boilerplate
+
+BODY = (
+    "CHAPTER I. The Voyage\n\n"
+    "It was a bright cold morning when the ship left the harbour.\n\n"
+    "CHAPTER II. The Storm\n\n"
+    "By nightfall the sea had turned against them."
+)
+
+HEADER = (
+    "The Project Gutenberg eBook of Sea Tales\n\n"
+    "This eBook is for the use of anyone anywhere in the United States.\n\n"
+    "Title: Sea Tales\n\n"
+    "Author: Anonymous\n\n"
+    "*** START OF THE PROJECT GUTENBERG EBOOK SEA TALES ***\n\n"
+    "Produced by Volunteers at Distributed Proofreaders\n\n"
+)
+
+FOOTER = (
+    "\n\n*** END OF THE PROJECT GUTENBERG EBOOK SEA TALES ***\n\n"
+    "Updated editions will replace the previous one.\n"
+)
+
+
+def test_header_credits_and_footer_are_removed():
+    assert strip_gutenberg_boilerplate(HEADER + BODY + FOOTER) == BODY
+    assert gutenberg_title(HEADER) == "Sea Tales"
+
+
+def test_old_style_markers_are_recognised():
+    text = (
+        "Legal small print.\n*END*THE SMALL PRINT! FOR PUBLIC DOMAIN ETEXTS*Ver.04.29.93*END*\n\n"
+        + BODY
+        + "\n\nEnd of the Project Gutenberg EBook of Sea Tales\n\nMore license text."
+    )
+    assert strip_gutenberg_boilerplate(text) == BODY
+
+
+def test_text_without_markers_keeps_its_body():
+    assert strip_gutenberg_boilerplate(BODY) == BODY
+
+
+def test_illustrations_are_dropped():
+    text = BODY.replace("harbour.", "harbour.\n\n[Illustration: The ship at dawn]")
+    assert strip_gutenberg_boilerplate(text) == BODY
+
+
+def test_table_of_contents_is_dropped():
+    contents = "CONTENTS\n\nCHAPTER I. The Voyage . . . 1\nCHAPTER II. The Storm . . . 9\n\n"
+    assert strip_gutenberg_boilerplate(HEADER + contents + BODY + FOOTER) == BODY
+
+
+def test_long_prose_after_a_contents_heading_is_kept():
+    prose = "Contents\n\n" + " ".join(["This paragraph is an ordinary piece of narrative prose."] * 4) + "\n\n" + BODY
+    assert strip_gutenberg_boilerplate(prose) == prose
+
+
+def passage(seed: int, words: int = 150) -> str:
+    rng = random.Random(seed)
+    return " ".join(f"w{rng.randrange(5000)}" for _ in range(words))
+
+
+def edit(text: str, changed: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    words = text.split()
+    for position in rng.sample(range(len(words)), changed):
+        words[position] = f"x{position}"
+    return " ".join(words)
+
+
+def test_minhash_of_text_without_words_is_none():
+    assert minhash(" ... ") is None
+
+
+def test_identical_and_lightly_edited_chunks_are_duplicates():
+    index = NearDuplicateIndex(threshold=0.8)
+    original = passage(0)
+    assert index.add_if_new(minhash(original))
+    assert not index.add_if_new(minhash(original))
+    # One changed word in 150 touches at most five of ~146 shingles (Jaccard ~0.93).
+    assert not index.add_if_new(minhash(edit(original, 1)))
+
+
+def test_unrelated_and_heavily_edited_chunks_are_kept():
+    index = NearDuplicateIndex(threshold=0.8)
+    original = passage(0)
+    index.add(minhash(original))
+    assert index.add_if_new(minhash(passage(1)))
+    # One word in ten changed leaves well under half the shingles intact.
+    assert index.add_if_new(minhash(edit(original, 15)))
+
+
+@pytest.mark.parametrize("threshold, duplicate", [(0.5, True), (0.99, False)])
+def test_threshold_decides_borderline_pairs(threshold, duplicate):
+    index = NearDuplicateIndex(threshold=threshold)
+    original = passage(0)
+    index.add(minhash(original))
+    # Three changed words in 150 keep roughly 80% of the shingles.
+    assert (index.find(minhash(edit(original, 3))) is not None) == duplicate
+
+
+def test_chunks_without_words_are_always_kept():
+    assert NearDuplicateIndex().add_if_new(None)
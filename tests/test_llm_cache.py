@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.prompt_values import ChatPromptValue
+
+import llm_cache
+import llm_config
+from fake_llm import FakeChatModel
+from llm_cache import DiskLLMCache, stream_through_cache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskLLMCache(tmp_path / "responses.sqlite3", max_entries=0, max_bytes=0, max_age_seconds=0)
+
+
+def fake_model(cache, temperature=0.0):
+    return FakeChatModel(latency=0.0, tokens_per_second=0.0, temperature=temperature, cache=cache)
+
+
+def prompt(text):
+    return ChatPromptValue(messages=[HumanMessage(content=text)])
+
+
+def test_repeated_call_is_a_hit(cache):
+    llm = fake_model(cache)
+    first = llm.invoke("Write a <<<TEXT\nshort story\n>>> please").content
+    second = llm.invoke("Write a <<<TEXT\nshort story\n>>> please").content
+    assert first == second
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["entries"] == 1
+
+
+def test_other_prompt_or_settings_miss(cache):
+    fake_model(cache).invoke("first prompt")
+    fake_model(cache).invoke("second prompt")
+    fake_model(cache, temperature=0.9).invoke("first prompt")
+    assert cache.stats()["hits"] == 0
+    assert cache.stats()["entries"] == 3
+
+
+def test_entries_expire_after_max_age(tmp_path, monkeypatch):
+    cache = DiskLLMCache(tmp_path / "responses.sqlite3", max_entries=0, max_bytes=0, max_age_seconds=60)
+    now = [1_000_000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    llm = fake_model(cache)
+    llm.invoke("aging prompt")
+    now[0] += 30
+    llm.invoke("aging prompt")
+    assert cache.stats()["hits"] == 1
+    now[0] += 61
+    llm.invoke("aging prompt")
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "EVICT_EVERY_WRITES", 1)
+    cache = DiskLLMCache(tmp_path / "responses.sqlite3", max_entries=2, max_bytes=0, max_age_seconds=0)
+    now = [1_000_000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    llm = fake_model(cache)
+    for text in ("prompt a", "prompt b"):
+        now[0] += 1
+        llm.invoke(text)
+    now[0] += 1
+    llm.invoke("prompt a")  # a becomes the most recently used
+    now[0] += 1
+    llm.invoke("prompt c")  # over the limit: b goes
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
+    hits = cache.stats()["hits"]
+    llm.invoke("prompt a")
+    assert cache.stats()["hits"] == hits + 1
+    llm.invoke("prompt b")
+    assert cache.stats()["hits"] == hits + 1
+
+
+def test_eviction_only_runs_every_n_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "EVICT_EVERY_WRITES", 3)
+    cache = DiskLLMCache(tmp_path / "responses.sqlite3", max_entries=1, max_bytes=0, max_age_seconds=0)
+    llm = fake_model(cache)
+    for n in range(3):
+        llm.invoke(f"prompt {n}")
+    assert cache.stats()["entries"] == 3  # soft overrun until the next check
+    llm.invoke("prompt 3")
+    assert cache.stats()["entries"] == 1
+
+
+def test_stream_replays_a_stored_response_as_one_chunk(cache):
+    streamed = stream_through_cache(fake_model(cache))
+    value = prompt("<<<TEXT\n" + "A longer passage of text to stream in pieces. " * 20 + "\n>>>")
+    first = list(streamed.stream(value))
+    second = list(streamed.stream(value))
+    assert len(first) > 1
+    assert len(second) == 1
+    assert second[0].content == "".join(chunk.content for chunk in first)
+    assert cache.stats()["hits"] == 1
+
+
+def test_async_stream_shares_entries_with_sync_calls(cache):
+    llm = fake_model(cache)
+    value = prompt("<<<TEXT\nshared between sync and async\n>>>")
+    expected = llm.invoke(value.to_messages()).content
+
+    async def collect():
+        return [chunk async for chunk in stream_through_cache(llm).astream(value)]
+
+    chunks = asyncio.run(collect())
+    assert [chunk.content for chunk in chunks] == [expected]
+    assert cache.stats()["hits"] == 1
+
+
+def test_model_without_cache_is_returned_unchanged():
+    llm = fake_model(False)
+    assert stream_through_cache(llm) is llm
+
+
+def test_skipped_stages_bypass_the_cache(cache, monkeypatch):
+    monkeypatch.setattr(llm_config, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_config, "_llm_cache", cache)
+    monkeypatch.setattr(llm_config, "_llm_registry", {})
+    monkeypatch.setattr(llm_config, "LLM_CACHE_SKIP_STAGES", {"plan", "draft"})
+    assert llm_config.get_llm(stage="plan").cache is False
+    assert llm_config.get_llm(stage="draft").cache is False
+    assert llm_config.get_llm(stage="edit").cache is cache
+    assert llm_config.get_llm().cache is cache
+
+
+def test_empty_skip_list_caches_every_stage(cache, monkeypatch):
+    monkeypatch.setattr(llm_config, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_config, "_llm_cache", cache)
+    monkeypatch.setattr(llm_config, "_llm_registry", {})
+    monkeypatch.setattr(llm_config, "LLM_CACHE_SKIP_STAGES", set())
+    assert llm_config.get_llm(stage="plan").cache is cache
@@ -0,0 +1,59 @@
+from manuscript import locate_passages, split_paragraphs
+
+MANUSCRIPT = (
+    "Chapter 1\n\n"
+    "The river ran black beneath the old bridge that night.\n\n"
+    "Mara counted the lanterns twice before she trusted her eyes.\n\n"
+    "Chapter 2\n\n"
+    "Morning came slowly over the author's favourite hills.\n\n"
+    "Nobody in the village spoke about the bridge again."
+)
+
+
+def locate(snippets):
+    pieces = split_paragraphs(MANUSCRIPT)
+    return {pieces[idx]: found for idx, found in locate_passages(pieces, snippets).items()}
+
+
+def test_double_quoted_phrase_matches_its_paragraph():
+    snippet = 'Flat imagery: "the river ran black beneath the old bridge"'
+    assert locate([snippet]) == {"The river ran black beneath the old bridge that night.": [snippet]}
+
+
+def test_curly_quotes_and_apostrophes_are_normalized():
+    snippet = "Clichéd: “morning came slowly over the author’s favourite hills”"
+    assert list(locate([snippet])) == ["Morning came slowly over the author's favourite hills."]
+
+
+def test_possessives_do_not_open_a_single_quoted_phrase():
+    # Without word-boundary rules the apostrophes in "Mara's" and "author's" would
+    # delimit a bogus quote spanning both; the whole snippet is matched fuzzily instead.
+    snippet = "Mara's doubt and the author's pacing: she counted the lanterns twice before she trusted her eyes"
+    assert list(locate([snippet])) == ["Mara counted the lanterns twice before she trusted her eyes."]
+
+
+def test_single_quoted_phrase_with_inner_apostrophe():
+    snippet = "Weak line: 'morning came slowly over the author's favourite hills'"
+    assert list(locate([snippet])) == ["Morning came slowly over the author's favourite hills."]
+
+
+def test_section_reference_selects_first_body_paragraphs():
+    found = locate(["Chapter 2 drags"])
+    assert list(found) == [
+        "Morning came slowly over the author's favourite hills.",
+        "Nobody in the village spoke about the bridge again.",
+    ]
+
+
+def test_roman_numeral_reference_matches_numbered_heading():
+    pieces = split_paragraphs("II. The Return\n\nShe came home at dusk and the dogs did not bark.")
+    assert list(locate_passages(pieces, ["Section II feels rushed"])) == [2]
+
+
+def test_unmatched_snippets_are_dropped():
+    assert locate(['"a sentence that appears nowhere in this book"', "Too short"]) == {}
+
+
+def test_split_paragraphs_rejoins_byte_exactly():
+    text = "One.\n\n  Two.\nThree.\n\n\n"
+    assert "".join(split_paragraphs(text)) == text
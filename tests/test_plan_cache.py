@@ -0,0 +1,97 @@
+import asyncio
+import math
+
+import pytest
+
+import pipeline
+import plan_cache
+from plan_cache import PlanCache
+from questionnaire import UserProfile
+from tracing import SessionTrace, activate, stage
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return PlanCache(tmp_path / "plans.sqlite3")
+
+
+def profile(age=8, pages=10):
+    return UserProfile(age=age, preferred_theme="sea", purpose_of_reading="fun", mood_today="happy", length_in_pages=pages)
+
+
+def at_similarity(similarity, dimensions=4):
+    """A unit vector whose cosine similarity to [1, 0, 0, ...] is `similarity`."""
+    return [similarity, math.sqrt(1 - similarity ** 2)] + [0.0] * (dimensions - 2)
+
+
+BASE = at_similarity(1.0)
+
+
+def test_near_identical_profile_reuses_the_plan(cache):
+    cache.store(profile(), BASE, "the plan")
+    match = cache.lookup(profile(), at_similarity(0.99))
+    assert match.plan == "the plan" and not match.adapt
+    assert cache.stats()["hits"] == 1
+
+
+def test_similar_profile_gets_the_plan_to_adapt(cache):
+    cache.store(profile(), BASE, "the plan")
+    match = cache.lookup(profile(), at_similarity(0.95))
+    assert match.adapt
+    assert cache.stats()["adapted_hits"] == 1
+
+
+def test_dissimilar_profile_misses(cache):
+    cache.store(profile(), BASE, "the plan")
+    assert cache.lookup(profile(), at_similarity(0.9)) is None
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.parametrize("age, pages, found", [(13, 10, True), (14, 10, False), (3, 10, True), (8, 12, False)])
+def test_age_gap_and_page_count_gate_candidates(cache, age, pages, found):
+    cache.store(profile(age=8, pages=10), BASE, "the plan")
+    assert (cache.lookup(profile(age=age, pages=pages), BASE) is not None) == found
+
+
+def test_entries_stop_matching_after_max_reuses(cache):
+    cache.store(profile(), BASE, "the plan")
+    for _ in range(plan_cache.PLAN_CACHE_MAX_REUSES):
+        assert cache.lookup(profile(), BASE) is not None
+    assert cache.lookup(profile(), BASE) is None
+    assert cache.stats()["exhausted_entries"] == 1
+
+
+def test_least_used_entry_is_claimed_first(cache):
+    cache.store(profile(), BASE, "closest")
+    cache.store(profile(), at_similarity(0.98), "close")
+    claimed = [cache.lookup(profile(), BASE).plan for _ in range(4)]
+    assert claimed == ["closest", "close", "closest", "close"]
+
+
+def test_entries_of_another_embedding_dimension_are_ignored(cache):
+    cache.store(profile(), BASE, "the plan")
+    assert cache.lookup(profile(), at_similarity(1.0, dimensions=8)) is None
+
+
+def test_adapted_plan_is_recorded_in_the_trace(cache, monkeypatch):
+    cache.store(profile(), BASE, "the plan")
+
+    class Embeddings:
+        def embed_query(self, text):
+            return at_similarity(0.95)
+
+    async def adaptation(profile, cached_plan):
+        yield f"adapted {cached_plan}"
+
+    monkeypatch.setattr(pipeline, "get_plan_cache", lambda: cache)
+    monkeypatch.setattr(pipeline, "embeddings", Embeddings())
+    monkeypatch.setattr(pipeline, "astream_plan_adaptation", adaptation)
+
+    async def collect():
+        return [event async for event in pipeline.aiter_plan_events(profile())]
+
+    trace = SessionTrace("test")
+    with activate(trace), stage("plan") as record:
+        events = asyncio.run(collect())
+    assert events[-1]["content"] == "adapted the plan"
+    assert record.adapted_hits == 1 and record.cache_hits == 0
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from quantization import approximate_scores, code_bytes, encode_int8, quantize, train_int8, train_pq
+from vector_index import NumpyVectorIndex, export_numpy_index
+
+K = 10
+
+
+def unit_rows(rng, rows, dim):
+    matrix = rng.normal(size=(rows, dim)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    rng = np.random.default_rng(7)
+    matrix = unit_rows(rng, 3000, 32)
+    queries = matrix[rng.choice(len(matrix), size=50, replace=False)]
+    queries = queries + rng.normal(scale=0.3 / np.sqrt(32), size=queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return matrix, queries
+
+
+def recall(matrix, queries, arrays, rescore):
+    hits = 0
+    for query in queries:
+        truth = set(np.argpartition(-(matrix @ query), K - 1)[:K])
+        approximate = approximate_scores(arrays, query, 0, len(matrix))
+        shortlist = np.argpartition(-approximate, rescore - 1)[:rescore]
+        found = shortlist[np.argpartition(-(matrix[shortlist] @ query), K - 1)[:K]]
+        hits += len(truth & set(found))
+    return hits / (len(queries) * K)
+
+
+def test_int8_round_trip_error_is_within_half_a_step():
+    matrix = unit_rows(np.random.default_rng(0), 200, 16)
+    scales = train_int8(matrix)
+    codes = encode_int8(matrix, scales)
+    assert codes.dtype == np.int8
+    assert np.all(np.abs(codes.astype(np.float32) * scales - matrix) <= scales / 2 + 1e-6)
+
+
+@pytest.mark.parametrize("method, min_recall", [("int8", 0.98), ("pq", 0.9)])
+def test_rescored_recall(corpus, method, min_recall):
+    matrix, queries = corpus
+    arrays = quantize(matrix, method)
+    assert recall(matrix, queries, arrays, rescore=K * 10) >= min_recall
+
+
+def test_pq_codes_are_a_byte_per_subvector(corpus):
+    matrix, _ = corpus
+    arrays = quantize(matrix, "pq")
+    assert arrays["pq_codes"].shape == (len(matrix), 32 // 8)
+    assert arrays["pq_codes"].dtype == np.uint8
+    assert arrays["pq_codes"].nbytes * 32 == matrix.nbytes
+
+
+def test_pq_needs_a_divisible_dimension():
+    with pytest.raises(ValueError):
+        train_pq(np.zeros((10, 30), dtype=np.float32), subvector_dim=8)
+
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        quantize(np.zeros((4, 8), dtype=np.float32), "int4")
+
+
+def test_none_stores_no_codes():
+    assert quantize(np.zeros((4, 8), dtype=np.float32), "none") == {}
+    assert code_bytes({}) == 0
+
+
+def test_approximate_scores_cover_only_the_requested_span(corpus):
+    matrix, queries = corpus
+    arrays = quantize(matrix, "int8")
+    full = approximate_scores(arrays, queries[0], 0, len(matrix))
+    assert np.allclose(approximate_scores(arrays, queries[0], 100, 250), full[100:250])
+    assert approximate_scores({}, queries[0], 0, 10) is None
+
+
+class Collection:
+    def __init__(self, matrix):
+        self.matrix = matrix
+
+    def count(self):
+        return len(self.matrix)
+
+    def get(self, include, limit, offset):
+        rows = range(offset, min(len(self.matrix), offset + limit))
+        return {
+            "ids": [f"chunk-{row}" for row in rows],
+            "embeddings": self.matrix[offset:offset + limit].tolist(),
+            "documents": [f"text {row}" for row in rows],
+            "metadatas": [{"title": f"book {row % 3}", "shelf": "fiction"} for row in rows],
+        }
+
+
+@pytest.mark.parametrize("method", ["int8", "pq"])
+def test_quantized_index_returns_the_exact_neighbour(tmp_path, corpus, method):
+    matrix, _ = corpus
+    export_numpy_index(Collection(matrix[:500]), tmp_path, quantization=method)
+    index = NumpyVectorIndex(tmp_path)
+    assert index.codes
+    documents = index.similarity_search_by_vector_with_relevance_scores(matrix[42].tolist(), k=3)
+    assert documents[0][0].id == "chunk-42"
+    assert documents[0][1] == pytest.approx(0.0, abs=1e-5)
@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+import rate_limit
+from rate_limit import ProviderLimiter, TokenBucket, backoff_delay
+
+
+class Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def fill(limiter: ProviderLimiter, slots: int) -> None:
+    for _ in range(slots):
+        assert limiter._try_enter()
+
+
+def test_429_halves_concurrency_at_most_once_per_second(clock):
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=16)
+    fill(limiter, 3)
+    limiter.release(429, 1.0)
+    limiter.release(429, 1.0)  # same second: a burst of 429s counts once
+    assert limiter.concurrency == 8
+    clock.now += 1.5
+    limiter.release(429, 1.0)
+    assert limiter.concurrency == 4
+    assert limiter.throttled == 3
+
+
+def test_concurrency_never_drops_below_one(clock):
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=4)
+    for _ in range(10):
+        fill(limiter, 1)
+        limiter.release(429, 1.0)
+        clock.now += 2
+    assert limiter.concurrency == 1
+
+
+def test_healthy_window_adds_one_slot_up_to_the_maximum(clock):
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=3)
+    fill(limiter, 1)
+    limiter.release(429, 1.0)
+    assert limiter.concurrency == 1
+    for _ in range(20):
+        fill(limiter, 1)
+        limiter.release(200, 1.0)
+    assert limiter.concurrency == 3
+
+
+def test_latency_spike_decreases_by_one(clock):
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=8)
+    fill(limiter, 2)
+    limiter.release(200, 1.0)
+    limiter.release(200, 1.0 * (rate_limit.LATENCY_SPIKE_FACTOR + 1))
+    assert limiter.concurrency == 7
+
+
+def test_server_errors_leave_concurrency_alone(clock):
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=8)
+    fill(limiter, 1)
+    limiter.release(503, 5.0)
+    assert limiter.concurrency == 8
+    assert limiter.in_flight == 0
+
+
+def test_token_bucket_spaces_out_requests(clock):
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    clock.now += 2
+    assert bucket.reserve(1) == 0.0
+
+
+def test_disabled_bucket_never_waits():
+    assert TokenBucket(per_minute=0).reserve(10**6) == 0.0
+
+
+def response(headers=None) -> httpx.Response:
+    return httpx.Response(429, headers=headers or {})
+
+
+def test_backoff_is_bounded_by_the_exponential_cap(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: high)
+    assert backoff_delay(0, response()) == rate_limit.LLM_BACKOFF_BASE
+    assert backoff_delay(2, response()) == rate_limit.LLM_BACKOFF_BASE * 4
+    assert backoff_delay(50, response()) == rate_limit.LLM_BACKOFF_MAX
+
+
+def test_backoff_honours_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: low)
+    assert backoff_delay(0, response({"Retry-After": "7"})) == 7.0
+    assert backoff_delay(0, response({"retry-after": "2.5"})) == 2.5
+
+
+def test_backoff_ignores_unparseable_retry_after(monkeypatch):
+    monkeypatch.setattr(rate_limit.random, "uniform", lambda low, high: low)
+    assert backoff_delay(0, response({"Retry-After": "soon"})) == 0.0
+
+
+def test_share_budget_splits_every_limit(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_limiters", rate_limit._limiters)
+    rate_limit.share_budget(4)
+    chat = rate_limit._limiters["chat"]
+    assert chat.requests.per_minute == rate_limit.LLM_RPM / 4
+    assert chat.tokens.per_minute == rate_limit.LLM_TPM / 4
+    assert chat.max_concurrency == max(1, rate_limit.LLM_MAX_CONCURRENCY // 4)
+    request = httpx.Request("POST", "https://api.example.com/v1/embeddings")
+    assert rate_limit.limiter_for(request) is rate_limit._limiters["embeddings"]
+
+
+def test_slots_are_handed_to_waiting_threads_in_arrival_order():
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=1)
+    fill(limiter, 1)
+    order = []
+    threads = []
+    for name in range(3):
+        thread = threading.Thread(target=lambda name=name: (limiter.acquire(1), order.append(name)))
+        thread.start()
+        threads.append(thread)
+        while limiter.stats()["waiting"] < name + 1:
+            time.sleep(0.001)
+    for granted in range(1, 4):
+        limiter.release(200, 0.1)
+        deadline = time.monotonic() + 5
+        while len(order) < granted and time.monotonic() < deadline:
+            time.sleep(0.001)
+    for thread in threads:
+        thread.join(timeout=5)
+    assert order == [0, 1, 2]
+
+
+def test_async_waiter_is_woken_by_release_and_cancellation_frees_its_place():
+    limiter = ProviderLimiter("chat", rpm=0, tpm=0, max_concurrency=1)
+
+    async def scenario():
+        await limiter.aacquire(1)
+        cancelled = asyncio.create_task(limiter.aacquire(1))
+        waiting = asyncio.create_task(limiter.aacquire(1))
+        await asyncio.sleep(0.01)
+        assert limiter.stats()["waiting"] == 2
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        limiter.release(200, 0.1)
+        await asyncio.wait_for(waiting, timeout=1)
+        assert limiter.in_flight == 1 and limiter.stats()["waiting"] == 0
+        limiter.release(200, 0.1)
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_embedding_token_ids_are_counted_as_tokens():
+    body = {"model": "text-embedding-3-small", "input": [[1] * 1000, [2] * 24]}
+    request = httpx.Request("POST", "https://api.example.com/v1/embeddings", json=body)
+    assert rate_limit.estimate_tokens(request) == 1025
+    text = httpx.Request("POST", "https://api.example.com/v1/embeddings", json={"input": "x" * 400})
+    assert rate_limit.estimate_tokens(text) == 101
@@ -0,0 +1,72 @@
+from manuscript import ManuscriptChunk, restore_heading, split_sections, trim_context_echo
+from pipeline import stitch_edited_chunks
+
+
+def chapter(number: int, paragraphs: int) -> str:
+    body = "\n\n".join(f"Chapter {number} paragraph {i} tells more of the story." for i in range(paragraphs))
+    return f"Chapter {number}\n\n{body}"
+
+
+MANUSCRIPT = "Storm Country\n\n" + "\n\n".join(chapter(n, 6) for n in range(1, 5)) + "\n"
+
+
+def test_chunks_rejoin_byte_exactly():
+    chunks = split_sections(MANUSCRIPT, max_chars=400)
+    assert len(chunks) > 1
+    assert "".join(chunk.text for chunk in chunks) == MANUSCRIPT
+
+
+def test_chunks_respect_max_chars_and_carry_neighbour_context():
+    chunks = split_sections(MANUSCRIPT, max_chars=400)
+    assert all(len(chunk.text) <= 400 for chunk in chunks)
+    assert chunks[0].context_before == ""
+    assert chunks[-1].context_after == ""
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.context_before == [p for p in previous.text.split("\n") if p.strip()][-1]
+
+
+def test_small_sections_are_merged():
+    assert len(split_sections(MANUSCRIPT, max_chars=100_000)) == 1
+
+
+def test_headings_are_never_left_without_body():
+    for chunk in split_sections(MANUSCRIPT, max_chars=120):
+        lines = [line for line in chunk.text.split("\n") if line.strip()]
+        assert any("paragraph" in line for line in lines)
+
+
+def test_trim_context_echo_drops_repeated_context_sentences():
+    edited = "The door closed. She sat down. Rain began.\nIt kept raining. The end came."
+    trimmed = trim_context_echo(edited, context_before="The door closed.", context_after="The end came.")
+    assert trimmed == "She sat down. Rain began.\nIt kept raining."
+
+
+def test_trim_context_echo_keeps_text_without_echo():
+    edited = "Fresh opening. Fresh close."
+    assert trim_context_echo(edited, context_before="Something else.", context_after="Another thing.") == edited
+
+
+def test_restore_heading_reinserts_dropped_heading():
+    chunk = ManuscriptChunk(index=0, text="Chapter 2\n\nOld body.")
+    assert restore_heading(chunk, "New body.") == "Chapter 2\nNew body."
+    assert restore_heading(chunk, "**Chapter 2**\nNew body.") == "**Chapter 2**\nNew body."
+
+
+def test_stitch_unedited_chunks_is_byte_exact():
+    chunks = split_sections(MANUSCRIPT, max_chars=400)
+    assert stitch_edited_chunks(chunks, {}) == MANUSCRIPT
+
+
+def test_stitch_keeps_separators_and_trims_seam_echo():
+    chunks = split_sections(MANUSCRIPT, max_chars=400)
+    tail = chunks[0].text.strip().rsplit("\n", 1)[-1]
+    edited = {
+        0: chunks[0].text.strip().upper(),
+        1: f"{tail.upper()} {chunks[1].text.strip()}",
+    }
+    stitched = stitch_edited_chunks(chunks, edited)
+    expected = "".join(
+        chunk.wrap(edited.get(chunk.index, chunk.text.strip()) if chunk.index != 1 else chunk.text.strip())
+        for chunk in chunks
+    )
+    assert stitched == expected
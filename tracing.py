@@ -0,0 +1,268 @@
+"""
+Lightweight per-stage tracing for book generation.
+
+Each session gets a SessionTrace; `stage("draft")` / `stage("critique", round=2)`
+opens a record that collects wall time, LLM calls, cache hits, adapted plan-cache
+hits, HTTP retries and prompt/completion tokens until it closes. Records are
+appended to TRACE_PATH as JSONL and summarised with:
+python tracing.py [--path traces/traces.jsonl]
+
+LLM activity finds the open record through a context variable, so the pipeline
+code only marks stage boundaries; `traced()` keeps the variable set while an
+async generator runs, even when each step is driven from a fresh task.
+"""
+from __future__ import annotations
+
+import argparse
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, TypeVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+T = TypeVar("T")
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "1") == "1"
+TRACE_PATH = Path(os.getenv("TRACE_PATH", "traces/traces.jsonl"))
+# USD per million tokens, used for the cost estimate of each record.
+LLM_PRICE_INPUT_PER_1M = float(os.getenv("LLM_PRICE_INPUT_PER_1M", "0.05"))
+LLM_PRICE_OUTPUT_PER_1M = float(os.getenv("LLM_PRICE_OUTPUT_PER_1M", "0.40"))
+
+
+@dataclass
+class StageRecord:
+    session_id: str
+    stage: str
+    round: Optional[int] = None
+    started_at: float = field(default_factory=time.time)
+    duration_s: float = 0.0
+    llm_calls: int = 0
+    cache_hits: int = 0
+    # Plan-cache matches that were adapted by an LLM call rather than reused verbatim.
+    adapted_hits: int = 0
+    http_requests: int = 0
+    retries: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost_usd: float = 0.0
+    error: Optional[str] = None
+
+
+class SessionTrace:
+    """
+    Collects the stage records of one generation session.
+    """
+
+    def __init__(self, session_id: str) -> None:
+        self.session_id = session_id
+        self.records: List[StageRecord] = []
+        self.current: Optional[StageRecord] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str, round: Optional[int] = None) -> Iterator[StageRecord]:
+        record = StageRecord(self.session_id, name, round)
+        previous, self.current = self.current, record
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as exc:
+            record.error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            record.duration_s = round_to(time.perf_counter() - started, 3)
+            # Requests that reached the provider beyond one per uncached call were retries.
+            record.retries = max(0, record.http_requests - (record.llm_calls - record.cache_hits))
+            record.cost_usd = round_to(
+                record.prompt_tokens * LLM_PRICE_INPUT_PER_1M / 1e6
+                + record.completion_tokens * LLM_PRICE_OUTPUT_PER_1M / 1e6,
+                6,
+            )
+            self.records.append(record)
+            self.current = previous
+
+    def add(self, **counts: int) -> None:
+        record = self.current
+        if record is None:
+            return
+        with self._lock:
+            for name, value in counts.items():
+                setattr(record, name, getattr(record, name) + value)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [asdict(record) for record in self.records]
+
+    def durations(self) -> Dict[str, float]:
+        return {_stage_key(asdict(record)): record.duration_s for record in self.records}
+
+    def totals(self) -> Dict[str, Any]:
+        return {
+            "duration_s": round_to(sum(r.duration_s for r in self.records), 3),
+            "prompt_tokens": sum(r.prompt_tokens for r in self.records),
+            "completion_tokens": sum(r.completion_tokens for r in self.records),
+            "cost_usd": round_to(sum(r.cost_usd for r in self.records), 6),
+        }
+
+    def write(self, path: Path = TRACE_PATH) -> None:
+        """
+        Appends every record to the JSONL trace file.
+        """
+        if not TRACING_ENABLED or not self.records:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as handle:
+            for record in self.to_list():
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def round_to(value: float, digits: int) -> float:
+    return float(f"{value:.{digits}f}")
+
+
+_current_trace: contextvars.ContextVar[Optional[SessionTrace]] = contextvars.ContextVar("current_trace", default=None)
+
+
+def current_trace() -> Optional[SessionTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def activate(trace: Optional[SessionTrace]) -> Iterator[None]:
+    token = _current_trace.set(trace)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name: str, round: Optional[int] = None) -> Iterator[Optional[StageRecord]]:
+    """
+    Opens a record on the active trace; does nothing when no trace is active.
+    """
+    trace = current_trace()
+    if trace is None:
+        yield None
+        return
+    with trace.stage(name, round) as record:
+        yield record
+
+
+async def traced(agen: AsyncIterator[T], trace: SessionTrace) -> AsyncIterator[T]:
+    """
+    Re-yields `agen`, activating `trace` around every step.
+    """
+    try:
+        while True:
+            with activate(trace):
+                try:
+                    item = await agen.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(agen, "aclose"):
+            with activate(trace):
+                await agen.aclose()
+
+
+def record(**counts: int) -> None:
+    trace = current_trace()
+    if trace is not None:
+        trace.add(**counts)
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Counts chat model calls and token usage into the active stage record.
+    """
+
+    run_inline = True
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, **kwargs: Any) -> None:
+        record(llm_calls=1)
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+        if not (prompt_tokens or completion_tokens):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        record(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+trace_callback = TraceCallbackHandler()
+
+
+# --- CLI: p50 / p95 per stage ---
+
+def _stage_key(entry: Dict[str, Any]) -> str:
+    return entry["stage"] if entry.get("round") is None else f"{entry['stage']}.r{entry['round']}"
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(path: Path = TRACE_PATH) -> List[Dict[str, Any]]:
+    by_stage: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    with path.open(encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                entry = json.loads(line)
+                by_stage[_stage_key(entry)].append(entry)
+
+    rows = []
+    for key, entries in sorted(by_stage.items(), key=lambda item: min(e["started_at"] for e in item[1])):
+        durations = [e["duration_s"] for e in entries]
+        tokens = [e["prompt_tokens"] + e["completion_tokens"] for e in entries]
+        rows.append({
+            "stage": key,
+            "count": len(entries),
+            "p50_s": _percentile(durations, 50),
+            "p95_s": _percentile(durations, 95),
+            "p50_tokens": _percentile(tokens, 50),
+            "p95_tokens": _percentile(tokens, 95),
+            "avg_cost_usd": round_to(sum(e["cost_usd"] for e in entries) / len(entries), 6),
+            "cache_hits": sum(e["cache_hits"] for e in entries),
+            "adapted_hits": sum(e.get("adapted_hits", 0) for e in entries),
+            "retries": sum(e["retries"] for e in entries),
+            "errors": sum(1 for e in entries if e.get("error")),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    cli = argparse.ArgumentParser(description="Aggregate stage traces into p50/p95 per stage.")
+    cli.add_argument("--path", type=Path, default=TRACE_PATH)
+    args = cli.parse_args()
+
+    if not args.path.exists():
+        print(f"No traces at {args.path}")
+    else:
+        rows = summarize(args.path)
+        header = f"{'stage':<14}{'n':>5}{'p50 s':>9}{'p95 s':>9}{'p50 tok':>9}{'p95 tok':>9}{'avg $':>10}{'hits':>6}{'adapt':>6}{'retry':>6}{'err':>5}"
+        print(header)
+        print("-" * len(header))
+        for row in rows:
+            print(
+                f"{row['stage']:<14}{row['count']:>5}{row['p50_s']:>9.2f}{row['p95_s']:>9.2f}"
+                f"{row['p50_tokens']:>9}{row['p95_tokens']:>9}{row['avg_cost_usd']:>10.4f}"
+                f"{row['cache_hits']:>6}{row['adapted_hits']:>6}{row['retries']:>6}{row['errors']:>5}"
+            )
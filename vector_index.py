@@ -0,0 +1,265 @@
+"""
+Memory-mapped NumPy vector index, an alternative to querying Chroma.
+
+The corpus is fixed between builds, so the embeddings are exported once into a
+float32 matrix (`vectors.npy`, rows normalised) with the chunk texts in one
+UTF-8 blob (`texts.bin` + `offsets.npy`) and titles as ids into `titles.json`.
+Every file is memory-mapped, so worker processes share the OS page cache rather
+than each holding a copy. Rows are grouped by shelf (`meta.json` holds each
+shelf's row span), so a query routed to some shelves only scores their slices.
+Queries are one matrix-vector product per slice plus an `argpartition` top-k.
+
+Scores are squared L2 distances between unit vectors (2 - 2 * cosine), which is
+what Chroma's default space returns for normalised embeddings, so
+RAG_SCORE_THRESHOLD means the same thing on both backends.
+
+With RAG_QUANTIZATION=int8 or pq the export also stores compressed codes (see
+quantization.py); queries then scan the codes and rescore a shortlist exactly
+from `vectors.npy`, which stays on disk apart from the rows being rescored.
+
+Each export is written into a fresh `gen-*` subdirectory and published by
+atomically rewriting the `CURRENT` pointer, so a reader opening the index while
+it is rebuilt sees either the previous file set or the new one, never a mix.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Collection, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from quantization import RAG_QUANTIZATION, RAG_RESCORE_FACTOR, approximate_scores, quantize
+
+EXPORT_PAGE_SIZE = 5000
+CURRENT_POINTER = "CURRENT"
+
+
+def _replace(path: Path, write) -> None:
+    # Written under a per-process temp name, then swapped in, so concurrent
+    # exporters and readers never see a half-written file.
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as handle:
+        write(handle)
+    os.replace(tmp, path)
+
+
+def current_generation(directory: Path) -> Path:
+    """
+    The directory holding the published file set: the generation named in
+    `CURRENT`, or `directory` itself for exports made before generations.
+    """
+    directory = Path(directory)
+    try:
+        name = (directory / CURRENT_POINTER).read_text(encoding="utf-8").strip()
+    except OSError:
+        return directory
+    return directory / name
+
+
+def _publish(directory: Path, files: Dict[str, Callable[[BinaryIO], None]]) -> None:
+    """
+    Writes a complete file set into a new generation and points `CURRENT` at it.
+    The generation published just before stays for readers that resolved the old
+    pointer but have not opened its files yet; older ones and files of the
+    pre-generation layout are removed (open memory maps keep working on POSIX).
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    generation = directory / f"gen-{time.time_ns()}-{os.getpid()}"
+    generation.mkdir()
+    for name, write in files.items():
+        with open(generation / name, "wb") as handle:
+            write(handle)
+    _replace(directory / CURRENT_POINTER, lambda handle: handle.write(generation.name.encode("utf-8")))
+    # Names sort by creation time; newer, still unpublished generations of a concurrent exporter are left alone.
+    older = sorted(path for path in directory.glob("gen-*") if path.is_dir() and path.name < generation.name)
+    for stale in older[:-1]:
+        shutil.rmtree(stale, ignore_errors=True)
+    for path in directory.iterdir():
+        if path.is_file() and path.name != CURRENT_POINTER and not path.name.startswith("."):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+
+def export_numpy_index(collection: Any, directory: Path, quantization: str = RAG_QUANTIZATION) -> int:
+    """
+    Dumps a Chroma collection's embeddings, texts and titles into `directory`,
+    plus `quantization` codes for the embeddings. Returns the number of chunks exported.
+    """
+    vectors: List[np.ndarray] = []
+    texts: List[bytes] = []
+    ids: List[str] = []
+    titles: List[str] = []
+    title_ids: List[int] = []
+    title_index: dict = {}
+    shelves: List[str] = []
+    total = collection.count()
+    for offset in range(0, total, EXPORT_PAGE_SIZE):
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=EXPORT_PAGE_SIZE, offset=offset)
+        vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+        ids.extend(page["ids"])
+        for document, metadata in zip(page["documents"], page["metadatas"]):
+            title = (metadata or {}).get("title", "")
+            shelves.append((metadata or {}).get("shelf", ""))
+            if title not in title_index:
+                title_index[title] = len(titles)
+                titles.append(title)
+            title_ids.append(title_index[title])
+            texts.append((document or "").encode("utf-8"))
+
+    matrix = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+    # Rows are grouped by shelf so a shelf-routed query scans only its slices.
+    order = sorted(range(len(texts)), key=lambda row: shelves[row])
+    matrix = matrix[order] if len(order) else matrix
+    texts = [texts[row] for row in order]
+    ids = [ids[row] for row in order]
+    title_ids = [title_ids[row] for row in order]
+    partitions: Dict[str, List[int]] = {}
+    for position, row in enumerate(order):
+        partitions.setdefault(shelves[row], [position, position])[1] = position + 1
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True) if len(matrix) else None
+    if norms is not None:
+        matrix /= np.where(norms == 0, 1.0, norms)
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    try:
+        codes = quantize(matrix, quantization) if len(matrix) else {}
+    except ValueError as e:
+        if quantization != "pq":
+            raise
+        print(f"⚠️  PQ unavailable ({e}); storing int8 codes instead.")
+        codes = quantize(matrix, "int8")
+
+    meta = {
+        "count": len(texts),
+        "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0,
+        "partitions": partitions,
+        "quantization": quantization,
+        "codes": sorted(codes),
+    }
+    files = {
+        "vectors.npy": lambda handle: np.save(handle, matrix),
+        "offsets.npy": lambda handle: np.save(handle, offsets),
+        "title_ids.npy": lambda handle: np.save(handle, np.asarray(title_ids, dtype=np.int32)),
+        "texts.bin": lambda handle: handle.write(b"".join(texts)),
+        "ids.json": lambda handle: handle.write(json.dumps(ids).encode("utf-8")),
+        "titles.json": lambda handle: handle.write(json.dumps(titles, ensure_ascii=False).encode("utf-8")),
+        **{f"{name}.npy": (lambda handle, array=array: np.save(handle, array)) for name, array in codes.items()},
+        "meta.json": lambda handle: handle.write(json.dumps(meta).encode("utf-8")),
+    }
+    _publish(directory, files)
+    return len(texts)
+
+
+def has_numpy_index(directory: Path, quantization: str = RAG_QUANTIZATION) -> bool:
+    # Exports from before chunk ids and shelf partitions were included, or made
+    # with another RAG_QUANTIZATION, are treated as missing and redone.
+    generation = current_generation(directory)
+    try:
+        meta = json.loads((generation / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return (
+        "partitions" in meta
+        and meta.get("quantization", "none") == quantization
+        and (generation / "ids.json").exists()
+    )
+
+
+class NumpyVectorIndex:
+    """
+    Read-only, memory-mapped index answering the same similarity query the
+    pipeline makes against Chroma.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = current_generation(directory)
+        meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+        self.vectors = np.load(self.directory / "vectors.npy", mmap_mode="r")
+        self.offsets = np.load(self.directory / "offsets.npy", mmap_mode="r")
+        self.title_ids = np.load(self.directory / "title_ids.npy", mmap_mode="r")
+        self.texts = np.memmap(self.directory / "texts.bin", dtype=np.uint8, mode="r") if meta["count"] else np.zeros(0, np.uint8)
+        self.titles: List[str] = json.loads((self.directory / "titles.json").read_text(encoding="utf-8"))
+        self.ids: List[str] = json.loads((self.directory / "ids.json").read_text(encoding="utf-8"))
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.partitions: Dict[str, Tuple[int, int]] = {shelf: tuple(span) for shelf, span in meta.get("partitions", {}).items()}
+        self.codes: Dict[str, np.ndarray] = {name: np.load(self.directory / f"{name}.npy", mmap_mode="r") for name in meta.get("codes", [])}
+        if not (len(self.vectors) == len(self.title_ids) == len(self.offsets) - 1 == len(self.ids) == meta["count"]):
+            raise ValueError(f"NumPy index at '{self.directory}' is inconsistent; rebuild it with build_rag_db.py")
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def document(self, row: int) -> Document:
+        text = bytes(self.texts[self.offsets[row]:self.offsets[row + 1]]).decode("utf-8")
+        return Document(id=self.ids[row], page_content=text, metadata={"title": self.titles[self.title_ids[row]]})
+
+    def _top(self, embedding: List[float], k: int, shelves: Optional[Collection[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rows of the k most similar chunks, closest first, and their distances.
+        With `shelves`, only those partitions are scored.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        if shelves is None:
+            spans = [(0, len(self.vectors))] if len(self.vectors) else []
+        else:
+            spans = [self.partitions[shelf] for shelf in shelves if shelf in self.partitions]
+        rows = np.concatenate([np.arange(start, end) for start, end in spans]) if spans else np.zeros(0, dtype=np.int64)
+        if self.codes and len(rows):
+            # Stage one: approximate scores from the codes pick a shortlist;
+            # stage two rescores just those rows with the float32 vectors.
+            approximate = np.concatenate([approximate_scores(self.codes, query, start, end) for start, end in spans])
+            shortlist = min(len(rows), max(k, k * RAG_RESCORE_FACTOR))
+            rows = np.sort(rows[np.argpartition(-approximate, shortlist - 1)[:shortlist]])
+            similarities = np.asarray(self.vectors[rows]) @ query
+        elif len(rows):
+            similarities = np.concatenate([self.vectors[start:end] @ query for start, end in spans])
+        else:
+            similarities = np.zeros(0, dtype=np.float32)
+        k = min(k, len(similarities))
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return rows[top], 2.0 - 2.0 * similarities[top]
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: List[float], k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        """
+        Top-k rows by cosine similarity as (Document, distance) pairs, closest first.
+        """
+        rows, distances = self._top(embedding, k)
+        return [(self.document(int(row)), float(distance)) for row, distance in zip(rows, distances)]
+
+    def search_with_vectors(
+        self, embedding: List[float], k: int, shelves: Optional[Collection[str]] = None
+    ) -> Tuple[List[Document], np.ndarray, np.ndarray]:
+        """
+        Top-k documents, distances and embedding rows, closest first, for reranking.
+        """
+        rows, distances = self._top(embedding, k, shelves)
+        return [self.document(int(row)) for row in rows], distances, np.asarray(self.vectors[rows])
+
+    def fetch(self, ids: List[str]) -> Tuple[List[Document], np.ndarray]:
+        """
+        Documents and embedding rows for chunk ids; unknown ids are skipped.
+        """
+        rows = [self._rows[chunk_id] for chunk_id in ids if chunk_id in self._rows]
+        return [self.document(row) for row in rows], np.asarray(self.vectors[rows])
+
+    def warm(self) -> None:
+        """
+        Touches every page of the scanned arrays (the codes when quantized, else
+        the vectors) so the first query does not fault them in.
+        """
+        for array in (self.codes.values() if self.codes else [self.vectors]):
+            if len(array):
+                float(np.asarray(array).sum(dtype=np.float64))